@@ -1,41 +1,148 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, Blueprint, Response, current_app, g, session, stream_with_context, has_app_context, has_request_context, render_template, request, redirect, url_for, flash, jsonify, get_template_attribute, abort
+from markupsafe import Markup
+from sqlalchemy import func, select, text, update
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.pool import NullPool
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from datetime import datetime, timezone
+from werkzeug.middleware.proxy_fix import ProxyFix
+from datetime import date, datetime, timezone
 import pytz
 import os
-import uuid
+import csv
+import json
+import time
+import click
+import hmac
+import subprocess
+import sys
 from datetime import datetime
 import pytz
 import os
+from utils import analytics, assets, bulk, changes, compression, conditional, counters, datatables, documents, file_serving, fragments, identity_cache, images, jobs, metrics, migrations, query_plans, replica, search, storage, valuation
 
-# Configuración de zona horaria para Colombia
-CO_TZ = pytz.timezone('America/Bogota')
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///soundlab.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
 
-# Configuración para subida de archivos
-app.config['UPLOAD_FOLDER'] = os.path.join(app.static_folder, 'uploads')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+# Rutas y comandos de la aplicación; create_app() los registra
+bp = Blueprint('main', __name__, cli_group=None)
 
-# Crear directorio instance si no existe
-if not os.path.exists('instance'):
-    os.makedirs('instance')
+# ========== APLICACIÓN ==========
 
-# Crear directorio uploads si no existe
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
+def create_app(config=None):
+    """Construir la aplicación sin tocar la base de datos.
 
-db = SQLAlchemy(app)
-login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+    La inicialización de una sola vez (migraciones y usuario administrador) es
+    `flask init-db`; así los workers de gunicorn arrancan sin trabajo extra y
+    sin abrir conexiones antes del fork. ``config`` reemplaza valores por
+    defecto (p. ej. la base de datos en pruebas).
+    """
+    started = time.perf_counter()
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-change-in-production')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///soundlab.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    
+    # Configuración para subida de archivos
+    app.config['UPLOAD_FOLDER'] = os.path.join(app.static_folder, 'uploads')
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    
+    # Entrega de fotos: None (Flask), 'x-sendfile' (Apache/lighttpd) o 'x-accel' (nginx)
+    app.config['UPLOADS_SENDFILE'] = os.environ.get('UPLOADS_SENDFILE') or None
+    app.config['UPLOADS_ACCEL_PREFIX'] = '/_uploads/'  # location internal de nginx con alias a static/uploads
+    app.config['UPLOADS_MAX_AGE'] = 3600  # fotos anteriores al almacenamiento por contenido
+    
+    # Copias de seguridad automáticas antes de aplicar migraciones
+    app.config['DB_BACKUP_FOLDER'] = os.path.join(app.instance_path, 'backups')
+    
+    # Órdenes de servicio ya renderizadas (HTML de impresión y PDF)
+    app.config['PRINT_CACHE_FOLDER'] = os.path.join(app.instance_path, 'print_cache')
+    
+    # Trabajos en segundo plano: con JOBS_INLINE=1 el propio servidor web los ejecuta
+    # después de enviar cada respuesta; en producción use JOBS_INLINE=0 y `flask jobs-worker`
+    app.config['JOBS_INLINE'] = os.environ.get('JOBS_INLINE', '1') == '1'
+    app.config['JOBS_VISIBILITY_TIMEOUT'] = 5 * 60  # segundos antes de reintentar un trabajo abandonado
+    # En modo inline, cada cuánto un proceso toma también reintentos vencidos y trabajos encolados
+    # fuera de una petición (CLI, otros trabajos), y cuántos como máximo por pasada
+    app.config['JOBS_INLINE_SWEEP_SECONDS'] = 30
+    app.config['JOBS_INLINE_SWEEP_LIMIT'] = 5
+    
+    # Cada cuánto se recalculan los contadores del dashboard desde las tablas reales
+    app.config['COUNTERS_RECONCILE_SECONDS'] = 15 * 60
+    
+    # Métricas en /metrics: con METRICS_TOKEN exigen "Authorization: Bearer <token>"; sin él,
+    # solo peticiones directas (no reenviadas por un proxy) desde estas IPs
+    app.config['METRICS_ALLOW'] = ('127.0.0.1', '::1')
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN') or None
+    # Detrás de nginx: cuántos proxies agregan X-Forwarded-For (remote_addr pasa a ser el cliente real)
+    app.config['PROXY_FIX_HOPS'] = int(os.environ.get('PROXY_FIX_HOPS', '0'))
+    # En pruebas: fallar cualquier petición que ejecute más consultas SQL que esto (detecta N+1)
+    app.config['QUERY_BUDGET'] = None
+    app.config['SLOW_REQUEST_MS'] = float(os.environ['SLOW_REQUEST_MS']) if os.environ.get('SLOW_REQUEST_MS') else None
+    
+    # Caché de fragmentos HTML de las listas: 'memory' (por proceso), 'file' (compartida) o vacío
+    app.config['FRAGMENT_CACHE'] = os.environ.get('FRAGMENT_CACHE', 'memory') or None
+    app.config['FRAGMENT_CACHE_MAX_BYTES'] = 64 * 1024 * 1024
+    app.config['FRAGMENT_CACHE_FOLDER'] = os.path.join(app.instance_path, 'fragment_cache')
+    
+    # Parte de los ETag de las vistas de detalle: cambia en cada despliegue (plantillas nuevas)
+    app.config['ETAG_SALT'] = os.environ.get('ETAG_SALT') or os.urandom(8).hex()
+    
+    # Compresión de HTML y JSON (desactivar si el proxy ya comprime)
+    app.config['COMPRESS_RESPONSES'] = os.environ.get('COMPRESS_RESPONSES', '1') == '1'
+    app.config['COMPRESS_MIN_BYTES'] = 1024
+    app.config['COMPRESS_MIMETYPES'] = ('text/html', 'application/json')
+    
+    # Pantallas en vivo (SSE): cada conexión abierta ocupa un hilo del servidor
+    app.config['CHANGES_POLL_SECONDS'] = 1.0
+    app.config['CHANGES_RETENTION_SECONDS'] = 24 * 3600
+    app.config['STREAM_MAX_CLIENTS'] = int(os.environ.get('STREAM_MAX_CLIENTS', '2'))  # por proceso
+    app.config['STREAM_MAX_SECONDS'] = 5 * 60  # luego el navegador se reconecta solo
+    app.config['STREAM_KEEPALIVE_SECONDS'] = 15
+    
+    # Usuarios de la sesión en memoria de cada proceso (los otros procesos ven los cambios al vencer)
+    app.config['IDENTITY_CACHE_TTL'] = float(os.environ.get('IDENTITY_CACHE_TTL', '60'))  # segundos
+    app.config['IDENTITY_CACHE_MAX_ENTRIES'] = 2000
+    
+    # Reportes pesados sobre una copia de solo lectura de la base (ver utils/replica.py)
+    app.config['REPORTS_REPLICA'] = os.environ.get('REPORTS_REPLICA', '0') == '1'
+    app.config['REPORTS_REPLICA_PATH'] = os.path.join(app.instance_path, 'reports.db')
+    app.config['REPORTS_REPLICA_MAX_AGE'] = int(os.environ.get('REPORTS_REPLICA_MAX_AGE', '300'))  # segundos
+    
+    app.config.update(config or {})
+    if app.config['REPORTS_REPLICA']:
+        # Sin pool: cada conexión abre la copia más reciente
+        app.config['SQLALCHEMY_BINDS'] = {**app.config.get('SQLALCHEMY_BINDS', {}), 'reports': {
+            'url': replica.url(app.config['REPORTS_REPLICA_PATH']), 'poolclass': NullPool}}
+    
+    # Crear directorios instance y uploads si no existen
+    os.makedirs(app.instance_path, exist_ok=True)
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    
+    if app.config['PROXY_FIX_HOPS']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_HOPS'])
+    
+    db.init_app(app)
+    login_manager.init_app(app)
+    # Nombres con huella de static/dist (flask assets-build); vacío si no se ha construido
+    app.extensions['asset_manifest'] = assets.load_manifest(app.static_folder)
+    app.extensions['fragment_cache'] = fragments.FragmentCache(fragments.create_backend(
+        app.config['FRAGMENT_CACHE'], app.config['FRAGMENT_CACHE_MAX_BYTES'], app.config['FRAGMENT_CACHE_FOLDER']))
+    app.extensions['inline_jobs'] = {'next_sweep': 0.0}
+    app.extensions['identity_cache'] = identity_cache.IdentityCache(
+        app.config['IDENTITY_CACHE_MAX_ENTRIES'], app.config['IDENTITY_CACHE_TTL'])
+    app.extensions['change_broker'] = changes.Broker(
+        connect=lambda: database_connection(app),
+        interval=app.config['CHANGES_POLL_SECONDS'],
+        retention=app.config['CHANGES_RETENTION_SECONDS'])
+    app.register_blueprint(bp)
+    
+    app.config['STARTUP_SECONDS'] = time.perf_counter() - started
+    app.logger.info("Aplicación creada en %.1f ms", app.config['STARTUP_SECONDS'] * 1000)
+    return app
 
 # Función auxiliar para verificar extensiones de archivos permitidas
 def allowed_file(filename):
@@ -43,127 +150,184 @@ def allowed_file(filename):
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 # Función auxiliar para guardar archivos de evidencia
-def save_evidence_file(file, service_id):
-    if file and allowed_file(file.filename):
-        # Generar nombre único para el archivo
-        file_extension = file.filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"service_{service_id}_{uuid.uuid4().hex}.{file_extension}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(file_path)
-        return unique_filename
-    return None
+def save_evidence_file(file):
+    """Guarda la foto direccionada por su hash y devuelve su StoredFile.
+
+    Si los mismos bytes ya se habían subido se reutiliza el archivo existente
+    (con sus variantes) en lugar de guardar una copia. Las fotos nuevas quedan
+    en pending/ y se procesan en segundo plano (evidence.process_image).
+    """
+    if not (file and allowed_file(file.filename)):
+        return None
+    file_extension = file.filename.rsplit('.', 1)[1].lower()
+    temp_path, digest, size = storage.stream_to_temp(file.stream, current_app.config['UPLOAD_FOLDER'])
+    metrics.record_upload(size)
+    stored = StoredFile.query.filter_by(sha256=digest).first()
+    if stored:
+        os.remove(temp_path)
+        return stored
+    try:
+        images.verify(temp_path)
+    except images.InvalidImage:
+        os.remove(temp_path)
+        return None
+    name = storage.pending_name(digest, file_extension)
+    storage.place_object(temp_path, current_app.config['UPLOAD_FOLDER'], name)
+    stored = StoredFile(sha256=digest, filename=name, size=size)
+    db.session.add(stored)
+    db.session.flush()
+    enqueue_job('evidence.process_image', stored_file_id=stored.id)
+    return stored
 
 # ========== MODELOS ==========
 
-class User(UserMixin, db.Model):
-    """Modelo de usuarios del sistema"""
-    __tablename__ = 'users'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(255), nullable=False)
-    role = db.Column(db.String(20), default='technician')  # admin, technician
-    is_active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ))
-    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ), onupdate=lambda: datetime.now(CO_TZ))
-
-class Customer(db.Model):
-    """Modelo de clientes"""
-    __tablename__ = 'customers'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(200), nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=True)
-    phone = db.Column(db.String(20), nullable=True)
-    address = db.Column(db.Text, nullable=True)
-    notes = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ))
-    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ), onupdate=lambda: datetime.now(CO_TZ))
-
-class Equipment(db.Model):
-    """Modelo de equipos de DJ"""
-    __tablename__ = 'equipment'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
-    name = db.Column(db.String(200), nullable=False)
-    brand = db.Column(db.String(100), nullable=True)
-    model = db.Column(db.String(100), nullable=True)
-    serial_number = db.Column(db.String(100), nullable=True)
-    category = db.Column(db.String(50), nullable=False)  # consola, controlador, luces, sonido, humo, otros
-    description = db.Column(db.Text, nullable=True)
-    purchase_date = db.Column(db.Date, nullable=True)
-    created_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ))
-    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ), onupdate=lambda: datetime.now(CO_TZ))
-
-class ServiceEvidence(db.Model):
-    """Modelo para evidencias fotográficas de servicios"""
-    __tablename__ = 'service_evidences'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
-    filename = db.Column(db.String(255), nullable=False)
-    evidence_type = db.Column(db.String(50), nullable=False)  # recepcion, proceso, entrega
-    description = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ))
-
-class Service(db.Model):
-    """Modelo de servicios de mantenimiento y reparación"""
-    __tablename__ = 'services'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
-    equipment_id = db.Column(db.Integer, db.ForeignKey('equipment.id'), nullable=True)  # Optional, can be manual entry
-    technician_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    service_type = db.Column(db.String(50), nullable=False)  # mantenimiento, reparacion, revision
-    description = db.Column(db.Text, nullable=False)
-    status = db.Column(db.String(20), default='Recibido')  # Recibido, En proceso, Completado, Entregado
-    
-    # Equipment fields for manual entry (when equipment_id is null)
-    equipment_type = db.Column(db.String(100), nullable=True)
-    equipment_name = db.Column(db.String(200), nullable=True)
-    equipment_brand = db.Column(db.String(100), nullable=True)
-    equipment_model = db.Column(db.String(100), nullable=True)
-    equipment_serial = db.Column(db.String(100), nullable=True)
-    equipment_color = db.Column(db.String(50), nullable=True)
-    equipment_accessories = db.Column(db.Text, nullable=True)
-    equipment_condition = db.Column(db.Text, nullable=True)
-    estimated_cost = db.Column(db.Float, default=0.0)
-    estimated_days = db.Column(db.Integer, default=3)
-    final_cost = db.Column(db.Float, nullable=True)
-    diagnosis = db.Column(db.Text, nullable=True)
-    work_performed = db.Column(db.Text, nullable=True)
-    parts_used = db.Column(db.Text, nullable=True)  # JSON string con partes utilizadas
-    start_date = db.Column(db.DateTime, nullable=True)
-    completion_date = db.Column(db.DateTime, nullable=True)
-    delivery_date = db.Column(db.DateTime, nullable=True)
-    created_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ))
-    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ), onupdate=lambda: datetime.now(CO_TZ))
-    
-    # Relationships
-    evidences = db.relationship('ServiceEvidence', backref='service', lazy=True, cascade='all, delete-orphan')
-
-class Inventory(db.Model):
-    """Modelo de inventario de repuestos y accesorios"""
-    __tablename__ = 'inventory'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(200), nullable=False)
-    description = db.Column(db.Text, nullable=True)
-    category = db.Column(db.String(50), nullable=False)  # repuestos, cables, conectores, accesorios, herramientas
-    brand = db.Column(db.String(100), nullable=True)
-    model = db.Column(db.String(100), nullable=True)
-    stock = db.Column(db.Integer, default=0)
-    min_stock = db.Column(db.Integer, default=5)
-    price = db.Column(db.Float, default=0.0)
-    supplier = db.Column(db.String(200), nullable=True)
-    location = db.Column(db.String(100), nullable=True)  # ubicación en el taller
-    created_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ))
-    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ), onupdate=lambda: datetime.now(CO_TZ))
+from models.models import (CO_TZ, db, Customer, Equipment, Inventory, InventoryMovement,
+                           Service, ServiceEvidence, StoredFile, User)
+
+# Cliente, equipo y técnico de un servicio en la misma consulta; las evidencias en una más
+SERVICE_DETAIL_OPTIONS = (
+    joinedload(Service.customer),
+    joinedload(Service.equipment),
+    joinedload(Service.technician),
+    selectinload(Service.evidences),
+)
+
+# Para listas: una consulta por relación para toda la página (IN sobre las llaves primarias)
+SERVICE_LIST_OPTIONS = (
+    selectinload(Service.customer),
+    selectinload(Service.equipment),
+    selectinload(Service.technician),
+)
+
+def get_service_or_404(service_id):
+    """Servicio con todo lo que muestran sus vistas, en un número fijo de consultas"""
+    return Service.query.options(*SERVICE_DETAIL_OPTIONS).filter_by(id=service_id).first_or_404()
+
+# ========== PETICIONES CONDICIONALES ==========
+
+def service_validators(service_id):
+    """updated_at del servicio, su cliente, equipo y técnico, y el estado de sus evidencias"""
+    return db.session.execute(
+        select(Service.updated_at, Customer.updated_at, Equipment.updated_at, User.updated_at,
+               func.count(ServiceEvidence.id), func.max(ServiceEvidence.id), func.count(ServiceEvidence.variants))
+        .select_from(Service)
+        .outerjoin(Customer, Customer.id == Service.customer_id)
+        .outerjoin(Equipment, Equipment.id == Service.equipment_id)
+        .outerjoin(User, User.id == Service.technician_id)
+        .outerjoin(ServiceEvidence, ServiceEvidence.service_id == Service.id)
+        .where(Service.id == service_id)
+        .group_by(Service.id)
+    ).first()
+
+def customer_validators(customer_id):
+    """updated_at del cliente, de sus servicios y de los técnicos asignados"""
+    return db.session.execute(
+        select(Customer.updated_at, func.count(Service.id), func.max(Service.updated_at), func.max(User.updated_at))
+        .select_from(Customer)
+        .outerjoin(Service, Service.customer_id == Customer.id)
+        .outerjoin(User, User.id == Service.technician_id)
+        .where(Customer.id == customer_id)
+        .group_by(Customer.id)
+    ).first()
+
+def inventory_validators(item_id):
+    """updated_at del item y sus movimientos (solo se agregan) con quién los registró"""
+    return db.session.execute(
+        select(Inventory.updated_at, func.count(InventoryMovement.id), func.max(InventoryMovement.id),
+               func.max(User.updated_at))
+        .select_from(Inventory)
+        .outerjoin(InventoryMovement, InventoryMovement.inventory_id == Inventory.id)
+        .outerjoin(User, User.id == InventoryMovement.created_by)
+        .where(Inventory.id == item_id)
+        .group_by(Inventory.id)
+    ).first()
+
+def conditional_view(validators, render):
+    """304 si el navegador ya tiene esta versión de la vista; si no, ``render()``.
+
+    ``validators`` es la fila de ``*_validators`` (``None`` si el registro no
+    existe). El usuario actual también entra en el ETag porque el menú muestra
+    su nombre; con mensajes flash pendientes siempre se renderiza.
+    """
+    if validators is None:
+        abort(404)
+    etag = conditional.make_etag(current_app.config['ETAG_SALT'], current_user.id,
+                                 current_user.updated_at, tuple(validators))
+    modified = conditional.last_modified(
+        [value for value in validators if isinstance(value, datetime)] + [current_user.updated_at], CO_TZ)
+    return conditional.respond(etag, modified, render, revalidate_only='_flashes' in session)
+
+# Índice de búsqueda de texto completo sincronizado con los modelos
+search.register_hooks({
+    'customer': Customer,
+    'equipment': Equipment,
+    'service': Service,
+    'inventory': Inventory,
+})
+
+# Contadores materializados del dashboard, actualizados en cada flush
+counters.register_hooks(db.session, {
+    'customer': Customer,
+    'equipment': Equipment,
+    'service': Service,
+    'inventory': Inventory,
+})
+
+# Contador de referencias de los archivos de evidencia y borrado de huérfanos
+storage.register_hooks(
+    db.session, ServiceEvidence,
+    root_getter=lambda: current_app.config['UPLOAD_FOLDER'],
+    variant_names=lambda variants: images.variant_filenames(json.loads(variants) if variants else {}),
+)
+
+def today():
+    """Fecha actual en la zona horaria del taller"""
+    return datetime.now(CO_TZ).date()
+
+# Valoración diaria del inventario por categoría, proveedor y ubicación
+valuation.register_hooks(db.session, Inventory, today=today)
+
+# Versiones por tabla de la caché de fragmentos HTML de las listas
+fragments.register_hooks(db.session, [Customer, Equipment, Service, Inventory])
+
+# Hechos de servicios cerrados para la analítica (tiempos, cumplimiento, ingresos)
+analytics.register_hooks(db.session, Service)
+
+# Eventos de cambios para las pantallas en vivo (tablero de servicios, inventario)
+changes.register_hooks(db.session, {
+    'service': (Service, lambda service: {'status': service.status,
+                                          'previous_status': changes.previous(service, 'status')}),
+    'inventory': (Inventory, lambda item: {'stock': item.stock, 'min_stock': item.min_stock}),
+})
+
+def read_counters():
+    """Contadores materializados, reconciliándolos si ya pasó el intervalo configurado"""
+    connection = db.session.connection()
+    values = counters.read_all(connection)
+    reconciled = counters.reconcile_if_stale(connection, values, current_app.config['COUNTERS_RECONCILE_SECONDS'])
+    if reconciled is not None:
+        db.session.commit()
+        values = reconciled
+    return values
+
+@bp.cli.command('counters-reconcile')
+def counters_reconcile_command():
+    """Recalcular los contadores del dashboard desde las tablas reales"""
+    values = counters.reconcile(db.session.connection())
+    db.session.commit()
+    for key, value in sorted(values.items()):
+        print(f"{key}: {value}")
+
+@bp.cli.command('valuation-reconcile')
+def valuation_reconcile_command():
+    """Corregir la valoración de hoy desde el inventario real"""
+    valuation.reconcile(db.session.connection(), today())
+    db.session.commit()
+    for key, stock, value in valuation.as_of(db.session.connection(), 'category', today()):
+        print(f"{key or '(sin categoría)'}: {stock} unidades, ${value:,.2f}")
 
 # Helper para fechas en templates
-@app.template_global()
+@bp.app_template_global()
 def moment():
     class MomentHelper:
         def year(self):
@@ -174,31 +338,115 @@ def moment():
     
     return MomentHelper()
 
+# Entradas de la caché de identidad que dependen de cada modelo
+identity_cache.register_hooks(
+    db.session,
+    cache_getter=lambda: current_app.extensions.get('identity_cache') if has_app_context() else None,
+    keys_for={User: lambda user: [('users', user.id)]},
+)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    """Usuario de la sesión desde la caché de identidad (sin consultar la base si está vigente)"""
+    def load():
+        user = db.session.get(User, int(user_id))
+        return identity_cache.snapshot(user) if user is not None else None
+    values = current_app.extensions['identity_cache'].get_or_load(('users', int(user_id)), load)
+    return identity_cache.restore(db.session, User, values) if values is not None else None
+
+# ========== MÉTRICAS ==========
+
+# Latencia, SQL y render de plantillas por petición
+metrics.register_hooks()
+
+@bp.before_app_request
+def start_request_metrics():
+    metrics.start_request(capture_sql=current_app.config['SLOW_REQUEST_MS'] is not None)
+
+@bp.after_app_request
+def finish_request_metrics(response):
+    statements = metrics.sql_count()
+    metrics.finish_request(request.endpoint, request.method, response.status_code,
+                           path=request.full_path.rstrip('?'), slow_ms=current_app.config['SLOW_REQUEST_MS'])
+    budget = current_app.config['QUERY_BUDGET']
+    if budget is not None and statements > budget:
+        raise metrics.QueryBudgetExceeded(
+            f'{request.method} {request.path} ejecutó {statements} consultas (presupuesto: {budget})')
+    return response
+
+PROXY_HEADERS = ('X-Forwarded-For', 'X-Real-IP', 'Forwarded')
+
+def metrics_allowed():
+    """Token de METRICS_TOKEN si está configurado; si no, una IP local que no llega por un proxy"""
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        scheme, _, given = request.headers.get('Authorization', '').partition(' ')
+        return scheme.lower() == 'bearer' and hmac.compare_digest(given.encode(), token.encode())
+    if request.remote_addr not in current_app.config['METRICS_ALLOW']:
+        return False
+    # Sin ProxyFix, todo lo que reenvía nginx llega desde 127.0.0.1
+    return bool(current_app.config['PROXY_FIX_HOPS']) or not any(header in request.headers for header in PROXY_HEADERS)
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Métricas del proceso en formato de texto de Prometheus"""
+    if not metrics_allowed():
+        abort(404)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# ========== RECURSOS ESTÁTICOS Y COMPRESIÓN ==========
+
+@bp.app_template_global()
+def asset_url(filename):
+    """URL con huella de un archivo de static/ si está en el manifiesto; si no, la de /static"""
+    built = current_app.extensions['asset_manifest'].get(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('main.asset', filename=built)
+
+@bp.route('/assets/<path:filename>')
+def asset(filename):
+    """CSS y JS con huella: inmutables y precomprimidos (gzip/Brotli)"""
+    return assets.send_asset(current_app.static_folder, filename)
+
+@bp.after_app_request
+def compress_response(response):
+    """Comprimir HTML y JSON por encima de COMPRESS_MIN_BYTES"""
+    if not current_app.config['COMPRESS_RESPONSES']:
+        return response
+    return compression.compress_response(response, request.accept_encodings,
+                                         current_app.config['COMPRESS_MIN_BYTES'],
+                                         current_app.config['COMPRESS_MIMETYPES'])
+
+@bp.cli.command('assets-build')
+def assets_build_command():
+    """Generar static/dist: CSS y JS con huella de contenido, .gz y .br"""
+    manifest = assets.build(current_app.static_folder)
+    for source, built in sorted(manifest.items()):
+        print(f"{source} -> {built}")
+    if assets.brotli is None:
+        print("Brotli no está instalado: solo se generaron versiones .gz")
 
 # ========== RUTAS PRINCIPALES ==========
 
-@app.route('/')
+@bp.route('/')
 @login_required
 def dashboard():
     """Dashboard principal con estadísticas"""
-    # Estadísticas básicas
-    total_customers = Customer.query.count()
-    total_equipment = Equipment.query.count()
-    active_services = Service.query.filter_by(status='En proceso').count()
-    low_stock_items = Inventory.query.filter(Inventory.stock <= Inventory.min_stock).count()
+    # Estadísticas básicas desde los contadores materializados (una sola lectura)
+    stats = read_counters()
+    status_counts = counters.by_prefix(stats, 'services.status.')
     
     return render_template('dashboard.html', 
-                         total_customers=total_customers,
-                         total_equipment=total_equipment,
-                         active_services=active_services,
-                         low_stock_items=low_stock_items)
+                         total_customers=stats.get('customers', 0),
+                         total_equipment=stats.get('equipment', 0),
+                         active_services=status_counts.get('En proceso', 0),
+                         low_stock_items=stats.get('inventory.low_stock', 0),
+                         status_counts=status_counts)
 
 # ========== AUTENTICACIÓN ==========
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     """Login de usuarios"""
     if request.method == 'POST':
@@ -209,21 +457,21 @@ def login():
         if user and check_password_hash(user.password_hash, password):
             login_user(user)
             flash('Inicio de sesión exitoso', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         else:
             flash('Usuario o contraseña incorrectos', 'danger')
     
     return render_template('auth/login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     """Logout de usuarios"""
     logout_user()
     flash('Sesión cerrada exitosamente', 'info')
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
-@app.route('/profile', methods=['GET', 'POST'])
+@bp.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
     """Perfil del usuario"""
@@ -235,17 +483,17 @@ def profile():
         # Verificar contraseña actual
         if not check_password_hash(current_user.password_hash, current_password):
             flash('La contraseña actual es incorrecta', 'danger')
-            return redirect(url_for('profile'))
+            return redirect(url_for('main.profile'))
         
         # Verificar que las nuevas contraseñas coincidan
         if new_password != confirm_password:
             flash('Las nuevas contraseñas no coinciden', 'danger')
-            return redirect(url_for('profile'))
+            return redirect(url_for('main.profile'))
         
         # Verificar longitud mínima
         if len(new_password) < 6:
             flash('La nueva contraseña debe tener al menos 6 caracteres', 'danger')
-            return redirect(url_for('profile'))
+            return redirect(url_for('main.profile'))
         
         # Actualizar contraseña
         try:
@@ -257,18 +505,17 @@ def profile():
             db.session.rollback()
             flash('Error al actualizar la contraseña', 'danger')
         
-        return redirect(url_for('profile'))
-    
-    # Estadísticas del usuario
-    services_count = Service.query.filter_by(technician_id=current_user.id).count()
-    active_services_count = Service.query.filter_by(
-        technician_id=current_user.id, 
-        status='En proceso'
-    ).count()
-    completed_services_count = Service.query.filter_by(
-        technician_id=current_user.id, 
-        status='Completado'
-    ).count()
+        return redirect(url_for('main.profile'))
+    
+    # Estadísticas del usuario: una consulta agrupada sobre ix_services_technician_status
+    by_status = dict(db.session.execute(
+        select(Service.status, func.count()).where(Service.technician_id == current_user.id)
+        .group_by(Service.status)).all())
+    services_count = sum(by_status.values())
+    active_services_count = by_status.get('En proceso', 0)
+    completed_services_count = by_status.get('Completado', 0)
+    connection, _ = report_connection()
+    month = analytics_summaries(connection, analytics.recent_periods(today(), 1))[0]
     
     # Días desde el registro
     user_created_at = current_user.created_at
@@ -281,30 +528,126 @@ def profile():
                          services_count=services_count,
                          active_services_count=active_services_count,
                          completed_services_count=completed_services_count,
-                         days_since_registration=days_since_registration)
+                         days_since_registration=days_since_registration,
+                         month_stats=analytics.technician_summary(month, current_user.id))
+
+# ========== CACHÉ DE FRAGMENTOS ==========
+
+def cached_rows(model, template_name, depends_on=(), options=()):
+    """Filas HTML (<tr>) de una lista completa, desde la caché de fragmentos.
+
+    Si ninguna de las tablas cambió desde el último render se devuelve el
+    fragmento guardado; si no, solo se cargan y renderizan (con la macro
+    ``row`` de ``template_name``) las filas cuyo ``updated_at`` cambió.
+    ``depends_on`` son las otras tablas que se muestran en cada fila.
+    """
+    cache = current_app.extensions['fragment_cache']
+    connection = db.session.connection()
+    table = model.__tablename__
+    tag = fragments.version_tag(connection, [table, *depends_on])
+
+    def render_all():
+        row = get_template_attribute(template_name, 'row')
+        stamps = db.session.execute(select(model.id, model.updated_at).order_by(model.id)).all()
+        return cache.render_rows(
+            table, stamps,
+            load=lambda ids: {obj.id: obj for obj in model.query.options(*options).filter(model.id.in_(ids))},
+            render=lambda obj: str(row(obj)),
+            suffix=':' + fragments.version_tag(connection, depends_on),
+        )
+
+    return Markup(cache.get_or_render(f'{table}/rows:{tag}', render_all))
+
+@bp.cli.command('fragments-clear')
+def fragments_clear_command():
+    """Vaciar la caché de fragmentos HTML de las listas"""
+    current_app.extensions['fragment_cache'].clear()
+    print("Caché de fragmentos vaciada")
+
+# ========== REPORTES (COPIA DE SOLO LECTURA) ==========
+
+def refresh_reports_replica():
+    """Copiar la base principal sobre la copia de reportes"""
+    return replica.snapshot(db.engine.url.database, current_app.config['REPORTS_REPLICA_PATH'])
+
+def report_engine():
+    """Motor para los reportes: la copia con REPORTS_REPLICA, si no la base principal.
+
+    La primera copia se toma en la misma petición; después, si tiene más de
+    REPORTS_REPLICA_MAX_AGE segundos, se encola su renovación (como mucho
+    una vez por intervalo en cada proceso) y el reporte usa la que hay.
+    """
+    if not current_app.config['REPORTS_REPLICA']:
+        return db.engine
+    max_age = current_app.config['REPORTS_REPLICA_MAX_AGE']
+    age = replica.age(current_app.config['REPORTS_REPLICA_PATH'])
+    if age is None:
+        refresh_reports_replica()
+    elif age >= max_age:
+        state = current_app.extensions.setdefault('reports_replica', {'queued_at': 0.0})
+        if time.time() - state['queued_at'] >= max_age:
+            state['queued_at'] = time.time()
+            enqueue_job('reports.refresh_replica')
+            db.session.commit()
+    return db.engines['reports']
+
+def report_connection():
+    """Conexión de lectura para un reporte y la hora de sus datos (``None``: en vivo)"""
+    engine = report_engine()
+    if engine is db.engine:
+        return db.session.connection(), None
+    connection = engine.connect()
+    g.report_connection = connection  # se cierra al terminar la petición
+    return connection, replica.taken_at(connection)
+
+def report_source(taken_at):
+    """Origen de los datos de un reporte para mostrarlo (``None``: base en vivo)"""
+    if taken_at is None:
+        return None
+    return {'taken_at': taken_at.astimezone(CO_TZ),
+            'minutes': int((datetime.now(timezone.utc) - taken_at).total_seconds() // 60)}
+
+@bp.teardown_app_request
+def close_report_connection(exc):
+    connection = g.pop('report_connection', None)
+    if connection is not None:
+        connection.close()
+
+@bp.cli.command('replica-refresh')
+@click.option('--every', type=float, default=None, help='Repetir cada N segundos (servicio)')
+def replica_refresh_command(every):
+    """Renovar la copia de solo lectura de los reportes"""
+    while True:
+        started = time.perf_counter()
+        refresh_reports_replica()
+        print(f"Copia de reportes renovada en {time.perf_counter() - started:.1f} s "
+              f"({current_app.config['REPORTS_REPLICA_PATH']})")
+        if every is None:
+            return
+        time.sleep(every)
 
 # ========== GESTIÓN DE CLIENTES ==========
 
-@app.route('/customers')
+@bp.route('/customers')
 @login_required
 def customers():
     """Lista de clientes"""
-    customers = Customer.query.all()
-    return render_template('customers/list.html', customers=customers)
+    rows = cached_rows(Customer, 'customers/_rows.html')
+    return render_template('customers/list.html', rows=rows)
 
-@app.route('/customers/new')
+@bp.route('/customers/new')
 @login_required
 def customer_new():
     """Formulario para nuevo cliente"""
     return render_template('customers/form.html', customer=None)
 
-@app.route('/customers/create', methods=['GET', 'POST'])
+@bp.route('/customers/create', methods=['GET', 'POST'])
 @login_required
 def customer_create():
     """Crear nuevo cliente"""
     if request.method == 'GET':
         # Redirect GET requests to the form
-        return redirect(url_for('customer_new'))
+        return redirect(url_for('main.customer_new'))
     
     # Handle POST request
     try:
@@ -318,29 +661,32 @@ def customer_create():
         db.session.add(customer)
         db.session.commit()
         flash('Cliente creado exitosamente', 'success')
-        return redirect(url_for('customers'))
+        return redirect(url_for('main.customers'))
     except Exception as e:
         db.session.rollback()
         flash('Error al crear cliente', 'danger')
-        return redirect(url_for('customer_new'))
+        return redirect(url_for('main.customer_new'))
 
-@app.route('/customers/<int:customer_id>')
+@bp.route('/customers/<int:customer_id>')
 @login_required
 def customer_view(customer_id):
     """Ver detalles de un cliente"""
-    customer = Customer.query.get_or_404(customer_id)
-    # Obtener servicios del cliente
-    services = Service.query.filter_by(customer_id=customer_id).order_by(Service.created_at.desc()).all()
-    return render_template('customers/view.html', customer=customer, services=services)
+    def render():
+        customer = Customer.query.get_or_404(customer_id)
+        # Obtener servicios del cliente
+        services = Service.query.options(selectinload(Service.technician)).filter_by(
+            customer_id=customer_id).order_by(Service.created_at.desc()).all()
+        return render_template('customers/view.html', customer=customer, services=services)
+    return conditional_view(customer_validators(customer_id), render)
 
-@app.route('/customers/<int:customer_id>/edit')
+@bp.route('/customers/<int:customer_id>/edit')
 @login_required
 def customer_edit(customer_id):
     """Formulario para editar cliente"""
     customer = Customer.query.get_or_404(customer_id)
     return render_template('customers/form.html', customer=customer)
 
-@app.route('/customers/<int:customer_id>/update', methods=['POST'])
+@bp.route('/customers/<int:customer_id>/update', methods=['POST'])
 @login_required
 def customer_update(customer_id):
     """Actualizar cliente"""
@@ -354,13 +700,13 @@ def customer_update(customer_id):
         customer.updated_at = datetime.now(CO_TZ)
         db.session.commit()
         flash('Cliente actualizado exitosamente', 'success')
-        return redirect(url_for('customer_view', customer_id=customer_id))
+        return redirect(url_for('main.customer_view', customer_id=customer_id))
     except Exception as e:
         db.session.rollback()
         flash('Error al actualizar cliente', 'danger')
-        return redirect(url_for('customer_edit', customer_id=customer_id))
+        return redirect(url_for('main.customer_edit', customer_id=customer_id))
 
-@app.route('/customers/<int:customer_id>/delete', methods=['POST'])
+@bp.route('/customers/<int:customer_id>/delete', methods=['POST'])
 @login_required
 def customer_delete(customer_id):
     """Eliminar cliente"""
@@ -370,7 +716,7 @@ def customer_delete(customer_id):
     services_count = Service.query.filter_by(customer_id=customer_id).count()
     if services_count > 0:
         flash(f'No se puede eliminar el cliente porque tiene {services_count} servicios asociados', 'warning')
-        return redirect(url_for('customers'))
+        return redirect(url_for('main.customers'))
     
     try:
         db.session.delete(customer)
@@ -380,30 +726,60 @@ def customer_delete(customer_id):
         db.session.rollback()
         flash('Error al eliminar cliente', 'danger')
     
-    return redirect(url_for('customers'))
+    return redirect(url_for('main.customers'))
 
 # ========== GESTIÓN DE INVENTARIO ==========
 
-@app.route('/inventory')
+@bp.route('/inventory')
 @login_required
 def inventory():
     """Lista de inventario"""
-    items = Inventory.query.all()
-    return render_template('inventory/list.html', items=items)
+    rows = cached_rows(Inventory, 'inventory/_rows.html')
+    by_category = dict(db.session.query(Inventory.category, func.count(Inventory.id)).group_by(Inventory.category).all())
+    stats = {
+        'total': sum(by_category.values()),
+        'low_stock': read_counters().get('inventory.low_stock', 0),
+        'repuestos': by_category.get('repuestos', 0),
+        'accesorios': by_category.get('accesorios', 0),
+    }
+    return render_template('inventory/list.html', rows=rows, stats=stats)
+
+@bp.route('/inventory/valuation')
+@login_required
+def inventory_valuation():
+    """Stock y valor del inventario a una fecha, por categoría, proveedor o ubicación"""
+    dimension = request.args.get('dimension', 'category')
+    if dimension not in valuation.DIMENSIONS[1:]:
+        dimension = 'category'
+    try:
+        day = datetime.strptime(request.args['date'], '%Y-%m-%d').date() if request.args.get('date') else today()
+    except ValueError:
+        flash('Fecha inválida, se muestra la valoración de hoy', 'warning')
+        day = today()
+    connection, taken_at = report_connection()
+    rows = [row for row in valuation.as_of(connection, dimension, day) if row[1] or row[2]]
+    start = date.fromordinal(day.toordinal() - 29)
+    return render_template('inventory/valuation.html',
+                           rows=rows,
+                           dimension=dimension,
+                           day=day,
+                           total=valuation.as_of(connection, 'total', day),
+                           history=valuation.history(connection, start, day),
+                           source=report_source(taken_at))
 
-@app.route('/inventory/new')
+@bp.route('/inventory/new')
 @login_required
 def inventory_new():
     """Formulario para nuevo item de inventario"""
     return render_template('inventory/form.html', item=None)
 
-@app.route('/inventory/create', methods=['GET', 'POST'])
+@bp.route('/inventory/create', methods=['GET', 'POST'])
 @login_required
 def inventory_create():
     """Crear nuevo item de inventario"""
     if request.method == 'GET':
         # Redirect GET requests to the form
-        return redirect(url_for('inventory_new'))
+        return redirect(url_for('main.inventory_new'))
     
     # Handle POST request
     try:
@@ -423,20 +799,20 @@ def inventory_create():
         db.session.add(item)
         db.session.commit()
         flash('Item agregado al inventario exitosamente', 'success')
-        return redirect(url_for('inventory'))
+        return redirect(url_for('main.inventory'))
     except Exception as e:
         db.session.rollback()
         flash('Error al agregar item al inventario', 'danger')
-        return redirect(url_for('inventory_new'))
+        return redirect(url_for('main.inventory_new'))
 
-@app.route('/inventory/<int:id>/edit')
+@bp.route('/inventory/<int:id>/edit')
 @login_required
 def inventory_edit(id):
     """Formulario para editar item de inventario"""
     item = Inventory.query.get_or_404(id)
     return render_template('inventory/form.html', item=item)
 
-@app.route('/inventory/<int:id>/update', methods=['POST'])
+@bp.route('/inventory/<int:id>/update', methods=['POST'])
 @login_required
 def inventory_update(id):
     """Actualizar item de inventario"""
@@ -456,20 +832,24 @@ def inventory_update(id):
         
         db.session.commit()
         flash('Item actualizado exitosamente', 'success')
-        return redirect(url_for('inventory'))
+        return redirect(url_for('main.inventory'))
     except Exception as e:
         db.session.rollback()
         flash('Error al actualizar item', 'danger')
-        return redirect(url_for('inventory_edit', id=id))
+        return redirect(url_for('main.inventory_edit', id=id))
 
-@app.route('/inventory/<int:item_id>')
+@bp.route('/inventory/<int:item_id>')
 @login_required
 def inventory_view(item_id):
     """Ver detalles de un item de inventario"""
-    item = Inventory.query.get_or_404(item_id)
-    return render_template('inventory/view.html', item=item)
+    def render():
+        item = Inventory.query.get_or_404(item_id)
+        movements = (InventoryMovement.query.filter_by(inventory_id=item.id)
+                     .order_by(InventoryMovement.created_at.desc()).limit(20).all())
+        return render_template('inventory/view.html', item=item, movements=movements)
+    return conditional_view(inventory_validators(item_id), render)
 
-@app.route('/inventory/<int:item_id>/delete', methods=['POST'])
+@bp.route('/inventory/<int:item_id>/delete', methods=['POST'])
 @login_required
 def inventory_delete(item_id):
     """Eliminar item de inventario"""
@@ -483,63 +863,149 @@ def inventory_delete(item_id):
         db.session.rollback()
         flash('Error al eliminar item del inventario', 'danger')
     
-    return redirect(url_for('inventory'))
+    return redirect(url_for('main.inventory'))
+
+class StockMovementError(ValueError):
+    """Movimiento de stock que no se puede aplicar; ``status_code`` es la respuesta HTTP"""
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def apply_stock_movement(item_id, movement_type, quantity, notes=None, service_id=None):
+    """Aplicar un movimiento con un único UPDATE condicional y registrarlo en el historial.
+
+    La salida solo descuenta si ``stock >= cantidad`` en el mismo UPDATE, así
+    dos retiros simultáneos del mismo repuesto no pueden dejar el stock
+    negativo ni perder una actualización. El llamador confirma la transacción.
+    """
+    if movement_type not in ('entrada', 'salida'):
+        raise StockMovementError(f'Tipo de movimiento inválido: {movement_type}')
+    if not isinstance(item_id, int) or isinstance(item_id, bool):
+        raise StockMovementError('Falta el item (item_id) o no es un número')
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+        raise StockMovementError('La cantidad debe ser un entero mayor que cero')
+    delta = quantity if movement_type == 'entrada' else -quantity
+    now = datetime.now(CO_TZ)
+    statement = (update(Inventory.__table__)
+                 .where(Inventory.id == item_id)
+                 .values(stock=Inventory.stock + delta, updated_at=now)
+                 .returning(Inventory.stock, Inventory.min_stock, Inventory.price,
+                            Inventory.category, Inventory.supplier, Inventory.location))
+    if delta < 0:
+        statement = statement.where(Inventory.stock >= quantity)
+    row = db.session.execute(statement).first()
+    if row is None:
+        if db.session.get(Inventory, item_id) is None:
+            raise StockMovementError(f'El item {item_id} no existe', 404)
+        raise StockMovementError('No hay suficiente stock disponible', 409)
+    new_stock, min_stock = row.stock, row.min_stock
+    previous_stock = new_stock - delta
+    # El UPDATE no pasa por el ORM: actualizar contadores, valoración y el objeto en la sesión
+    low_before, low_after = previous_stock <= min_stock, new_stock <= min_stock
+    counters.adjust(db.session.connection(), {'inventory.low_stock': int(low_after) - int(low_before)})
+    fragments.bump(db.session.connection(), ['inventory'])
+    changes.publish(db.session.connection(), 'inventory',
+                    [{'id': item_id, 'action': 'updated', 'stock': new_stock, 'min_stock': min_stock}])
+    stock_deltas = valuation.new_deltas()
+    valuation.add(stock_deltas, {'stock': delta, 'price': row.price, 'category': row.category,
+                                 'supplier': row.supplier, 'location': row.location})
+    valuation.apply(db.session.connection(), today(), stock_deltas)
+    item = db.session.identity_map.get(db.inspect(Inventory).identity_key_from_primary_key((item_id,)))
+    if item is not None:
+        db.session.expire(item, ['stock', 'updated_at'])
+    movement = InventoryMovement(
+        inventory_id=item_id,
+        service_id=service_id,
+        movement_type=movement_type,
+        quantity=quantity,
+        previous_stock=previous_stock,
+        new_stock=new_stock,
+        notes=notes or None,
+        created_by=current_user.id,
+        created_at=now
+    )
+    db.session.add(movement)
+    return movement
 
-@app.route('/inventory/<int:item_id>/stock-movement', methods=['POST'])
+@bp.route('/inventory/<int:item_id>/stock-movement', methods=['POST'])
 @login_required
 def inventory_stock_movement(item_id):
     """Realizar movimiento de stock"""
-    item = Inventory.query.get_or_404(item_id)
+    Inventory.query.get_or_404(item_id)
     
     try:
         movement_type = request.form['movement_type']  # 'entrada' o 'salida'
         quantity = int(request.form['quantity'])
         reason = request.form.get('reason', '')
         
+        apply_stock_movement(item_id, movement_type, quantity, notes=reason)
+        db.session.commit()
         if movement_type == 'entrada':
-            item.stock += quantity
             flash(f'Se agregaron {quantity} unidades al stock', 'success')
-        elif movement_type == 'salida':
-            if item.stock >= quantity:
-                item.stock -= quantity
-                flash(f'Se retiraron {quantity} unidades del stock', 'success')
-            else:
-                flash('No hay suficiente stock disponible', 'warning')
-                return redirect(url_for('inventory'))
-        
-        item.updated_at = datetime.now(CO_TZ)
-        db.session.commit()
-        
+        else:
+            flash(f'Se retiraron {quantity} unidades del stock', 'success')
+    except StockMovementError as e:
+        db.session.rollback()
+        flash(str(e), 'warning')
     except Exception as e:
         db.session.rollback()
         flash('Error al realizar movimiento de stock', 'danger')
     
-    return redirect(url_for('inventory'))
+    return redirect(url_for('main.inventory'))
+
+@bp.route('/api/inventory/movements', methods=['POST'])
+@login_required
+def api_inventory_movements():
+    """Aplicar varios movimientos de stock en una sola transacción (todos o ninguno)
+
+    Recibe ``{"movements": [{"item_id", "movement_type", "quantity", "notes", "service_id"}, ...]}``.
+    """
+    data = request.get_json(silent=True) or {}
+    movements = data.get('movements') if isinstance(data, dict) else None
+    if not isinstance(movements, list) or not movements:
+        return jsonify({'error': 'Se esperaba una lista "movements"'}), 400
+    for index, entry in enumerate(movements):
+        if not isinstance(entry, dict):
+            return jsonify({'error': 'Cada movimiento debe ser un objeto {"item_id", "movement_type", "quantity"}',
+                            'index': index}), 400
+    applied = []
+    try:
+        for index, entry in enumerate(movements):
+            try:
+                applied.append(apply_stock_movement(
+                    entry.get('item_id'), entry.get('movement_type'), entry.get('quantity'),
+                    notes=entry.get('notes'), service_id=entry.get('service_id')))
+            except StockMovementError as e:
+                db.session.rollback()
+                return jsonify({'error': str(e), 'index': index}), e.status_code
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Error al registrar movimientos: {str(e)}'}), 500
+    return jsonify({'movements': [movement.to_dict() for movement in applied]})
 
 # ========== GESTIÓN DE SERVICIOS ==========
 
-@app.route('/services')
+@bp.route('/services')
 @login_required
 def services():
-    """Lista de servicios"""
-    services = Service.query.all()
-    return render_template('services/list.html', services=services)
+    """Lista de servicios (las filas se cargan desde services_datatable)"""
+    status_counts = counters.by_prefix(read_counters(), 'services.status.')
+    return render_template('services/list.html', status_counts=status_counts)
 
-@app.route('/services/new')
+@bp.route('/services/new')
 @login_required
 def service_new():
-    """Formulario para nuevo servicio"""
-    customers = Customer.query.all()
-    equipment = Equipment.query.all()
-    return render_template('services/form.html', service=None, customers=customers, equipment=equipment)
+    """Formulario para nuevo servicio (clientes y equipos se eligen con /api/*/options)"""
+    return render_template('services/form.html', service=None)
 
-@app.route('/services/create', methods=['GET', 'POST'])
+@bp.route('/services/create', methods=['GET', 'POST'])
 @login_required
 def service_create():
     """Crear nuevo servicio"""
     if request.method == 'GET':
         # Redirect GET requests to the form
-        return redirect(url_for('service_new'))
+        return redirect(url_for('main.service_new'))
     
     # Handle POST request
     try:
@@ -577,46 +1043,49 @@ def service_create():
         
         for file in uploaded_files:
             if file and file.filename != '':
-                filename = save_evidence_file(file, service.id)
-                if filename:
+                stored = save_evidence_file(file)
+                if stored:
                     evidence = ServiceEvidence(
                         service_id=service.id,
-                        filename=filename,
+                        stored_file=stored,
+                        filename=stored.filename,
+                        variants=stored.variants,
                         evidence_type='recepcion',
                         description='Foto de recepción del equipo'
                     )
                     db.session.add(evidence)
         
+        # Dejar lista la orden en PDF para imprimirla al recibir el equipo
+        enqueue_job('service.render_pdf', service_id=service.id)
         db.session.commit()
         flash('Servicio creado exitosamente', 'success')
-        return redirect(url_for('services'))
+        return redirect(url_for('main.services'))
     except Exception as e:
         db.session.rollback()
         flash(f'Error al crear servicio: {str(e)}', 'danger')
-        return redirect(url_for('service_new'))
+        return redirect(url_for('main.service_new'))
 
-@app.route('/services/<int:id>')
+@bp.route('/services/<int:id>')
 @login_required
 def service_detail(id):
     """Ver detalles de un servicio"""
-    service = Service.query.get_or_404(id)
-    return render_template('services/detail.html', service=service)
+    return conditional_view(service_validators(id), lambda: render_template(
+        'services/detail.html', service=get_service_or_404(id)))
 
-@app.route('/services/<int:id>/edit')
+@bp.route('/services/<int:id>/edit')
 @login_required
 def service_edit(id):
     """Formulario para editar servicio"""
-    service = Service.query.get_or_404(id)
-    customers = Customer.query.all()
-    equipment = Equipment.query.all()
-    return render_template('services/form.html', service=service, customers=customers, equipment=equipment)
+    service = Service.query.options(joinedload(Service.customer), joinedload(Service.equipment)).get_or_404(id)
+    return render_template('services/form.html', service=service)
 
-@app.route('/services/<int:id>/update', methods=['POST'])
+@bp.route('/services/<int:id>/update', methods=['POST'])
 @login_required
 def service_update(id):
     """Actualizar servicio"""
     try:
         service = Service.query.get_or_404(id)
+        previous_status = service.status
         
         # Get equipment_id if selecting from existing equipment, otherwise None for manual entry
         equipment_id = request.form.get('equipment_id')
@@ -644,56 +1113,760 @@ def service_update(id):
         service.equipment_accessories = request.form.get('equipment_accessories')
         service.equipment_condition = request.form.get('equipment_condition')
         service.updated_at = datetime.now(CO_TZ)
+        if service.status != previous_status and service.status in SERVICE_STATUSES:
+            # Las mismas fechas de etapa que el cambio de estado por API (analítica, plazos)
+            set_status_dates(service, service.updated_at)
         
         # Handle photo uploads
         uploaded_files = request.files.getlist('photos[]')
         for file in uploaded_files:
             if file and file.filename != '':
-                filename = save_evidence_file(file, service.id)
-                if filename:
+                stored = save_evidence_file(file)
+                if stored:
                     evidence = ServiceEvidence(
                         service_id=service.id,
-                        filename=filename,
+                        stored_file=stored,
+                        filename=stored.filename,
+                        variants=stored.variants,
                         evidence_type='proceso',
                         description='Foto actualizada del equipo'
                     )
                     db.session.add(evidence)
         
+        if service.status != previous_status:
+            enqueue_job('service.render_pdf', service_id=service.id)
         db.session.commit()
         flash('Servicio actualizado exitosamente', 'success')
-        return redirect(url_for('services'))
+        return redirect(url_for('main.services'))
     except Exception as e:
         db.session.rollback()
         flash(f'Error al actualizar servicio: {str(e)}', 'danger')
-        return redirect(url_for('service_edit', id=id))
+        return redirect(url_for('main.service_edit', id=id))
+
+# Estados en orden y la fecha que registra la llegada a cada uno
+SERVICE_STATUSES = ('Recibido', 'En proceso', 'Completado', 'Entregado')
+STATUS_DATES = (('En proceso', 'start_date'), ('Completado', 'completion_date'), ('Entregado', 'delivery_date'))
+STATUS_COLUMNS = ('status', 'start_date', 'completion_date', 'delivery_date', 'updated_at')
+
+class ServiceStatusError(ValueError):
+    """Cambio de estado que no se puede aplicar; ``status_code`` es la respuesta HTTP"""
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def status_values(status, now):
+    """Valores del UPDATE: el estado y las fechas de cada etapa.
+
+    Las etapas alcanzadas conservan su fecha o toman ``now``; las posteriores
+    al nuevo estado (al devolver un servicio) quedan vacías.
+    """
+    rank = SERVICE_STATUSES.index(status)
+    values = {'status': status, 'updated_at': now}
+    for stage, column in STATUS_DATES:
+        reached = rank >= SERVICE_STATUSES.index(stage)
+        values[column] = func.coalesce(getattr(Service, column), now) if reached else None
+    return values
+
+def set_status_dates(service, now):
+    """``status_values`` sobre un servicio cargado en el ORM (formulario de edición)"""
+    rank = SERVICE_STATUSES.index(service.status)
+    for stage, column in STATUS_DATES:
+        if rank < SERVICE_STATUSES.index(stage):
+            setattr(service, column, None)
+        elif getattr(service, column) is None:
+            setattr(service, column, now)
+
+def apply_status_change(service_ids, status):
+    """Cambiar el estado de uno o varios servicios sin pasar por el formulario completo.
+
+    Un UPDATE condicional por estado anterior (``WHERE status = <anterior>``),
+    así un cambio simultáneo de otro usuario se detecta en lugar de pisarlo.
+    Los contadores del dashboard y la caché de la lista se actualizan aquí
+    porque el UPDATE no pasa por el ORM. El llamador confirma la transacción.
+    Devuelve el estado y las fechas de cada servicio, en el orden recibido.
+    """
+    if status not in SERVICE_STATUSES:
+        raise ServiceStatusError(f'Estado inválido: {status}')
+    if not service_ids or not all(isinstance(service_id, int) for service_id in service_ids):
+        raise ServiceStatusError('Se esperaba una lista de ids de servicio')
+    service_ids = list(dict.fromkeys(service_ids))
+    columns = [getattr(Service, column) for column in STATUS_COLUMNS]
+    current = {row.id: row._asdict() for row in db.session.execute(
+        select(Service.id, *columns).where(Service.id.in_(service_ids)))}
+    missing = [service_id for service_id in service_ids if service_id not in current]
+    if missing:
+        raise ServiceStatusError(f'Servicios inexistentes: {", ".join(map(str, missing))}', 404)
+    by_previous = {}
+    for service_id in service_ids:
+        if current[service_id]['status'] != status:
+            by_previous.setdefault(current[service_id]['status'], []).append(service_id)
+    values = status_values(status, datetime.now(CO_TZ))
+    deltas = {}
+    for previous, group in by_previous.items():
+        previous_matches = Service.status.is_(None) if previous is None else Service.status == previous
+        rows = db.session.execute(update(Service.__table__)
+                                  .where(Service.id.in_(group), previous_matches)
+                                  .values(**values)
+                                  .returning(Service.id, *columns)).all()
+        if len(rows) != len(group):
+            raise ServiceStatusError('Otro usuario cambió el estado al mismo tiempo; intente de nuevo', 409)
+        for row in rows:
+            current[row.id] = row._asdict()
+        if previous:
+            deltas[f'services.status.{previous}'] = deltas.get(f'services.status.{previous}', 0) - len(group)
+        deltas[f'services.status.{status}'] = deltas.get(f'services.status.{status}', 0) + len(group)
+    changed = [service_id for group in by_previous.values() for service_id in group]
+    if changed:
+        connection = db.session.connection()
+        counters.adjust(connection, deltas)
+        fragments.bump(connection, ['services'])
+        analytics.sync(connection, changed)
+        changes.publish(connection, 'service',
+                        [{'id': service_id, 'action': 'updated', 'status': status, 'previous_status': previous}
+                         for previous, group in by_previous.items() for service_id in group])
+        for service_id in changed:
+            service = db.session.identity_map.get(db.inspect(Service).identity_key_from_primary_key((service_id,)))
+            if service is not None:
+                db.session.expire(service, list(STATUS_COLUMNS))
+            enqueue_job('service.render_pdf', service_id=service_id)
+    return [{'id': service_id, **{key: value.isoformat() if isinstance(value, datetime) else value
+                                  for key, value in current[service_id].items() if key != 'id'}}
+            for service_id in service_ids]
 
-@app.route('/services/<int:id>/details')
+def status_change_response(service_ids, status):
+    """Aplicar y confirmar un cambio de estado; errores como JSON con su código HTTP"""
+    try:
+        services = apply_status_change(service_ids, status)
+        db.session.commit()
+    except ServiceStatusError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Error al cambiar el estado: {str(e)}'}), 500
+    return jsonify({'services': services})
+
+@bp.route('/api/services/<int:id>/status', methods=['POST'])
+@login_required
+def api_service_status(id):
+    """Cambiar el estado de un servicio (formulario o JSON ``{"status": ...}``)"""
+    data = request.get_json(silent=True) or request.form
+    if not isinstance(data, dict):  # request.form también es un dict
+        return jsonify({'error': 'Se esperaba un objeto JSON {"status": ...}'}), 400
+    return status_change_response([id], data.get('status'))
+
+@bp.route('/api/services/status', methods=['POST'])
+@login_required
+def api_services_status():
+    """Cambiar el estado de varios servicios en una sola transacción (todos o ninguno)
+
+    Recibe ``{"service_ids": [1, 2, ...], "status": "Entregado"}``.
+    """
+    data = request.get_json(silent=True) or {}
+    service_ids = data.get('service_ids') if isinstance(data, dict) else None
+    if not isinstance(service_ids, list):
+        return jsonify({'error': 'Se esperaba una lista "service_ids"'}), 400
+    return status_change_response(service_ids, data.get('status'))
+
+@bp.route('/services/<int:id>/details')
 @login_required
 def service_details_modal(id):
-    """Detalles de servicio para modal"""
-    service = Service.query.get_or_404(id)
-    return render_template('services/details_modal.html', service=service)
+    """Detalles de servicio para modal (el navegador lo revalida en cada clic)"""
+    return conditional_view(service_validators(id), lambda: render_template(
+        'services/details_modal.html', service=get_service_or_404(id)))
 
-@app.route('/services/<int:id>/print')
+@bp.route('/services/<int:id>/print')
 @login_required
 def service_print(id):
-    """Imprimir orden de servicio"""
-    service = Service.query.get_or_404(id)
-    return render_template('services/print.html', service=service)
+    """Imprimir orden de servicio (se reutiliza mientras el servicio no cambie)"""
+    def render():
+        service = get_service_or_404(id)
+        html = documents.get_or_render(
+            current_app.config['PRINT_CACHE_FOLDER'], documents.cache_key(service), 'html',
+            lambda: render_template('services/print.html', service=service).encode('utf-8'))
+        return Response(html, mimetype='text/html')
+    return conditional_view(service_validators(id), render)
+
+def render_service_pdf(service):
+    """PDF de la orden con la variante de impresión de cada foto"""
+    return documents.service_pdf(service, lambda evidence: os.path.join(
+        current_app.config['UPLOAD_FOLDER'], *evidence.variant_filename('print').split('/')))
+
+@bp.route('/services/<int:id>/print.pdf')
+@login_required
+def service_print_pdf(id):
+    """Orden de servicio en PDF (normalmente ya generada en segundo plano)"""
+    service = get_service_or_404(id)
+    pdf = documents.get_or_render(current_app.config['PRINT_CACHE_FOLDER'], documents.cache_key(service), 'pdf',
+                                  lambda: render_service_pdf(service))
+    response = Response(pdf, mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'inline; filename="orden-{service.id}.pdf"'
+    return response
+
+# ========== ANALÍTICA DE SERVICIOS ==========
+
+ANALYTICS_MONTHS = 12
+
+def analytics_summaries(connection, periods):
+    """Resumen de cada mes desde la caché de fragmentos (se recalcula solo si el mes cambió)"""
+    cache = current_app.extensions['fragment_cache']
+    summaries = []
+    for period in periods:
+        tag = fragments.version_tag(connection, [analytics.period_key(period)])
+        summaries.append(json.loads(cache.get_or_render(
+            f'analytics/{period}:{tag}', lambda: json.dumps(analytics.period_summary(connection, period)))))
+    return summaries
+
+@bp.route('/services/analytics')
+@login_required
+def services_analytics():
+    """Tiempos de entrega, cumplimiento, ingresos y rendimiento por técnico, por mes"""
+    connection, taken_at = report_connection()
+    summaries = analytics_summaries(connection, analytics.recent_periods(today(), ANALYTICS_MONTHS))
+    periods = [summary['period'] for summary in summaries]
+    period = request.args.get('period')
+    selected = summaries[periods.index(period)] if period in periods else summaries[0]
+    technicians = {str(user.id): user.username for user in User.query.filter(
+        User.id.in_([int(key) for key in selected['by_technician'] if key.isdigit()]))}
+    return render_template('services/analytics.html', summaries=summaries, selected=selected,
+                           technicians=technicians, source=report_source(taken_at))
+
+@bp.cli.command('analytics-rebuild')
+def analytics_rebuild_command():
+    """Recalcular la tabla de hechos de la analítica desde los servicios"""
+    with db.engine.begin() as connection:
+        analytics.rebuild(connection)
+    print("Analítica recalculada")
+
+# ========== API DE TABLAS (DataTables del lado del servidor) ==========
+
+def service_cells(service):
+    """Celdas HTML de una fila de la lista de servicios"""
+    cell = get_template_attribute('services/_table_cells.html', 'cell')
+    return {name: str(cell(name, service))
+            for name in ('order', 'customer', 'type', 'description', 'status', 'cost', 'actions')}
+
+def service_row(service, cache_suffix=None):
+    """Fila de la lista de servicios para DataTables.
+
+    Con ``cache_suffix`` (versiones de clientes y equipos, que también se
+    muestran en la fila) las celdas salen de la caché de fragmentos.
+    """
+    if cache_suffix is None:
+        row = service_cells(service)
+    else:
+        key = f'services/row:{service.id}:{fragments.row_stamp(service.updated_at)}{cache_suffix}'
+        row = json.loads(current_app.extensions['fragment_cache'].get_or_render(
+            key, lambda: json.dumps(service_cells(service))))
+    row['DT_RowId'] = f'service-{service.id}'
+    row['DT_RowClass'] = 'service-row'
+    row['DT_RowAttr'] = {'data-service-id': service.id}
+    return row
+
+def services_table(cache_suffix=None):
+    """Tabla de servicios: orden por fecha, tipo, estado o costo y filtros por columna"""
+    return datatables.DataTable(
+        Service.query.options(*SERVICE_LIST_OPTIONS),
+        columns=[
+            datatables.Column('order', Service.created_at, filter=datatables.FILTER_RANGE),
+            datatables.Column('customer', Service.customer_id, filter=datatables.FILTER_EXACT),
+            datatables.Column('type', Service.service_type, filter=datatables.FILTER_EXACT),
+            datatables.Column('description', Service.description, orderable=False, searchable=True),
+            datatables.Column('status', Service.status, filter=datatables.FILTER_EXACT),
+            datatables.Column('cost', func.coalesce(Service.final_cost, Service.estimated_cost)),
+            datatables.Column('actions', orderable=False),
+        ],
+        serializer=lambda service: service_row(service, cache_suffix),
+        id_column=Service.id,
+        default_order=(Service.created_at, 'desc'),
+        records_total=lambda: sum(counters.by_prefix(read_counters(), 'services.status.').values()),
+    )
+
+@bp.route('/api/services/datatable')
+@login_required
+def services_datatable():
+    """Página de servicios para DataTables (serverSide)"""
+    suffix = ':' + fragments.version_tag(db.session.connection(), ['customers', 'equipment'])
+    return jsonify(services_table(suffix).response(request.args))
+
+# ========== PANTALLAS EN VIVO (SSE) ==========
+
+STREAM_TOPICS = ('service', 'inventory')
+BOARD_COLUMN_LIMIT = 100  # tarjetas más recientes por columna; el resto se ve en la lista
+
+def database_connection(app):
+    """Conexión nueva al motor de ``app`` (para hilos sin contexto de aplicación)"""
+    with app.app_context():
+        engine = db.engine
+    return engine.connect()
+
+@bp.route('/stream')
+@login_required
+def stream():
+    """Eventos de cambios como Server-Sent Events (``?topics=service,inventory``)
+
+    Con ``Last-Event-ID`` (reconexión) o ``?after=<id>`` (id con el que se
+    renderizó la página) se reenvía lo ocurrido desde entonces.
+    """
+    topics = [topic for topic in request.args.get('topics', 'service').split(',') if topic in STREAM_TOPICS]
+    if not topics:
+        return jsonify({'error': f'Tópicos válidos: {", ".join(STREAM_TOPICS)}'}), 400
+    broker = current_app.extensions['change_broker']
+    if len(broker.subscriptions) >= current_app.config['STREAM_MAX_CLIENTS']:
+        # No ocupar todos los hilos del proceso con conexiones abiertas
+        return Response('Demasiadas pantallas conectadas', status=503, headers={'Retry-After': '30'})
+    after_id = request.headers.get('Last-Event-ID', type=int)
+    if after_id is None:
+        after_id = request.args.get('after', type=int)
+    if after_id is None:
+        after_id = changes.last_id(db.session.connection())
+    subscription = broker.subscribe(topics, after_id)
+    # La conexión dura minutos: no retener la sesión (ni su transacción de lectura)
+    db.session.remove()
+    response = Response(changes.stream(broker, subscription,
+                                       keepalive=current_app.config['STREAM_KEEPALIVE_SECONDS'],
+                                       max_seconds=current_app.config['STREAM_MAX_SECONDS']),
+                        mimetype='text/event-stream')
+    response.cache_control.no_cache = True
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx: entregar cada evento sin esperar
+    return response
+
+@bp.route('/services/board')
+@login_required
+def services_board():
+    """Tablero de servicios por estado que se actualiza solo con /stream"""
+    # Ids por columna con ix_services_status_created; luego una sola carga con sus relaciones
+    ids_by_status = {status: db.session.execute(
+        select(Service.id).where(Service.status == status)
+        .order_by(Service.created_at.desc()).limit(BOARD_COLUMN_LIMIT)).scalars().all()
+        for status in SERVICE_STATUSES}
+    all_ids = [service_id for ids in ids_by_status.values() for service_id in ids]
+    loaded = {service.id: service for service in
+              Service.query.options(*SERVICE_LIST_OPTIONS).filter(Service.id.in_(all_ids))} if all_ids else {}
+    columns = [(status, [loaded[service_id] for service_id in ids_by_status[status]]) for status in SERVICE_STATUSES]
+    return render_template('services/board.html', columns=columns,
+                           status_counts=counters.by_prefix(read_counters(), 'services.status.'),
+                           statuses=SERVICE_STATUSES, column_limit=BOARD_COLUMN_LIMIT,
+                           last_event_id=changes.last_id(db.session.connection()))
+
+@bp.route('/services/board/cards/<int:id>')
+@login_required
+def services_board_card(id):
+    """Tarjeta de un servicio para reemplazarla en el tablero"""
+    service = Service.query.options(*SERVICE_LIST_OPTIONS).filter_by(id=id).first_or_404()
+    card = get_template_attribute('services/_board_card.html', 'card')
+    return str(card(service, SERVICE_STATUSES))
+
+# ========== BÚSQUEDA ==========
+
+SEARCH_LABELS = {
+    'customer': ('Clientes', 'fa-users'),
+    'equipment': ('Equipos', 'fa-music'),
+    'service': ('Servicios', 'fa-tools'),
+    'inventory': ('Inventario', 'fa-boxes'),
+}
+
+def search_result_url(result):
+    """URL de detalle para un resultado del índice de búsqueda"""
+    if result['entity'] == 'customer':
+        return url_for('main.customer_view', customer_id=result['id'])
+    if result['entity'] == 'equipment':
+        # Los equipos no tienen vista propia: se muestran en la ficha del cliente
+        return url_for('main.customer_view', customer_id=result['scope']) if result['scope'] else None
+    if result['entity'] == 'service':
+        return url_for('main.service_detail', id=result['id'])
+    return url_for('main.inventory_view', item_id=result['id'])
+
+def search_response(entities, scope=None):
+    """Ejecuta la búsqueda de ?q= sobre las entidades indicadas y responde JSON"""
+    limit = max(1, min(request.args.get('limit', 20, type=int), 50))
+    found = search.search(db.session.connection(), request.args.get('q', ''),
+                          entities=entities, scope=scope, limit=limit)
+    for result in found['results']:
+        result['url'] = search_result_url(result)
+    return jsonify(found)
+
+@bp.route('/api/customers/search')
+@login_required
+def api_customers_search():
+    """Buscar clientes por nombre, teléfono o email"""
+    return search_response(['customer'])
+
+@bp.route('/api/equipment/search')
+@login_required
+def api_equipment_search():
+    """Buscar equipos, opcionalmente solo los de un cliente (customer_id)"""
+    return search_response(['equipment'], scope=request.args.get('customer_id', type=int))
+
+@bp.route('/api/inventory/search')
+@login_required
+def api_inventory_search():
+    """Buscar items de inventario por nombre, marca o modelo"""
+    return search_response(['inventory'])
+
+# ========== SELECTORES DEL FORMULARIO DE SERVICIOS ==========
+
+PICKER_PAGE_SIZE = 20
+
+def picker_response(query, name_column, id_column, serializer):
+    """Página de ?q= (prefijo del nombre) desde ?after= (``next_cursor`` anterior) en JSON"""
+    rows, next_cursor = datatables.prefix_page(query, name_column, id_column, request.args.get('q', ''),
+                                               request.args.get('after'), PICKER_PAGE_SIZE)
+    return jsonify({'results': [serializer(row) for row in rows], 'next_cursor': next_cursor})
+
+@bp.route('/api/customers/options')
+@login_required
+def api_customer_options():
+    """Clientes cuyo nombre empieza con ?q=, en orden alfabético y por páginas"""
+    return picker_response(
+        db.session.query(Customer.id, Customer.name, Customer.phone), Customer.name, Customer.id,
+        lambda row: {'id': row.id, 'name': row.name, 'phone': row.phone})
+
+@bp.route('/api/equipment/options')
+@login_required
+def api_equipment_options():
+    """Equipos de un cliente (?customer_id=) cuyo nombre empieza con ?q=, por páginas"""
+    customer_id = request.args.get('customer_id', type=int)
+    if customer_id is None:
+        return jsonify({'error': 'customer_id es obligatorio'}), 400
+    return picker_response(
+        db.session.query(Equipment.id, Equipment.name, Equipment.brand, Equipment.model, Equipment.serial_number)
+        .filter(Equipment.customer_id == customer_id), Equipment.name, Equipment.id,
+        lambda row: {'id': row.id, 'name': row.name, 'brand': row.brand, 'model': row.model,
+                     'serial_number': row.serial_number})
+
+@bp.route('/search')
+@login_required
+def search_page():
+    """Búsqueda global en clientes, equipos, servicios e inventario"""
+    query = request.args.get('q', '').strip()
+    found = search.search(db.session.connection(), query, limit=100)
+    groups = {}
+    for result in found['results']:
+        result['url'] = search_result_url(result)
+        groups.setdefault(result['entity'], []).append(result)
+    return render_template('search.html', query=query, groups=groups,
+                           labels=SEARCH_LABELS, took_ms=found['took_ms'])
+
+@bp.cli.command('search-rebuild')
+def search_rebuild_command():
+    """Reconstruir el índice de búsqueda de texto completo"""
+    total = search.rebuild(db.session.connection())
+    db.session.commit()
+    print(f"Índice de búsqueda reconstruido: {total} documentos")
+
+# ========== IMPORTACIÓN Y EXPORTACIÓN MASIVA ==========
+
+@bp.route('/data/import', methods=['GET', 'POST'])
+@login_required
+def data_import():
+    """Importar clientes, inventario o servicios desde CSV o JSONL"""
+    if current_user.role != 'admin':
+        flash('Solo los administradores pueden importar datos', 'warning')
+        return redirect(url_for('main.dashboard'))
+    result = None
+    if request.method == 'POST':
+        entity = request.form.get('entity')
+        file = request.files.get('file')
+        if entity not in bulk.ENTITIES or not file or not file.filename:
+            flash('Seleccione qué importar y el archivo', 'warning')
+            return redirect(url_for('main.data_import'))
+        try:
+            records = bulk.read_records(file.stream, bulk.detect_format(file.filename))
+            result = bulk.import_records(db.engine, db.metadata, entity, records,
+                                         defaults={'technician_id': current_user.id},
+                                         now=datetime.now(CO_TZ),
+                                         dry_run=bool(request.form.get('dry_run')))
+        except (bulk.ImportFormatError, UnicodeDecodeError, csv.Error) as e:
+            flash(f'No se pudo leer el archivo: {str(e)}', 'danger')
+            return redirect(url_for('main.data_import'))
+        except Exception as e:
+            flash(f'Error al importar: {str(e)}', 'danger')
+            return redirect(url_for('main.data_import'))
+        if request.form.get('dry_run'):
+            flash(f'Validación: {result.read - result.error_count} filas válidas, {result.error_count} con errores', 'info')
+        else:
+            flash(f'Importación terminada: {result.inserted} filas insertadas, {result.error_count} con errores',
+                  'success' if not result.error_count else 'warning')
+    age = replica.age(current_app.config['REPORTS_REPLICA_PATH']) if current_app.config['REPORTS_REPLICA'] else None
+    return render_template('data/import.html', entities=bulk.ENTITIES, result=result,
+                           replica_minutes=int(age // 60) if age is not None else None)
+
+@bp.route('/data/export/<entity>.<fmt>')
+@login_required
+def data_export(entity, fmt):
+    """Descargar una tabla completa como CSV o JSONL (generada por bloques)"""
+    if entity not in bulk.ENTITIES or fmt not in bulk.FORMATS:
+        abort(404)
+    engine = report_engine()
+    chunks = bulk.export_chunks(engine, db.metadata, entity, fmt)
+    response = Response(stream_with_context(chunks), mimetype=bulk.FORMATS[fmt])
+    stamp = datetime.now(CO_TZ).strftime('%Y%m%d')
+    response.headers['Content-Disposition'] = f'attachment; filename="{entity}-{stamp}.{fmt}"'
+    if engine is not db.engine:
+        with engine.connect() as connection:
+            response.headers['X-Data-As-Of'] = replica.taken_at(connection).isoformat()
+    return response
+
+@bp.cli.command('import-data')
+@click.argument('entity', type=click.Choice(sorted(bulk.ENTITIES)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--technician', 'technician_id', type=int, help='Técnico de los servicios que no lo indiquen')
+@click.option('--dry-run', is_flag=True, help='Solo validar, sin insertar')
+def import_data_command(entity, path, technician_id, dry_run):
+    """Importar un archivo CSV o JSONL"""
+    with open(path, 'rb') as stream:
+        records = bulk.read_records(stream, bulk.detect_format(path))
+        result = bulk.import_records(db.engine, db.metadata, entity, records,
+                                     defaults={'technician_id': technician_id},
+                                     now=datetime.now(CO_TZ), dry_run=dry_run)
+    for line, message in result.errors:
+        print(f"Línea {line}: {message}")
+    print(f"Leídas: {result.read}, insertadas: {result.inserted}, con errores: {result.error_count}")
+
+@bp.cli.command('export-data')
+@click.argument('entity', type=click.Choice(sorted(bulk.ENTITIES)))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+def export_data_command(entity, path):
+    """Exportar una tabla a CSV o JSONL (según la extensión del archivo)"""
+    fmt = bulk.detect_format(path)
+    with open(path, 'w', encoding='utf-8', newline='') as target:
+        for chunk in bulk.export_chunks(db.engine, db.metadata, entity, fmt):
+            target.write(chunk)
+    print(f"Exportado a {path}")
+
+# ========== TRABAJOS EN SEGUNDO PLANO ==========
+
+def enqueue_job(name, delay=0, **payload):
+    """Encolar un trabajo en la transacción actual (se ejecuta tras el commit)"""
+    job_id = jobs.enqueue(db.session.connection(), name, payload, delay=delay)
+    request_jobs = getattr(g, 'enqueued_jobs', None) if has_request_context() else None
+    if request_jobs is not None:
+        request_jobs.append(job_id)
+    return job_id
+
+def job_runner(app):
+    """Función que ejecuta cada trabajo con su propio contexto de ``app`` y sesión"""
+    def run_job(name, payload):
+        with app.app_context():
+            try:
+                jobs.run_task(name, payload)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+    return run_job
+
+def drain_jobs(app, job_ids, sweep=False):
+    """Ejecutar en este proceso los trabajos ``job_ids`` (los que encoló la petición)
+
+    Con ``sweep`` además toma hasta ``JOBS_INLINE_SWEEP_LIMIT`` trabajos
+    vencidos de la cola (reintentos, encolados por la consola o por otros
+    trabajos), para que el modo inline no los deje pendientes sin un worker.
+    """
+    with app.app_context():
+        engine = db.engine
+    worker_id = f'inline:{os.getpid()}'
+    timeout = app.config['JOBS_VISIBILITY_TIMEOUT']
+    if job_ids:
+        while jobs.run_one(engine, job_runner(app), worker_id, timeout, job_ids):
+            pass
+    if sweep:
+        for _ in range(app.config['JOBS_INLINE_SWEEP_LIMIT']):
+            if not jobs.run_one(engine, job_runner(app), worker_id, timeout):
+                break
+
+def inline_sweep_due(app):
+    """¿Le toca a este proceso revisar la cola completa? (como mucho cada JOBS_INLINE_SWEEP_SECONDS)"""
+    state = app.extensions['inline_jobs']
+    now = time.monotonic()
+    if now < state['next_sweep']:
+        return False
+    state['next_sweep'] = now + app.config['JOBS_INLINE_SWEEP_SECONDS']
+    return True
+
+@bp.before_app_request
+def track_enqueued_jobs():
+    g.enqueued_jobs = []
+
+@bp.after_app_request
+def run_inline_jobs(response):
+    """Con JOBS_INLINE, ejecutar lo encolado (y cada tanto lo vencido) cuando la respuesta ya se envió"""
+    if not current_app.config['JOBS_INLINE']:
+        return response
+    app = current_app._get_current_object()
+    job_ids = list(getattr(g, 'enqueued_jobs', None) or [])
+    sweep = inline_sweep_due(app)
+    if job_ids or sweep:
+        response.call_on_close(lambda: drain_jobs(app, job_ids, sweep))
+    return response
+
+@jobs.task('evidence.process_image')
+def process_evidence_image(stored_file_id):
+    """Limpiar la foto pendiente, generar sus variantes y publicarla en objects/"""
+    stored = db.session.get(StoredFile, stored_file_id)
+    pending_prefix = storage.PENDING_DIR + '/'
+    if stored is None or not stored.filename.startswith(pending_prefix):
+        return  # borrada o ya procesada
+    root = current_app.config['UPLOAD_FOLDER']
+    name = storage.object_name(stored.sha256, stored.filename.rsplit('.', 1)[1])
+    pending_path = os.path.join(root, *stored.filename.split('/'))
+    if os.path.exists(pending_path):
+        path = storage.place_object(pending_path, root, name)
+    else:
+        path = os.path.join(root, *name.split('/'))  # reintento tras moverla
+    try:
+        variants = images.process_upload(path, name_prefix=name.rsplit('/', 1)[0] + '/')
+    except images.InvalidImage as e:
+        raise jobs.PermanentFailure(str(e))
+    stored.filename = name
+    stored.variants = json.dumps(variants)
+    ServiceEvidence.query.filter_by(stored_file_id=stored.id).update(
+        {'filename': name, 'variants': stored.variants}, synchronize_session=False)
+    # Las órdenes ya renderizadas apuntaban a la foto en pending/
+    service_ids = db.session.query(ServiceEvidence.service_id).filter_by(stored_file_id=stored.id).distinct()
+    for (service_id,) in service_ids:
+        documents.invalidate(current_app.config['PRINT_CACHE_FOLDER'], service_id)
+
+@jobs.task('reports.refresh_replica', max_attempts=1)
+def refresh_reports_replica_job():
+    """Renovar la copia de reportes (si varias peticiones lo encolaron, solo la primera copia)"""
+    age = replica.age(current_app.config['REPORTS_REPLICA_PATH'])
+    if age is None or age >= current_app.config['REPORTS_REPLICA_MAX_AGE']:
+        refresh_reports_replica()
+
+@jobs.task('service.render_pdf')
+def render_service_pdf_job(service_id):
+    """Generar por adelantado el PDF de la versión actual de un servicio"""
+    service = db.session.get(Service, service_id)
+    if service is None:
+        return
+    documents.get_or_render(current_app.config['PRINT_CACHE_FOLDER'], documents.cache_key(service), 'pdf',
+                            lambda: render_service_pdf(service))
+
+@bp.route('/jobs')
+@login_required
+def jobs_list():
+    """Estado de la cola de trabajos en segundo plano"""
+    if current_user.role != 'admin':
+        flash('Solo los administradores pueden ver la cola de trabajos', 'warning')
+        return redirect(url_for('main.dashboard'))
+    status = request.args.get('status') or None
+    if status not in jobs.STATUSES:
+        status = None
+    connection = db.session.connection()
+    return render_template('jobs/list.html',
+                           counts=jobs.status_counts(connection),
+                           recent_jobs=jobs.recent(connection, status=status),
+                           status=status,
+                           now=time.time())
+
+@bp.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+def job_retry(job_id):
+    """Reintentar un trabajo fallido"""
+    if current_user.role != 'admin':
+        abort(403)
+    if jobs.retry(db.session.connection(), job_id):
+        db.session.commit()
+        g.enqueued_jobs.append(job_id)  # con JOBS_INLINE se ejecuta al cerrar esta respuesta
+        flash(f'Trabajo #{job_id} encolado de nuevo', 'success')
+    else:
+        flash('Solo se pueden reintentar trabajos fallidos', 'warning')
+    return redirect(url_for('main.jobs_list', status=jobs.FAILED))
+
+@bp.route('/api/jobs/<int:job_id>')
+@login_required
+def api_job(job_id):
+    """Estado de un trabajo (para consultar su avance desde el navegador)"""
+    job = jobs.get(db.session.connection(), job_id)
+    if job is None:
+        abort(404)
+    job.pop('payload', None)
+    return jsonify(job)
+
+@bp.cli.command('jobs-worker')
+@click.option('--threads', default=2, show_default=True, help='Hilos del pool')
+@click.option('--poll', default=1.0, show_default=True, help='Segundos de espera con la cola vacía')
+def jobs_worker_command(threads, poll):
+    """Ejecutar el pool de workers de la cola (Ctrl+C para detener)"""
+    pool = jobs.WorkerPool(db.engine, job_runner(current_app._get_current_object()), threads=threads, poll_interval=poll,
+                           visibility_timeout=current_app.config['JOBS_VISIBILITY_TIMEOUT'])
+    print(f"Worker {pool.worker_prefix} con {threads} hilos; Ctrl+C para detener")
+    pool.start().wait()
+
+@bp.cli.command('jobs-status')
+def jobs_status_command():
+    """Mostrar cuántos trabajos hay en cada estado y los últimos fallidos"""
+    connection = db.session.connection()
+    for status, total in jobs.status_counts(connection).items():
+        print(f"{status:<8} {total}")
+    for job in jobs.recent(connection, status=jobs.FAILED, limit=10):
+        error = (job['last_error'] or '').strip().splitlines()
+        print(f"#{job['id']} {job['name']} ({job['attempts']} intentos): {error[-1] if error else ''}")
+
+@bp.cli.command('jobs-purge')
+@click.option('--days', default=7, show_default=True, help='Antigüedad mínima de los trabajos terminados')
+def jobs_purge_command(days):
+    """Borrar los trabajos terminados con más de N días"""
+    deleted = jobs.purge(db.session.connection(), days * 24 * 3600)
+    db.session.commit()
+    print(f"Trabajos borrados: {deleted}")
 
 # ========== GESTIÓN DE ARCHIVOS ==========
 
-@app.route('/uploads/<filename>')
+@bp.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    """Servir archivos subidos"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """Servir archivos subidos (inmutables si están direccionados por contenido)"""
+    return file_serving.send_upload(
+        current_app.config['UPLOAD_FOLDER'], filename,
+        immutable_prefix=storage.OBJECTS_DIR + '/',
+        mutable_max_age=current_app.config['UPLOADS_MAX_AGE'],
+        sendfile_mode=current_app.config['UPLOADS_SENDFILE'],
+        accel_prefix=current_app.config['UPLOADS_ACCEL_PREFIX'],
+    )
+
+@bp.cli.command('evidence-variants')
+def evidence_variants_command():
+    """Generar las variantes de las fotos de evidencia que aún no las tienen"""
+    processed = failed = 0
+    # Las subidas en pending/ las procesa su propio trabajo (evidence.process_image)
+    pending = ServiceEvidence.query.filter(ServiceEvidence.variants.is_(None),
+                                           ~ServiceEvidence.filename.startswith(storage.PENDING_DIR + '/'))
+    for evidence in pending:
+        path = os.path.join(current_app.config['UPLOAD_FOLDER'], evidence.filename)
+        try:
+            evidence.variants = json.dumps(images.process_upload(path))
+            processed += 1
+        except (images.InvalidImage, FileNotFoundError) as e:
+            print(f"Evidencia {evidence.id} ({evidence.filename}): {e}")
+            failed += 1
+    db.session.commit()
+    print(f"Variantes generadas: {processed}, con error: {failed}")
+
+@bp.cli.command('storage-gc')
+def storage_gc_command():
+    """Recontar referencias y borrar archivos de evidencia huérfanos"""
+    connection = db.session.connection()
+    storage.recount(connection)
+    orphans = storage.collect_orphans(connection)
+    db.session.commit()
+    root = current_app.config['UPLOAD_FOLDER']
+    for filename, variants in orphans:
+        storage.delete_files(root, [filename, *images.variant_filenames(json.loads(variants) if variants else {})])
+    known = {digest for (digest,) in db.session.query(StoredFile.sha256)}
+    stray = storage.stray_files(root, known, min_age=3600)
+    storage.delete_files(root, stray)
+    print(f"Objetos sin referencias eliminados: {len(orphans)}, archivos sueltos: {len(stray)}")
 
 # ========== INICIALIZACIÓN ==========
 
 def init_db():
     """Inicializar base de datos con datos por defecto"""
-    # Crear tablas solo si no existen
-    db.create_all()
+    # Crear o actualizar el esquema con las migraciones pendientes
+    applied = migrations.upgrade(db.engine, db.metadata, current_app.config['DB_BACKUP_FOLDER'])
+    for migration in applied:
+        print(f"Migración {migration.version} aplicada: {migration.description}")
     
     # Crear usuario administrador por defecto solo si no existe
     if not User.query.filter_by(username='admin').first():
@@ -729,7 +1902,83 @@ def init_db():
     else:
         print("Sistema Sound-Maintenance iniciado correctamente")
 
+@bp.cli.command('init-db')
+def init_db_command():
+    """Aplicar las migraciones y crear el usuario administrador (una sola vez por despliegue)"""
+    init_db()
+
+@bp.cli.command('startup-time')
+@click.option('--runs', default=5, show_default=True, help='Arranques medidos')
+def startup_time_command(runs):
+    """Medir en procesos nuevos cuánto tarda en cargar la aplicación (wsgi.py)"""
+    script = ("import time; started = time.perf_counter(); import wsgi; "
+              "print(time.perf_counter() - started, wsgi.app.config['STARTUP_SECONDS'])")
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', script], cwd=current_app.root_path,
+                                capture_output=True, text=True, check=True).stdout.split()
+        samples.append((float(output[0]), float(output[1])))
+    total = sorted(sample[0] * 1000 for sample in samples)
+    factory = sorted(sample[1] * 1000 for sample in samples)
+    print(f"Carga completa (imports + create_app): mediana {total[len(total) // 2]:.1f} ms, "
+          f"mín {total[0]:.1f} ms, máx {total[-1]:.1f} ms")
+    print(f"create_app(): mediana {factory[len(factory) // 2]:.1f} ms")
+
+@bp.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Aplicar las migraciones pendientes (respalda la base antes de migrar)"""
+    applied = migrations.upgrade(db.engine, db.metadata, current_app.config['DB_BACKUP_FOLDER'])
+    for migration in applied:
+        print(f"Migración {migration.version} aplicada: {migration.description}")
+    if not applied:
+        print("El esquema ya está al día")
+
+@bp.cli.command('db-status')
+def db_status_command():
+    """Listar las migraciones aplicadas y pendientes"""
+    done = migrations.applied_versions(db.engine)
+    for migration in migrations.MIGRATIONS:
+        state = 'aplicada' if migration.version in done else 'pendiente'
+        print(f"{migration.version:>4}  {state:<10} {migration.description}")
+
+def plan_check_argument(endpoint, argument):
+    """Id de ejemplo para los argumentos de ruta al revisar planes de consulta"""
+    models = {'customer': Customer, 'inventory': Inventory, 'service': Service}
+    model = models.get(endpoint.rsplit('.', 1)[-1].split('_')[0])
+    if model is None or not argument.endswith('id'):
+        return None
+    return db.session.query(func.min(model.id)).scalar()
+
+@bp.cli.command('db-check-plans')
+def db_check_plans_command():
+    """Verificar con EXPLAIN QUERY PLAN que las consultas de las rutas usan índices"""
+    admin = User.query.filter_by(role='admin').first()
+    customer_id = db.session.query(func.min(Customer.id)).scalar() or 1
+    db.session.remove()
+    urls = query_plans.route_urls(current_app, plan_check_argument,
+                                  skip=('main.logout', 'main.uploaded_file', 'main.stream'))
+    # Filtros y orden de las tablas del lado del servidor
+    urls += [
+        '/api/services/datatable?columns[4][search][value]=Recibido',
+        f'/api/services/datatable?columns[1][search][value]={customer_id}',
+        '/api/services/datatable?columns[0][search][value]=2024-01-01|2024-12-31',
+        f'/api/equipment/search?q=pioneer&customer_id={customer_id}',
+        '/search?q=pioneer',
+        '/api/customers/options?q=go',
+        f'/api/equipment/options?q=pi&customer_id={customer_id}',
+    ]
+    findings, errors = query_plans.check_urls(current_app._get_current_object(), db.engine, urls, user_id=admin.id if admin else None)
+    for finding in findings:
+        print(f"[SCAN {finding.table}] {finding.url}")
+        print(f"    {finding.statement}")
+        for detail in finding.plan:
+            print(f"    -> {detail}")
+    for url in errors:
+        print(f"[ERROR] {url} respondió con error; sus consultas pueden no estar revisadas")
+    print(f"{len(urls)} rutas revisadas, {len(findings)} consultas sin índice")
+    if findings:
+        raise SystemExit(1)
+
 if __name__ == '__main__':
-    with app.app_context():
-        init_db()
-    app.run(debug=True)
\ No newline at end of file
+    # La base se inicializa aparte: flask --app app init-db
+    create_app().run(debug=True)
@@ -0,0 +1,43 @@
+"""
+Configuración de gunicorn: ``gunicorn -c gunicorn.conf.py``.
+
+La aplicación se carga una vez en el proceso maestro (``preload_app``) y los
+workers la heredan con el fork, compartiendo sus páginas de memoria. Antes del
+fork se congelan los objetos ya creados para que el recolector de basura no
+los toque (y no copie esas páginas en cada worker), y cada worker descarta las
+conexiones heredadas del maestro para abrir las suyas.
+"""
+import gc
+import multiprocessing
+import os
+import time
+
+wsgi_app = 'wsgi:app'
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True
+timeout = 60
+
+
+def when_ready(server):
+    from wsgi import app
+    server.log.info("Aplicación cargada en el maestro en %.1f ms", app.config['STARTUP_SECONDS'] * 1000)
+    gc.freeze()
+
+
+def pre_fork(server, worker):
+    worker.fork_started = time.perf_counter()
+
+
+def post_fork(server, worker):
+    from models.models import db
+    from wsgi import app
+    # Las conexiones del pool del maestro no se pueden compartir entre procesos
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    worker.log.info("Worker %s listo en %.1f ms", worker.pid,
+                    (time.perf_counter() - worker.fork_started) * 1000)
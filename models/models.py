@@ -1,6 +1,14 @@
+"""
+Modelos de la base de datos de Sound-Maintenance.
+
+Único módulo de modelos: ``db`` se crea sin aplicación y ``create_app()`` lo
+vincula con ``db.init_app``.
+"""
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import text
 from datetime import datetime
+import json
 import pytz
 
 # Configuración de zona horaria para Colombia
@@ -21,9 +29,6 @@ class User(UserMixin, db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ), onupdate=lambda: datetime.now(CO_TZ))
     
-    # Relaciones
-    services = db.relationship('Service', backref='technician', lazy=True)
-    
     def to_dict(self):
         return {
             'id': self.id,
@@ -37,6 +42,10 @@ class User(UserMixin, db.Model):
 class Customer(db.Model):
     """Modelo de clientes"""
     __tablename__ = 'customers'
+    __table_args__ = (
+        # Selector del formulario de servicios: prefijo del nombre sin distinguir mayúsculas
+        db.Index('ix_customers_name_nocase', text('name COLLATE NOCASE'), 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
@@ -47,10 +56,6 @@ class Customer(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ), onupdate=lambda: datetime.now(CO_TZ))
     
-    # Relaciones
-    equipment = db.relationship('Equipment', backref='owner', lazy=True)
-    services = db.relationship('Service', backref='customer', lazy=True)
-    
     def to_dict(self):
         return {
             'id': self.id,
@@ -64,6 +69,10 @@ class Customer(db.Model):
 class Equipment(db.Model):
     """Modelo de equipos de DJ"""
     __tablename__ = 'equipment'
+    __table_args__ = (
+        db.Index('ix_equipment_customer_id', 'customer_id'),
+        db.Index('ix_equipment_customer_name_nocase', 'customer_id', text('name COLLATE NOCASE'), 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
@@ -77,9 +86,6 @@ class Equipment(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ), onupdate=lambda: datetime.now(CO_TZ))
     
-    # Relaciones
-    services = db.relationship('Service', backref='equipment', lazy=True)
-    
     def to_dict(self):
         return {
             'id': self.id,
@@ -93,18 +99,84 @@ class Equipment(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+class StoredFile(db.Model):
+    """Archivo de evidencia guardado una sola vez por contenido (SHA-256)"""
+    __tablename__ = 'stored_files'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    filename = db.Column(db.String(255), nullable=False)  # objects/ab/<sha256>.<ext>
+    size = db.Column(db.Integer, nullable=False)  # bytes subidos
+    variants = db.Column(db.Text, nullable=True)  # JSON, igual que ServiceEvidence.variants
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # evidencias que lo usan
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ))
+
+class ServiceEvidence(db.Model):
+    """Modelo para evidencias fotográficas de servicios"""
+    __tablename__ = 'service_evidences'
+    __table_args__ = (
+        db.Index('ix_service_evidences_service_id', 'service_id'),
+        db.Index('ix_service_evidences_stored_file_id', 'stored_file_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
+    stored_file_id = db.Column(db.Integer, db.ForeignKey('stored_files.id'), nullable=True)  # NULL en fotos anteriores
+    filename = db.Column(db.String(255), nullable=False)
+    evidence_type = db.Column(db.String(50), nullable=False)  # recepcion, proceso, entrega
+    description = db.Column(db.Text, nullable=True)
+    variants = db.Column(db.Text, nullable=True)  # JSON: {variante: {filename, width, height, bytes}}
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ))
+    
+    stored_file = db.relationship('StoredFile')
+    
+    def variant_info(self):
+        return json.loads(self.variants) if self.variants else {}
+    
+    def variant_filename(self, name):
+        """Archivo de la variante (thumb, medium, print) o el original si no existe"""
+        return self.variant_info().get(name, {}).get('filename', self.filename)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'service_id': self.service_id,
+            'filename': self.filename,
+            'description': self.description,
+            'evidence_type': self.evidence_type,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
 class Service(db.Model):
     """Modelo de servicios de mantenimiento y reparación"""
     __tablename__ = 'services'
+    __table_args__ = (
+        db.Index('ix_services_customer_created', 'customer_id', 'created_at'),
+        db.Index('ix_services_technician_status', 'technician_id', 'status'),
+        db.Index('ix_services_status_created', 'status', 'created_at'),
+        db.Index('ix_services_created_at', 'created_at'),
+        db.Index('ix_services_equipment_id', 'equipment_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), nullable=False)
-    equipment_id = db.Column(db.Integer, db.ForeignKey('equipment.id'), nullable=False)
+    equipment_id = db.Column(db.Integer, db.ForeignKey('equipment.id'), nullable=True)  # Optional, can be manual entry
     technician_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     service_type = db.Column(db.String(50), nullable=False)  # mantenimiento, reparacion, revision
     description = db.Column(db.Text, nullable=False)
     status = db.Column(db.String(20), default='Recibido')  # Recibido, En proceso, Completado, Entregado
+    
+    # Equipment fields for manual entry (when equipment_id is null)
+    equipment_type = db.Column(db.String(100), nullable=True)
+    equipment_name = db.Column(db.String(200), nullable=True)
+    equipment_brand = db.Column(db.String(100), nullable=True)
+    equipment_model = db.Column(db.String(100), nullable=True)
+    equipment_serial = db.Column(db.String(100), nullable=True)
+    equipment_color = db.Column(db.String(50), nullable=True)
+    equipment_accessories = db.Column(db.Text, nullable=True)
+    equipment_condition = db.Column(db.Text, nullable=True)
     estimated_cost = db.Column(db.Float, default=0.0)
+    estimated_days = db.Column(db.Integer, default=3)
     final_cost = db.Column(db.Float, nullable=True)
     diagnosis = db.Column(db.Text, nullable=True)
     work_performed = db.Column(db.Text, nullable=True)
@@ -115,8 +187,18 @@ class Service(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ), onupdate=lambda: datetime.now(CO_TZ))
     
-    # Relaciones
+    # Relationships
     evidences = db.relationship('ServiceEvidence', backref='service', lazy=True, cascade='all, delete-orphan')
+    customer = db.relationship('Customer')
+    equipment = db.relationship('Equipment')
+    technician = db.relationship('User')
+    
+    @property
+    def equipment_label(self):
+        """Nombre del equipo registrado o, si no hay, el ingresado a mano"""
+        if self.equipment is not None:
+            return ' '.join(filter(None, (self.equipment.name, self.equipment.brand, self.equipment.model)))
+        return ' '.join(filter(None, (self.equipment_name, self.equipment_brand, self.equipment_model)))
     
     def to_dict(self):
         return {
@@ -135,30 +217,14 @@ class Service(db.Model):
             'completion_date': self.completion_date.isoformat() if self.completion_date else None
         }
 
-class ServiceEvidence(db.Model):
-    """Modelo para evidencias fotográficas de servicios"""
-    __tablename__ = 'service_evidences'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    service_id = db.Column(db.Integer, db.ForeignKey('services.id'), nullable=False)
-    filename = db.Column(db.String(255), nullable=False)
-    description = db.Column(db.String(500), nullable=True)
-    evidence_type = db.Column(db.String(20), default='before')  # before, during, after
-    uploaded_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ))
-    
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'service_id': self.service_id,
-            'filename': self.filename,
-            'description': self.description,
-            'evidence_type': self.evidence_type,
-            'uploaded_at': self.uploaded_at.isoformat() if self.uploaded_at else None
-        }
-
 class Inventory(db.Model):
     """Modelo de inventario de repuestos y accesorios"""
     __tablename__ = 'inventory'
+    __table_args__ = (
+        db.Index('ix_inventory_category', 'category'),
+        # Índice parcial que cubre el conteo de artículos con stock bajo
+        db.Index('ix_inventory_low_stock', 'stock', 'min_stock', sqlite_where=text('stock <= min_stock')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
@@ -193,6 +259,9 @@ class Inventory(db.Model):
 class InventoryMovement(db.Model):
     """Modelo para movimientos de inventario"""
     __tablename__ = 'inventory_movements'
+    __table_args__ = (
+        db.Index('ix_inventory_movements_inventory_created', 'inventory_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     inventory_id = db.Column(db.Integer, db.ForeignKey('inventory.id'), nullable=False)
@@ -206,7 +275,7 @@ class InventoryMovement(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(CO_TZ))
     
     # Relaciones
-    inventory_item = db.relationship('Inventory', backref='movements')
+    inventory_item = db.relationship('Inventory', backref=db.backref('movements', cascade='all, delete-orphan'))
     user = db.relationship('User', backref='inventory_movements')
     
     def to_dict(self):
@@ -221,4 +290,4 @@ class InventoryMovement(db.Model):
             'notes': self.notes,
             'created_by': self.created_by,
             'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+        }
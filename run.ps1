@@ -64,7 +64,7 @@ if (-not (Test-Path "instance")) {
 # Inicializar base de datos si se solicita
 if ($InitDB) {
     Write-Host "Inicializando base de datos..." -ForegroundColor Yellow
-    python -c 'from app import app, init_db; app.app_context().push(); init_db()'
+    python -m flask --app app init-db
     Write-Host "✓ Base de datos inicializada" -ForegroundColor Green
 }
 
@@ -91,7 +91,8 @@ if ($UseWaitress) {
     Write-Host "Iniciando servidor Waitress (Producción)..." -ForegroundColor Green
     Write-Host "Presiona Ctrl+C para detener el servidor" -ForegroundColor Yellow
     Write-Host ""
-    waitress-serve --host=$Host --port=$Port app:app
+    python -m flask --app app assets-build
+    waitress-serve --host=$Host --port=$Port wsgi:app
 } else {
     Write-Host "Iniciando servidor Flask (Desarrollo)..." -ForegroundColor Green
     Write-Host "Presiona Ctrl+C para detener el servidor" -ForegroundColor Yellow
@@ -61,7 +61,8 @@ Write-Host ""
 # Iniciar servidor
 if ($UseWaitress) {
     Write-Host "Iniciando Waitress (Producción)..." -ForegroundColor Green
-    waitress-serve --host=$Host --port=$Port app:app
+    python -m flask --app app assets-build
+    waitress-serve --host=$Host --port=$Port wsgi:app
 } else {
     Write-Host "Iniciando Flask (Desarrollo)..." -ForegroundColor Green
     $env:FLASK_APP = "app.py"
@@ -235,8 +235,34 @@ function updateServiceStatus(serviceId, status) {
             // Update status indicator
             updateStatusIndicator(serviceId, status);
         },
-        error: function() {
-            showAlert('danger', 'Error al actualizar el estado');
+        error: function(xhr) {
+            var message = xhr.responseJSON && xhr.responseJSON.error;
+            showAlert('danger', message || 'Error al actualizar el estado');
+        }
+    });
+}
+
+/**
+ * Update the status of several services at once (all or none)
+ */
+function updateServicesStatus(serviceIds, status) {
+    return $.ajax({
+        url: '/api/services/status',
+        method: 'POST',
+        contentType: 'application/json',
+        data: JSON.stringify({
+            service_ids: serviceIds,
+            status: status
+        }),
+        success: function(response) {
+            showAlert('success', response.services.length + ' servicios actualizados');
+            response.services.forEach(function(service) {
+                updateStatusIndicator(service.id, service.status);
+            });
+        },
+        error: function(xhr) {
+            var message = xhr.responseJSON && xhr.responseJSON.error;
+            showAlert('danger', message || 'Error al actualizar el estado');
         }
     });
 }
@@ -300,6 +326,114 @@ function searchInventory(query) {
     });
 }
 
+/**
+ * Customer picker page: names starting with query, after the given cursor
+ */
+function customerOptions(query, after) {
+    return $.ajax({
+        url: '/api/customers/options',
+        method: 'GET',
+        data: { q: query, after: after || '' }
+    });
+}
+
+/**
+ * Equipment picker page for one customer
+ */
+function equipmentOptions(query, customerId, after) {
+    return $.ajax({
+        url: '/api/equipment/options',
+        method: 'GET',
+        data: {
+            q: query,
+            customer_id: customerId,
+            after: after || ''
+        }
+    });
+}
+
+/**
+ * Typeahead picker over a paginated options endpoint
+ *
+ * options.input: visible text field, options.hidden: field that receives the id,
+ * options.fetchPage(query, after): request returning {results, next_cursor},
+ * options.label(item): option text, options.onSelect(item): optional callback
+ */
+function initPicker(options) {
+    var input = $(options.input);
+    var hidden = $(options.hidden);
+    var menu = $('<div class="dropdown-menu w-100 overflow-auto" style="max-height: 300px;"></div>').insertAfter(input);
+    var timer = null;
+    var request = null;
+    var nextCursor = null;
+
+    function load(after) {
+        if (request) {
+            request.abort();
+        }
+        request = options.fetchPage(input.val(), after).done(function(data) {
+            if (!after) {
+                menu.empty();
+            }
+            menu.find('.picker-more').remove();
+            data.results.forEach(function(item) {
+                $('<button type="button" class="dropdown-item picker-option"></button>')
+                    .text(options.label(item)).data('item', item).appendTo(menu);
+            });
+            if (!menu.children().length) {
+                menu.append('<span class="dropdown-item-text text-muted">Sin resultados</span>');
+            }
+            nextCursor = data.next_cursor;
+            if (nextCursor) {
+                menu.append('<button type="button" class="dropdown-item picker-more text-soundlab-fuschia">Cargar más...</button>');
+            }
+            menu.addClass('show');
+        });
+    }
+
+    input.attr('autocomplete', 'off');
+    input.on('input', function() {
+        hidden.val('').trigger('change');
+        clearTimeout(timer);
+        timer = setTimeout(function() { load(null); }, 250);
+    });
+    input.on('focus', function() {
+        if (!hidden.val()) {
+            load(null);
+        }
+    });
+    input.on('blur', function() {
+        menu.removeClass('show');
+    });
+
+    // mousedown keeps the focus in the input (blur would close the menu first)
+    menu.on('mousedown', '.picker-option', function(e) {
+        e.preventDefault();
+        var item = $(this).data('item');
+        input.val(options.label(item));
+        hidden.val(item.id).trigger('change');
+        menu.removeClass('show');
+        if (options.onSelect) {
+            options.onSelect(item);
+        }
+    });
+    menu.on('mousedown', '.picker-more', function(e) {
+        e.preventDefault();
+        load(nextCursor);
+    });
+
+    return {
+        clear: function() {
+            input.val('');
+            hidden.val('');
+            menu.removeClass('show').empty();
+        },
+        enable: function(enabled) {
+            input.prop('disabled', !enabled);
+        }
+    };
+}
+
 /**
  * Utility Functions
  */
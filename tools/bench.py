@@ -0,0 +1,359 @@
+"""
+Benchmark repetible de todas las rutas con el cliente de pruebas de Flask.
+
+Trabaja sobre una copia de la base (normalmente generada con ``tools.seed``)
+en una carpeta temporal, así que cada corrida parte de los mismos datos y las
+escrituras (altas con fotos, cambios de estado, movimientos de stock) no
+ensucian la base original. Para cada escenario mide la latencia (p50, p90,
+p99), las sentencias SQL por petición y el pico de memoria asignada
+(tracemalloc, en pasadas aparte para no inflar las latencias).
+
+    python -m tools.bench --database instance/seed.db --save instance/bench-baseline.json
+    python -m tools.bench --database instance/seed.db --compare instance/bench-baseline.json
+
+Con ``--compare`` termina con código 1 si algún escenario hace más consultas
+que la línea base, o si su p90 o su pico de memoria crecen más que la
+tolerancia.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from flask import url_for
+from PIL import Image
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from app import asset_url, create_app, init_db, job_runner
+from models.models import db
+from utils import images, jobs
+
+# Rutas que no se miden con GET genérico: salida, archivos y recursos con huella (escenario propio),
+# exportaciones completas (minutos con 500.000 servicios), el stream SSE (no termina)
+# y el selector de equipos (necesita un cliente: escenario propio)
+SKIP_ENDPOINTS = {'static', 'main.logout', 'main.uploaded_file', 'main.asset', 'main.data_export', 'main.stream',
+                  'main.api_equipment_options'}
+ID_TABLES = (('job', 'jobs'), ('api_job', 'jobs'), ('customer', 'customers'),
+             ('inventory', 'inventory'), ('service', 'services'))
+SAMPLE_IDS = 500
+
+
+@dataclass
+class Scenario:
+    """Petición a medir; ``request(client, rng, iteration)`` devuelve la respuesta"""
+    name: str
+    request: Callable
+
+
+# ========== ESCENARIOS ==========
+
+def sample_ids(connection, table, rng):
+    total = connection.execute(text(f'SELECT max(id) FROM {table}')).scalar() or 0
+    return [rng.randint(1, total) for _ in range(SAMPLE_IDS)] if total else []
+
+
+def get_scenarios(app, ids):
+    """Un escenario por cada ruta GET de la aplicación, con ids al azar de la base"""
+    scenarios = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.endpoint):
+        if rule.endpoint in SKIP_ENDPOINTS or 'GET' not in rule.methods:
+            continue
+        short = rule.endpoint.rsplit('.', 1)[-1]
+        table = next((table for prefix, table in ID_TABLES if short.startswith(prefix)), None)
+        if rule.arguments and (not all(argument.endswith('id') for argument in rule.arguments) or not ids.get(table)):
+            # Sin ids de prueba para sus argumentos: no se puede armar la URL
+            print(f'Sin escenario: {rule.endpoint} ({rule.rule})')
+            continue
+
+        def request(client, rng, iteration, endpoint=rule.endpoint, arguments=tuple(rule.arguments), table=table):
+            with app.test_request_context():
+                url = url_for(endpoint, **{argument: rng.choice(ids[table]) for argument in arguments})
+            return client.get(url)
+
+        scenarios.append(Scenario(f'GET {rule.rule}', request))
+
+    def fixed(name, url):
+        scenarios.append(Scenario(name, lambda client, rng, iteration: client.get(url)))
+
+    fixed('GET /api/services/datatable (estado)', '/api/services/datatable?columns[4][search][value]=En proceso')
+    fixed('GET /api/services/datatable (orden costo)', '/api/services/datatable?order[0][column]=5&order[0][dir]=desc')
+    fixed('GET /api/services/datatable (página 200)', '/api/services/datatable?start=5000&length=25')
+    fixed('GET /search (pioneer)', '/search?q=pioneer')
+    fixed('GET /api/customers/search', '/api/customers/search?q=gomez')
+    fixed('GET /api/customers/options (prefijo)', '/api/customers/options?q=go')
+    if ids.get('customers'):
+        scenarios.append(Scenario('GET /api/equipment/options', lambda client, rng, iteration: client.get(
+            f"/api/equipment/options?customer_id={rng.choice(ids['customers'])}")))
+    fixed('GET /data/export/inventory.csv', '/data/export/inventory.csv')
+    with app.test_request_context():
+        fixed('GET /assets/<css>', asset_url('css/soundlab.css'))
+    if ids.get('photos'):
+        scenarios.append(Scenario('GET /uploads/<thumb>', lambda client, rng, iteration: client.get(
+            f"/uploads/{rng.choice(ids['photos'])}")))
+    return scenarios
+
+
+def photo(rng):
+    """JPEG pequeño y distinto en cada iteración (no se deduplica)"""
+    image = Image.new('RGB', (1200, 900), tuple(rng.randint(0, 255) for _ in range(3)))
+    image.putpixel((rng.randint(0, 1199), rng.randint(0, 899)), (rng.randint(0, 255), 0, 0))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    buffer.seek(0)
+    return buffer
+
+
+def write_scenarios(ids):
+    def customer_create(client, rng, iteration):
+        return client.post('/customers/create', data={
+            'name': f'Cliente benchmark {iteration}', 'email': f'bench{iteration}-{rng.random()}@example.com',
+            'phone': '300 000 0000'})
+
+    def service_create(client, rng, iteration):
+        return client.post('/services/create', content_type='multipart/form-data', data={
+            'customer_id': str(rng.choice(ids['customers'])), 'service_type': 'reparacion',
+            'description': 'No enciende', 'equipment_type': 'controlador', 'equipment_name': 'DDJ-SX3',
+            'equipment_brand': 'Pioneer', 'estimated_cost': '150000',
+            'photos[]': [(photo(rng), 'recepcion-1.jpg'), (photo(rng), 'recepcion-2.jpg')]})
+
+    def service_update(client, rng, iteration):
+        service_id = rng.choice(ids['services'])
+        return client.post(f'/services/{service_id}/update', data={
+            'customer_id': '1', 'service_type': 'reparacion', 'description': 'Actualizado en benchmark',
+            'status': rng.choice(('En proceso', 'Completado')), 'estimated_cost': '120000',
+            'diagnosis': 'Fader dañado', 'solution': 'Cambio de fader'})
+
+    def stock_movement(client, rng, iteration):
+        return client.post(f"/inventory/{rng.choice(ids['inventory'])}/stock-movement",
+                           data={'movement_type': 'entrada', 'quantity': '3', 'reason': 'Compra'})
+
+    def stock_batch(client, rng, iteration):
+        return client.post('/api/inventory/movements', json={'movements': [
+            {'item_id': rng.choice(ids['inventory']), 'movement_type': 'entrada', 'quantity': 2}
+            for _ in range(10)]})
+
+    scenarios = [Scenario('POST /customers/create', customer_create)]
+    if ids.get('customers'):
+        scenarios.append(Scenario('POST /services/create (2 fotos)', service_create))
+    if ids.get('services'):
+        scenarios.append(Scenario('POST /services/<id>/update', service_update))
+    if ids.get('inventory'):
+        scenarios.append(Scenario('POST /inventory/<id>/stock-movement', stock_movement))
+        scenarios.append(Scenario('POST /api/inventory/movements (10)', stock_batch))
+    return scenarios
+
+
+# ========== MEDICIÓN ==========
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        event.listen(Engine, 'after_cursor_execute', self.increment)
+
+    def increment(self, *args):
+        self.count += 1
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+
+def measure(name, call, iterations, memory_iterations, counter, rng):
+    latencies, statements, errors = [], [], []
+    for iteration in range(-1, iterations):  # la primera es de calentamiento
+        before = counter.count
+        started = time.perf_counter()
+        response = call(rng, iteration)
+        response.get_data()  # las respuestas en streaming se generan al leerlas
+        response.close()
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            errors.append(response.status_code)
+        if iteration >= 0:
+            latencies.append(elapsed * 1000)
+            statements.append(counter.count - before)
+    peak = 0
+    for iteration in range(memory_iterations):
+        tracemalloc.start()
+        response = call(rng, iterations + iteration)
+        response.get_data()
+        response.close()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p90_ms': round(percentile(latencies, 0.90), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'queries': max(statements),
+        'peak_kb': round(peak / 1024),
+        'errors': sorted(set(errors)),
+    }
+
+
+def copy_database(source, target):
+    """Copia consistente aunque la base esté en modo WAL"""
+    with sqlite3.connect(source) as origin, sqlite3.connect(target) as copy:
+        origin.backup(copy)
+
+
+def copy_photos(source_root, target_root, database):
+    """Copia solo los archivos de fotos que la base referencia"""
+    names = []
+    with sqlite3.connect(database) as connection:
+        for filename, variants in connection.execute('SELECT filename, variants FROM stored_files'):
+            names.append(filename)
+            names.extend(images.variant_filenames(json.loads(variants) if variants else {}))
+    for name in names:
+        source = os.path.join(source_root, *name.split('/'))
+        if os.path.exists(source):
+            target = os.path.join(target_root, *name.split('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(source, target)
+    return [name for name in names if '_thumb' in name]
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='soundlab-bench-')
+    try:
+        database = os.path.join(workdir, 'bench.db')
+        copy_database(args.database, database)
+        uploads = os.path.join(workdir, 'uploads')
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}',
+            'UPLOAD_FOLDER': uploads,
+            'PRINT_CACHE_FOLDER': os.path.join(workdir, 'print_cache'),
+            'DB_BACKUP_FOLDER': os.path.join(workdir, 'backups'),
+            'JOBS_INLINE': False,  # los trabajos se miden aparte, al final
+            'TESTING': True,
+        })
+        os.makedirs(uploads, exist_ok=True)
+        photos = copy_photos(args.uploads or os.path.join(app.static_folder, 'uploads'), uploads, database)
+        rng = random.Random(args.seed)
+        with app.app_context():
+            init_db()
+            with db.engine.connect() as connection:
+                ids = {table: sample_ids(connection, table, rng)
+                       for table in ('customers', 'inventory', 'services', 'jobs')}
+                ids['photos'] = photos
+                rows = {table: connection.execute(text(f'SELECT count(*) FROM {table}')).scalar()
+                        for table in ('customers', 'services', 'service_evidences', 'inventory')}
+            engine = db.engine
+
+        client = app.test_client()
+        login = client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+        if login.status_code != 302:
+            sys.exit('No se pudo iniciar sesión como admin/admin123')
+
+        counter = StatementCounter()
+        results = {}
+        scenarios = get_scenarios(app, ids) + write_scenarios(ids)
+        for scenario in scenarios:
+            if args.only and args.only not in scenario.name:
+                continue
+            results[scenario.name] = measure(
+                scenario.name, lambda rng, iteration, scenario=scenario: scenario.request(client, rng, iteration),
+                args.iterations, args.memory_iterations, counter, rng)
+            print(format_row(scenario.name, results[scenario.name]), flush=True)
+
+        # Trabajos encolados por las escrituras (fotos y PDFs), uno por uno
+        latencies = []
+        runner = job_runner(app)
+        while True:
+            started = time.perf_counter()
+            if not jobs.run_one(engine, runner, 'bench', app.config['JOBS_VISIBILITY_TIMEOUT']):
+                break
+            latencies.append((time.perf_counter() - started) * 1000)
+        if latencies:
+            results['jobs (trabajo en segundo plano)'] = {
+                'p50_ms': round(percentile(latencies, 0.5), 2), 'p90_ms': round(percentile(latencies, 0.9), 2),
+                'p99_ms': round(percentile(latencies, 0.99), 2), 'mean_ms': round(statistics.fmean(latencies), 2),
+                'queries': None, 'peak_kb': None, 'errors': [],
+            }
+            print(format_row('jobs (trabajo en segundo plano)', results['jobs (trabajo en segundo plano)']))
+        return {'meta': {'database': args.database, 'rows': rows, 'iterations': args.iterations,
+                         'seed': args.seed, 'python': sys.version.split()[0],
+                         'created': time.strftime('%Y-%m-%d %H:%M:%S')},
+                'routes': results}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def format_row(name, result):
+    queries = '-' if result['queries'] is None else result['queries']
+    peak = '-' if result['peak_kb'] is None else result['peak_kb']
+    errors = f"  ERRORES {result['errors']}" if result['errors'] else ''
+    return (f"{name[:52]:<52} p50 {result['p50_ms']:>8.1f} ms  p90 {result['p90_ms']:>8.1f} ms  "
+            f"p99 {result['p99_ms']:>8.1f} ms  sql {queries:>4}  mem {peak:>7} KB{errors}")
+
+
+# ========== COMPARACIÓN ==========
+
+def compare(results, baseline, tolerance, memory_tolerance):
+    """Lista de regresiones de ``results`` frente a ``baseline``"""
+    regressions = []
+    for name, current in results['routes'].items():
+        if current['errors']:
+            regressions.append(f'{name}: respondió con error {current["errors"]}')
+        previous = baseline['routes'].get(name)
+        if previous is None:
+            continue
+        if current['queries'] is not None and previous['queries'] is not None \
+                and current['queries'] > previous['queries']:
+            regressions.append(f'{name}: {current["queries"]} consultas (antes {previous["queries"]})')
+        limit = previous['p90_ms'] * (1 + tolerance) + 2  # 2 ms de margen para rutas muy rápidas
+        if current['p90_ms'] > limit:
+            regressions.append(f'{name}: p90 {current["p90_ms"]:.1f} ms (antes {previous["p90_ms"]:.1f} ms)')
+        if current['peak_kb'] is not None and previous['peak_kb'] is not None \
+                and current['peak_kb'] > previous['peak_kb'] * (1 + memory_tolerance) + 64:
+            regressions.append(f'{name}: pico de memoria {current["peak_kb"]} KB (antes {previous["peak_kb"]} KB)')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de todas las rutas contra una copia de la base')
+    parser.add_argument('--database', default='instance/seed.db', help='Base SQLite (se trabaja sobre una copia)')
+    parser.add_argument('--uploads', help='Carpeta de fotos de la base (por defecto static/uploads)')
+    parser.add_argument('--iterations', type=int, default=20, help='Peticiones medidas por escenario')
+    parser.add_argument('--memory-iterations', type=int, default=2, help='Pasadas con tracemalloc por escenario')
+    parser.add_argument('--seed', type=int, default=1, help='Semilla para elegir ids y datos')
+    parser.add_argument('--only', help='Medir solo los escenarios cuyo nombre contenga este texto')
+    parser.add_argument('--output', help='Guardar los resultados en este JSON')
+    parser.add_argument('--save', help='Guardar los resultados como línea base')
+    parser.add_argument('--compare', help='Línea base contra la que comparar')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='Aumento tolerado del p90 (0.5 = 50%%)')
+    parser.add_argument('--memory-tolerance', type=float, default=0.5, help='Aumento tolerado del pico de memoria')
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.database):
+        sys.exit(f'{args.database} no existe; genérela con python -m tools.seed')
+
+    results = run(args)
+    for path in filter(None, (args.output, args.save)):
+        with open(path, 'w', encoding='utf-8') as target:
+            json.dump(results, target, indent=2, ensure_ascii=False)
+        print(f'Resultados guardados en {path}')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as source:
+            baseline = json.load(source)
+        regressions = compare(results, baseline, args.tolerance, args.memory_tolerance)
+        for regression in regressions:
+            print(f'[REGRESIÓN] {regression}')
+        print(f'{len(results["routes"])} escenarios comparados con {args.compare}, {len(regressions)} regresiones')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""
+Generador de datos sintéticos para pruebas de carga y benchmarks.
+
+Llena una base nueva con volúmenes realistas (por defecto 100.000 clientes,
+500.000 servicios con sus evidencias y 20.000 artículos de inventario). Los
+datos salen de un generador con semilla fija, así que dos bases generadas con
+los mismos parámetros son idénticas.
+
+    python -m tools.seed --database instance/seed.db
+    python -m tools.seed --database instance/seed.db --scale 0.05
+
+Las filas se insertan por lotes sin pasar por el ORM; al final se reconstruyen
+el índice de búsqueda, los contadores del dashboard, la valoración del
+inventario y los conteos de referencias de las fotos. Las fotos son un grupo
+pequeño de imágenes generadas (con sus variantes) que comparten todas las
+evidencias, como ocurre con el almacenamiento por contenido.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from PIL import Image, ImageDraw
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+
+from app import create_app, init_db
+from models.models import CO_TZ, db
+from utils import analytics, counters, images, search, storage, valuation
+
+BATCH_SIZE = 5000
+
+FIRST_NAMES = ('Juan', 'María', 'Carlos', 'Ana', 'Andrés', 'Laura', 'Felipe', 'Camila', 'Santiago', 'Valentina',
+               'Diego', 'Daniela', 'Julián', 'Natalia', 'Sebastián', 'Paula', 'Mateo', 'Sofía', 'Alejandro', 'Juliana')
+LAST_NAMES = ('Gómez', 'Rodríguez', 'Martínez', 'López', 'García', 'Hernández', 'Ramírez', 'Torres', 'Díaz',
+              'Moreno', 'Vargas', 'Rojas', 'Castro', 'Ortiz', 'Jiménez', 'Suárez', 'Muñoz', 'Restrepo')
+CITIES = ('Bogotá', 'Medellín', 'Cali', 'Barranquilla', 'Bucaramanga', 'Pereira', 'Cartagena')
+EQUIPMENT = {
+    'consola': (('Pioneer', 'DJM-900NXS2'), ('Allen & Heath', 'Xone:96'), ('Behringer', 'X32')),
+    'controlador': (('Pioneer', 'DDJ-SX3'), ('Denon', 'Prime 4'), ('Numark', 'Mixtrack Pro')),
+    'luces': (('Chauvet', 'Intimidator Spot'), ('ADJ', 'Mega Par'), ('Martin', 'Rush MH')),
+    'sonido': (('JBL', 'EON615'), ('QSC', 'K12.2'), ('Electro-Voice', 'ZLX-15P')),
+    'humo': (('Antari', 'Z-1200'), ('Chauvet', 'Hurricane 1800')),
+    'otros': (('Technics', 'SL-1200'), ('Rane', 'Seventy')),
+}
+PROBLEMS = ('No enciende', 'Fader con ruido', 'Canal izquierdo sin audio', 'Jog wheel no responde',
+            'Pantalla sin imagen', 'Puerto USB dañado', 'Ventilador ruidoso', 'Mantenimiento preventivo',
+            'Crossfader desgastado', 'Potenciómetros sucios', 'Fuente de poder quemada', 'Conector XLR suelto')
+PARTS = {
+    'repuestos': ('Fader', 'Crossfader', 'Potenciómetro', 'Jog wheel', 'Fuente de poder', 'Pantalla'),
+    'cables': ('Cable XLR', 'Cable RCA', 'Cable USB', 'Cable de poder', 'Cable TRS'),
+    'conectores': ('Conector XLR', 'Jack 1/4', 'Conector RCA', 'Conector Speakon'),
+    'accesorios': ('Perilla', 'Tapa', 'Estuche', 'Soporte'),
+    'herramientas': ('Cautín', 'Multímetro', 'Destornillador', 'Limpiador de contactos'),
+    'consumibles': ('Estaño', 'Grasa de fader', 'Alcohol isopropílico', 'Fusible'),
+}
+STATUSES = ('Recibido', 'En proceso', 'Completado', 'Entregado')
+EVIDENCE_TYPES = ('recepcion', 'proceso', 'entrega')
+
+
+def batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert(connection, table_name, rows):
+    """Inserta ``rows`` por lotes con ``executemany`` y devuelve cuántas filas fueron"""
+    table = db.metadata.tables[table_name]
+    total = 0
+    for batch in batches(rows):
+        connection.execute(table.insert(), batch)
+        total += len(batch)
+    return total
+
+
+# ========== FILAS ==========
+
+def person(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+
+def customer_rows(rng, count, now):
+    for i in range(1, count + 1):
+        created = now - timedelta(days=rng.uniform(0, 1095))
+        yield {
+            'name': person(rng),
+            'email': f'cliente{i}@example.com' if rng.random() < 0.7 else None,
+            'phone': f'3{rng.randint(0, 2)}{rng.randint(0, 9)} {rng.randint(100, 999)} {rng.randint(1000, 9999)}',
+            'address': f'Calle {rng.randint(1, 200)} # {rng.randint(1, 99)}-{rng.randint(1, 99)}, {rng.choice(CITIES)}',
+            'notes': None,
+            'created_at': created,
+            'updated_at': created,
+        }
+
+
+def equipment_rows(rng, customer_ids, now, owners):
+    """Entre cero y dos equipos por cliente; ``owners`` recibe los ids de equipo de cada cliente"""
+    next_id = 1
+    for customer_id in customer_ids:
+        for _ in range(rng.choice((0, 0, 1, 1, 1, 2))):
+            category = rng.choice(tuple(EQUIPMENT))
+            brand, model = rng.choice(EQUIPMENT[category])
+            owners.setdefault(customer_id, []).append(next_id)
+            next_id += 1
+            created = now - timedelta(days=rng.uniform(0, 1095))
+            yield {
+                'customer_id': customer_id, 'name': f'{brand} {model}', 'brand': brand, 'model': model,
+                'serial_number': f'SN{rng.randint(10 ** 7, 10 ** 8 - 1)}', 'category': category,
+                'description': None, 'purchase_date': None, 'created_at': created, 'updated_at': created,
+            }
+
+
+def service_rows(rng, count, customer_count, technician_ids, owners, now):
+    for _ in range(count):
+        customer_id = rng.randint(1, customer_count)
+        age = rng.uniform(0, 730)
+        created = now - timedelta(days=age)
+        # Lo reciente sigue en el taller; lo antiguo ya se entregó
+        status = rng.choices(STATUSES, weights=(6, 8, 4, 2) if age < 14 else (1, 1, 8, 90))[0]
+        equipment_id = rng.choice(owners[customer_id]) if customer_id in owners and rng.random() < 0.6 else None
+        category = rng.choice(tuple(EQUIPMENT))
+        brand, model = rng.choice(EQUIPMENT[category])
+        estimated = round(rng.uniform(50, 900)) * 1000.0
+        done = status in ('Completado', 'Entregado')
+        yield {
+            'customer_id': customer_id, 'equipment_id': equipment_id, 'technician_id': rng.choice(technician_ids),
+            'service_type': rng.choice(('mantenimiento', 'reparacion', 'revision')),
+            'description': rng.choice(PROBLEMS), 'status': status,
+            'equipment_type': None if equipment_id else category,
+            'equipment_name': None if equipment_id else f'{brand} {model}',
+            'equipment_brand': None if equipment_id else brand,
+            'equipment_model': None if equipment_id else model,
+            'equipment_serial': None, 'equipment_color': None, 'equipment_accessories': None,
+            'equipment_condition': None,
+            'estimated_cost': estimated, 'estimated_days': rng.randint(1, 10),
+            'final_cost': estimated * rng.uniform(0.8, 1.3) if done else None,
+            'diagnosis': 'Revisión completa del equipo' if status != 'Recibido' else None,
+            'work_performed': 'Reparación y limpieza general' if done else None,
+            'parts_used': None,
+            'start_date': created + timedelta(days=1) if status != 'Recibido' else None,
+            'completion_date': created + timedelta(days=3) if done else None,
+            'delivery_date': created + timedelta(days=5) if status == 'Entregado' else None,
+            'created_at': created,
+            'updated_at': created + timedelta(days=5 if done else 0),
+        }
+
+
+def evidence_rows(rng, service_count, photos, now):
+    for service_id in range(1, service_count + 1):
+        for _ in range(rng.choice((0, 1, 1, 2, 3))):
+            stored_id, filename, variants = rng.choice(photos)
+            yield {
+                'service_id': service_id, 'stored_file_id': stored_id, 'filename': filename,
+                'evidence_type': rng.choice(EVIDENCE_TYPES), 'description': None, 'variants': variants,
+                'created_at': now,
+            }
+
+
+def inventory_rows(rng, count, now):
+    for _ in range(count):
+        category = rng.choice(tuple(PARTS))
+        brand = rng.choice([brand for models in EQUIPMENT.values() for brand, _ in models])
+        created = now - timedelta(days=rng.uniform(0, 1095))
+        yield {
+            'name': f'{rng.choice(PARTS[category])} {brand}', 'description': None, 'category': category,
+            'brand': brand, 'model': f'{rng.choice("ABCDEFGH")}{rng.randint(100, 999)}',
+            'stock': rng.randint(0, 60), 'min_stock': rng.choice((2, 5, 5, 10)),
+            'price': round(rng.uniform(2, 400)) * 1000.0,
+            'supplier': rng.choice(('Audiotek', 'ElectroPartes', 'DJ Supply', 'Importadora Sonido', None)),
+            'location': f'Estante {rng.choice("ABCDEF")}{rng.randint(1, 12)}',
+            'created_at': created, 'updated_at': created,
+        }
+
+
+# ========== FOTOS ==========
+
+def photo_pool(connection, rng, root, count, now):
+    """Genera ``count`` fotos con sus variantes y devuelve ``(stored_file_id, filename, variants)``"""
+    pool = []
+    for index in range(count):
+        image = Image.new('RGB', (1600, 1200), tuple(rng.randint(0, 255) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(12):
+            x, y = rng.randint(0, 1500), rng.randint(0, 1100)
+            draw.rectangle((x, y, x + rng.randint(50, 400), y + rng.randint(50, 300)),
+                           fill=tuple(rng.randint(0, 255) for _ in range(3)))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        buffer.seek(0)
+        temp_path, digest, size = storage.stream_to_temp(buffer, root)
+        name = storage.object_name(digest, 'jpg')
+        path = storage.place_object(temp_path, root, name)
+        variants = json.dumps(images.process_upload(path, name_prefix=name.rsplit('/', 1)[0] + '/'))
+        table = db.metadata.tables['stored_files']
+        stored_id = connection.execute(
+            table.insert().values(sha256=digest, filename=name, size=size, variants=variants,
+                                  ref_count=0, created_at=now)).inserted_primary_key[0]
+        pool.append((stored_id, name, variants))
+    return pool
+
+
+# ========== PRINCIPAL ==========
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Llenar una base nueva con datos sintéticos')
+    parser.add_argument('--database', default='instance/seed.db', help='Archivo SQLite a crear')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplica todos los volúmenes')
+    parser.add_argument('--customers', type=int, help='Clientes (por defecto 100.000 × escala)')
+    parser.add_argument('--services', type=int, help='Servicios (por defecto 500.000 × escala)')
+    parser.add_argument('--inventory', type=int, help='Artículos (por defecto 20.000 × escala)')
+    parser.add_argument('--technicians', type=int, default=8)
+    parser.add_argument('--photos', type=int, default=24, help='Fotos distintas que comparten las evidencias')
+    parser.add_argument('--seed', type=int, default=1, help='Semilla del generador')
+    parser.add_argument('--force', action='store_true', help='Borrar la base si ya existe')
+    args = parser.parse_args(argv)
+
+    customers = args.customers if args.customers is not None else max(1, int(100_000 * args.scale))
+    services = args.services if args.services is not None else int(500_000 * args.scale)
+    inventory = args.inventory if args.inventory is not None else int(20_000 * args.scale)
+
+    path = os.path.abspath(args.database)
+    if os.path.exists(path):
+        if not args.force:
+            sys.exit(f'{args.database} ya existe; use --force para reemplazarla')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    rng = random.Random(args.seed)
+    now = datetime.now(CO_TZ).replace(tzinfo=None)
+    started = time.perf_counter()
+
+    def step(message, function):
+        step_started = time.perf_counter()
+        result = function()
+        print(f'{message}: {len(result) if isinstance(result, list) else result} '
+              f'({time.perf_counter() - step_started:.1f} s)')
+        return result
+
+    with app.app_context():
+        init_db()
+        with db.engine.begin() as connection:
+            technician_ids = [1]
+            for i in range(1, args.technicians + 1):
+                technician_ids.append(connection.execute(db.metadata.tables['users'].insert().values(
+                    username=f'tecnico{i}', email=f'tecnico{i}@soundlab.com',
+                    password_hash=generate_password_hash(f'tecnico{i}'), role='technician',
+                    is_active=True, created_at=now, updated_at=now)).inserted_primary_key[0])
+            first_customer = connection.execute(text('SELECT coalesce(max(id), 0) FROM customers')).scalar() + 1
+            owners = {}
+            step('Clientes', lambda: insert(connection, 'customers', customer_rows(rng, customers, now)))
+            customer_ids = range(first_customer, first_customer + customers)
+            step('Equipos', lambda: insert(connection, 'equipment', equipment_rows(rng, customer_ids, now, owners)))
+            customer_count = first_customer + customers - 1
+            step('Servicios', lambda: insert(connection, 'services', service_rows(
+                rng, services, customer_count, technician_ids, owners, now)))
+            photos = step('Fotos', lambda: photo_pool(connection, rng, app.config['UPLOAD_FOLDER'], args.photos, now))
+            step('Evidencias', lambda: insert(connection, 'service_evidences', evidence_rows(rng, services, photos, now)))
+            step('Inventario', lambda: insert(connection, 'inventory', inventory_rows(rng, inventory, now)))
+
+            step('Índice de búsqueda', lambda: search.rebuild(connection))
+            step('Contadores', lambda: len(counters.reconcile(connection)))
+            step('Valoración', lambda: valuation.reconcile(connection, now.date()) or 'ok')
+            step('Referencias de fotos', lambda: storage.recount(connection) or 'ok')
+            step('Analítica', lambda: analytics.rebuild(connection) or 'ok')
+        with db.engine.begin() as connection:
+            connection.execute(text('ANALYZE'))  # estadísticas para el planificador
+    print(f'Base {args.database} generada en {time.perf_counter() - started:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
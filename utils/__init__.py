@@ -0,0 +1 @@
+"""Utilidades compartidas de Sound-Maintenance (Soundlab - La Casa del DJ)."""
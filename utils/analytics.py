@@ -0,0 +1,209 @@
+"""
+Analítica de servicios: tiempos de entrega, cumplimiento, ingresos y rendimiento por técnico.
+
+La tabla ``service_facts`` tiene una fila por servicio cerrado (con
+``completion_date``): su mes de cierre, las horas desde la recepción, si se
+cerró dentro de ``estimated_days`` y el ingreso (costo final o estimado). Se
+mantiene al día en la misma transacción que el cambio: los flush del ORM por
+``register_hooks`` y las escrituras directas (cambio de estado, importación)
+llamando a ``sync``/``sync_after``. Cada cambio sube la versión del mes
+afectado en ``fragment_versions``.
+
+``period_summary`` calcula un mes completo (percentiles por rango con
+funciones de ventana, totales por tipo de servicio y por técnico) en una
+sola consulta; el llamador lo guarda en la caché de fragmentos con la
+versión del mes, así los meses cerrados no se vuelven a calcular.
+"""
+from datetime import date
+from typing import Iterable, List, Optional
+
+from sqlalchemy import event, inspect, text
+
+from utils import fragments
+
+FACTS_TABLE = 'service_facts'
+# Columnas de services que cambian la fila de hechos
+TRACKED = ('created_at', 'completion_date', 'estimated_days', 'estimated_cost', 'final_cost',
+           'service_type', 'technician_id')
+CHUNK = 500
+
+_ensured_engines = set()
+
+_FACTS_SELECT = (
+    "SELECT id, technician_id, service_type, strftime('%Y-%m', completion_date), "
+    "max((julianday(completion_date) - julianday(created_at)) * 24, 0), "
+    "estimated_days, "
+    "CASE WHEN estimated_days IS NULL THEN NULL "
+    "WHEN julianday(completion_date) - julianday(created_at) <= estimated_days THEN 1 ELSE 0 END, "
+    "coalesce(final_cost, estimated_cost, 0) "
+    "FROM services WHERE completion_date IS NOT NULL AND created_at IS NOT NULL"
+)
+_FACTS_COLUMNS = ('service_id, technician_id, service_type, period, turnaround_hours, '
+                  'estimated_days, on_time, revenue')
+
+
+# ========== TABLA ==========
+
+def ensure_table(connection) -> None:
+    """Crea la tabla si no existe y la llena con los servicios ya cerrados."""
+    engine_key = id(connection.engine)
+    if engine_key in _ensured_engines:
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': FACTS_TABLE}
+    ).first()
+    if exists:
+        # Solo se recuerda cuando ya existía (ver counters.ensure_table)
+        _ensured_engines.add(engine_key)
+        return
+    connection.execute(text(
+        f"CREATE TABLE {FACTS_TABLE} ("
+        "service_id INTEGER NOT NULL PRIMARY KEY, "
+        "technician_id INTEGER, "
+        "service_type VARCHAR(50), "
+        "period CHAR(7) NOT NULL, "
+        "turnaround_hours FLOAT NOT NULL, "
+        "estimated_days INTEGER, "
+        "on_time INTEGER, "
+        "revenue FLOAT NOT NULL DEFAULT 0)"
+    ))
+    connection.execute(text(
+        f"CREATE INDEX ix_service_facts_period_turnaround ON {FACTS_TABLE} (period, turnaround_hours)"))
+    connection.execute(text(f"INSERT INTO {FACTS_TABLE} ({_FACTS_COLUMNS}) {_FACTS_SELECT}"))
+
+
+def period_key(period: str) -> str:
+    """Nombre de la versión de un mes en ``fragment_versions``."""
+    return f'{FACTS_TABLE}:{period}'
+
+
+# ========== ACTUALIZACIÓN INCREMENTAL ==========
+
+def _periods(connection, where: str, params: dict) -> set:
+    return set(connection.execute(
+        text(f"SELECT DISTINCT period FROM {FACTS_TABLE} WHERE {where}"), params).scalars())
+
+
+def _resync(connection, where: str, params: dict, source_where: str) -> None:
+    ensure_table(connection)
+    periods = _periods(connection, where, params)
+    connection.execute(text(f"DELETE FROM {FACTS_TABLE} WHERE {where}"), params)
+    connection.execute(text(f"INSERT INTO {FACTS_TABLE} ({_FACTS_COLUMNS}) {_FACTS_SELECT} AND {source_where}"),
+                       params)
+    periods |= _periods(connection, where, params)
+    if periods:
+        fragments.bump(connection, [period_key(period) for period in periods])
+
+
+def sync(connection, service_ids: Iterable[int]) -> None:
+    """Recalcula la fila de hechos de ``service_ids`` (alta, cambio o borrado)."""
+    service_ids = sorted(set(service_ids))
+    for start in range(0, len(service_ids), CHUNK):
+        params = {f'id{index}': service_id for index, service_id in enumerate(service_ids[start:start + CHUNK])}
+        placeholders = ', '.join(':' + key for key in params)
+        _resync(connection, f'service_id IN ({placeholders})', params, f'id IN ({placeholders})')
+
+
+def sync_after(connection, after_id: int) -> None:
+    """Agrega los servicios con id mayor que ``after_id`` (importación masiva)."""
+    _resync(connection, 'service_id > :after', {'after': after_id}, 'id > :after')
+
+
+def rebuild(connection) -> None:
+    """Vuelve a calcular toda la tabla desde ``services``."""
+    ensure_table(connection)
+    periods = _periods(connection, '1 = 1', {})
+    connection.execute(text(f"DELETE FROM {FACTS_TABLE}"))
+    connection.execute(text(f"INSERT INTO {FACTS_TABLE} ({_FACTS_COLUMNS}) {_FACTS_SELECT}"))
+    periods |= _periods(connection, '1 = 1', {})
+    fragments.bump(connection, [period_key(period) for period in periods])
+
+
+def register_hooks(session, service_model) -> None:
+    """Mantiene ``service_facts`` al día con los servicios que cambian en cada flush."""
+
+    @event.listens_for(session, 'after_flush')
+    def sync_service_facts(session, flush_context):
+        changed = []
+        for obj in session.new:
+            if isinstance(obj, service_model) and obj.completion_date is not None:
+                changed.append(obj.id)
+        for obj in session.dirty:
+            if isinstance(obj, service_model):
+                state = inspect(obj)
+                if any(state.attrs[name].history.has_changes() for name in TRACKED):
+                    changed.append(obj.id)
+        changed.extend(obj.id for obj in session.deleted if isinstance(obj, service_model))
+        if changed:
+            sync(session.connection(), changed)
+
+
+# ========== CONSULTAS ==========
+
+def recent_periods(today: date, months: int) -> List[str]:
+    """Los ``months`` meses hasta ``today`` (``'2024-05'``), del más reciente al más viejo."""
+    periods = []
+    year, month = today.year, today.month
+    for _ in range(months):
+        periods.append(f'{year:04d}-{month:02d}')
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return periods
+
+
+def _summary_row(row) -> dict:
+    return {
+        'closed': row.closed,
+        'p50_hours': row.p50,
+        'p90_hours': row.p90,
+        'avg_hours': row.avg_hours,
+        'on_time_rate': row.on_time_rate,
+        'revenue': row.revenue or 0.0,
+    }
+
+
+def period_summary(connection, period: str) -> dict:
+    """Totales de un mes, por tipo de servicio y por técnico, en una sola consulta.
+
+    Los percentiles son por rango (el menor tiempo cuyo puesto alcanza el
+    50 % o el 90 % del grupo), calculados con ``ROW_NUMBER`` sobre cada
+    partición.
+    """
+    ensure_table(connection)
+    groups = []
+    for label, column, rank, size in (('total', 'NULL', 'rank_all', 'size_all'),
+                                      ('service_type', 'service_type', 'rank_type', 'size_type'),
+                                      ('technician', 'technician_id', 'rank_technician', 'size_technician')):
+        groups.append(
+            f"SELECT '{label}' AS grouping, {column} AS key, count(*) AS closed, "
+            f"min(CASE WHEN {rank} * 2 >= {size} THEN turnaround_hours END) AS p50, "
+            f"min(CASE WHEN {rank} * 10 >= {size} * 9 THEN turnaround_hours END) AS p90, "
+            "avg(turnaround_hours) AS avg_hours, avg(on_time) AS on_time_rate, sum(revenue) AS revenue "
+            "FROM ranked" + (f" GROUP BY {column}" if column != 'NULL' else '')
+        )
+    rows = connection.execute(text(
+        "WITH ranked AS ("
+        "SELECT technician_id, service_type, turnaround_hours, on_time, revenue, "
+        "row_number() OVER (ORDER BY turnaround_hours) AS rank_all, "
+        "count(*) OVER () AS size_all, "
+        "row_number() OVER (PARTITION BY service_type ORDER BY turnaround_hours) AS rank_type, "
+        "count(*) OVER (PARTITION BY service_type) AS size_type, "
+        "row_number() OVER (PARTITION BY technician_id ORDER BY turnaround_hours) AS rank_technician, "
+        "count(*) OVER (PARTITION BY technician_id) AS size_technician "
+        f"FROM {FACTS_TABLE} WHERE period = :period) "
+        + " UNION ALL ".join(groups)
+    ), {'period': period}).all()
+    summary = {'period': period, 'by_type': {}, 'by_technician': {}}
+    for row in rows:
+        if row.grouping == 'total':
+            summary.update(_summary_row(row))
+        elif row.grouping == 'service_type':
+            summary['by_type'][row.key or ''] = _summary_row(row)
+        else:
+            summary['by_technician'][str(row.key)] = _summary_row(row)
+    return summary
+
+
+def technician_summary(summary: dict, technician_id: int) -> Optional[dict]:
+    """La fila de un técnico dentro de ``period_summary`` (las llaves son texto por JSON)."""
+    return summary['by_technician'].get(str(technician_id))
@@ -0,0 +1,137 @@
+"""
+CSS y JavaScript con huella de contenido y versiones precomprimidas.
+
+``build`` copia cada archivo de ``static/css`` y ``static/js`` a
+``static/dist/`` con el hash de su contenido en el nombre
+(``css/soundlab.3f2a9c1d04be.css``) y junto a él sus versiones ``.gz`` y
+``.br`` (Brotli, si el paquete está instalado). ``manifest.json`` asocia el
+nombre original con el versionado y las plantillas lo resuelven con
+``asset_url``. Como un cambio en el archivo cambia su nombre, se sirven con
+``Cache-Control: immutable`` y un año de vigencia.
+
+Sin manifiesto (desarrollo, o antes del primer build) ``asset_url`` devuelve
+la URL normal de ``/static``.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import uuid
+from typing import Dict, Optional
+
+from flask import abort, request
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+from utils.file_serving import IMMUTABLE_MAX_AGE
+
+try:
+    import brotli
+except ImportError:  # Brotli es opcional: sin él solo se genera .gz
+    brotli = None
+
+SOURCE_DIRS = ('css', 'js')
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+COMPRESSED_EXTENSIONS = {'br': '.br', 'gzip': '.gz'}
+
+
+# ========== BUILD ==========
+
+def _write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(temp_path, 'wb') as target:
+        target.write(data)
+    os.replace(temp_path, path)
+
+
+def fingerprinted_name(relative: str, data: bytes) -> str:
+    """``css/soundlab.css`` -> ``css/soundlab.<hash>.css``"""
+    stem, extension = os.path.splitext(relative)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{extension}'
+
+
+def build(static_folder: str) -> Dict[str, str]:
+    """Genera ``static/dist`` y su manifiesto; devuelve el manifiesto nuevo.
+
+    Se conservan los archivos del manifiesto anterior para que las páginas
+    ya abiertas durante un despliegue sigan encontrando sus recursos; los más
+    viejos se borran.
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    previous = load_manifest(static_folder)
+    manifest = {}
+    for source_dir in SOURCE_DIRS:
+        root = os.path.join(static_folder, source_dir)
+        for directory, _, names in os.walk(root):
+            for name in sorted(names):
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, static_folder).replace(os.sep, '/')
+                with open(path, 'rb') as source:
+                    data = source.read()
+                target = fingerprinted_name(relative, data)
+                manifest[relative] = target
+                target_path = os.path.join(dist, *target.split('/'))
+                if os.path.exists(target_path):
+                    continue  # mismo contenido ya construido
+                _write(target_path, data)
+                _write(target_path + COMPRESSED_EXTENSIONS['gzip'], gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    _write(target_path + COMPRESSED_EXTENSIONS['br'], brotli.compress(data, quality=11))
+    _write(os.path.join(dist, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    _prune(dist, set(manifest.values()) | set(previous.values()))
+    return manifest
+
+
+def _prune(dist: str, keep) -> None:
+    for directory, _, names in os.walk(dist):
+        for name in names:
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, dist).replace(os.sep, '/')
+            base = relative
+            for extension in COMPRESSED_EXTENSIONS.values():
+                if base.endswith(extension):
+                    base = base[:-len(extension)]
+            if relative != MANIFEST_NAME and base not in keep:
+                os.remove(path)
+
+
+def load_manifest(static_folder: str) -> Dict[str, str]:
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME), encoding='utf-8') as source:
+            return json.load(source)
+    except FileNotFoundError:
+        return {}
+
+
+# ========== ENTREGA ==========
+
+def _accepted_encoding(path: str) -> Optional[str]:
+    """La mejor versión precomprimida de ``path`` que acepta el cliente."""
+    for encoding in ('br', 'gzip'):
+        if request.accept_encodings[encoding] and os.path.isfile(path + COMPRESSED_EXTENSIONS[encoding]):
+            return encoding
+    return None
+
+
+def send_asset(static_folder: str, filename: str):
+    """Responde con un recurso de ``static/dist``, precomprimido si el cliente lo acepta."""
+    path = safe_join(os.path.join(static_folder, DIST_DIR), filename)
+    if path is None or filename == MANIFEST_NAME or not os.path.isfile(path):
+        abort(404)
+    encoding = _accepted_encoding(path)
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    response = send_file(
+        path + COMPRESSED_EXTENSIONS[encoding] if encoding else path, request.environ,
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+        etag=f'{stem}-{encoding or "identity"}', max_age=IMMUTABLE_MAX_AGE, conditional=True,
+    )
+    if encoding:
+        response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
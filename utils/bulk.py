@@ -0,0 +1,373 @@
+"""
+Importación y exportación masiva de clientes, inventario y servicios.
+
+La importación lee CSV (con encabezados) o JSONL fila por fila, valida cada
+registro y los inserta en lotes con un solo ``executemany`` por lote, cada
+lote en su propia transacción. Las inserciones no pasan por el ORM, así que
+cada lote actualiza explícitamente los contadores del dashboard y el índice
+de búsqueda.
+
+La exportación recorre la tabla con un cursor del lado del servidor y produce
+el archivo como un generador por bloques: la memoria usada no depende del
+tamaño de la tabla.
+"""
+import csv
+import io
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select, text
+
+from utils import analytics, changes, counters, fragments, search, valuation
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+# Estados de un servicio en orden y la fecha que registra cada etapa (como STATUS_DATES en app.py)
+SERVICE_STATUSES = ('Recibido', 'En proceso', 'Completado', 'Entregado')
+STATUS_DATES = (('En proceso', 'start_date'), ('Completado', 'completion_date'), ('Entregado', 'delivery_date'))
+
+
+class ImportFormatError(ValueError):
+    """El archivo no tiene un formato que se pueda leer."""
+
+
+# ========== DEFINICIÓN DE LAS ENTIDADES ==========
+
+def _text(value):
+    return str(value).strip()
+
+
+def _integer(value):
+    return int(float(value)) if isinstance(value, str) and '.' in value else int(value)
+
+
+def _number(value):
+    return float(value)
+
+
+def _datetime(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value).strip())
+
+
+@dataclass(frozen=True)
+class Field:
+    """Columna importable: ``parse`` convierte el texto recibido al tipo de la columna."""
+    name: str
+    parse: Callable = _text
+    required: bool = False
+    default: object = None
+    choices: Tuple = ()
+
+
+@dataclass(frozen=True)
+class Entity:
+    """Tabla importable/exportable.
+
+    ``name`` es la llave en ``search.ENTITIES`` y ``counters.SOURCES``;
+    ``unique`` las columnas que no se pueden repetir y ``references`` las
+    columnas que deben apuntar a una fila existente (``{columna: tabla}``).
+    """
+    name: str
+    table: str
+    fields: Tuple[Field, ...]
+    unique: Tuple[str, ...] = ()
+    references: Dict[str, str] = field(default_factory=dict)
+
+
+ENTITIES: Dict[str, Entity] = {
+    'customers': Entity(
+        name='customer',
+        table='customers',
+        fields=(
+            Field('name', required=True),
+            Field('email'),
+            Field('phone'),
+            Field('address'),
+            Field('notes'),
+            Field('created_at', _datetime),
+        ),
+        unique=('email',),
+    ),
+    'inventory': Entity(
+        name='inventory',
+        table='inventory',
+        fields=(
+            Field('name', required=True),
+            Field('description'),
+            Field('category', required=True,
+                  choices=('repuestos', 'cables', 'conectores', 'accesorios', 'herramientas', 'consumibles')),
+            Field('brand'),
+            Field('model'),
+            Field('stock', _integer, default=0),
+            Field('min_stock', _integer, default=5),
+            Field('price', _number, default=0.0),
+            Field('supplier'),
+            Field('location'),
+            Field('created_at', _datetime),
+        ),
+    ),
+    'services': Entity(
+        name='service',
+        table='services',
+        fields=(
+            Field('customer_id', _integer, required=True),
+            Field('equipment_id', _integer),
+            Field('technician_id', _integer, required=True),
+            Field('service_type', required=True, choices=('mantenimiento', 'reparacion', 'revision')),
+            Field('description', required=True),
+            Field('status', default='Recibido', choices=SERVICE_STATUSES),
+            Field('equipment_type'),
+            Field('equipment_name'),
+            Field('equipment_brand'),
+            Field('equipment_model'),
+            Field('equipment_serial'),
+            Field('equipment_color'),
+            Field('equipment_accessories'),
+            Field('equipment_condition'),
+            Field('estimated_cost', _number, default=0.0),
+            Field('estimated_days', _integer, default=3),
+            Field('final_cost', _number),
+            Field('diagnosis'),
+            Field('work_performed'),
+            Field('created_at', _datetime),
+            Field('start_date', _datetime),
+            Field('completion_date', _datetime),
+            Field('delivery_date', _datetime),
+        ),
+        references={'customer_id': 'customers', 'equipment_id': 'equipment', 'technician_id': 'users'},
+    ),
+}
+
+
+@dataclass
+class ImportResult:
+    read: int = 0
+    inserted: int = 0
+    errors: List[Tuple[int, str]] = field(default_factory=list)
+    error_count: int = 0
+
+    def add_error(self, line: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+# ========== LECTURA ==========
+
+def detect_format(filename: str) -> str:
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if extension == 'csv':
+        return 'csv'
+    raise ImportFormatError('Formato no soportado: use un archivo .csv o .jsonl')
+
+
+def read_records(stream, fmt: str) -> Iterator[Tuple[int, object]]:
+    """Recorre el archivo binario ``stream`` y produce ``(línea, registro)``.
+
+    Un registro que no se puede leer se produce como ``ImportFormatError``
+    para reportarlo sin detener la importación.
+    """
+    reader = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        rows = csv.DictReader(reader)
+        for row in rows:
+            yield rows.line_num, row
+        return
+    for line_number, line in enumerate(reader, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            yield line_number, ImportFormatError(f'JSON inválido: {error}')
+            continue
+        if not isinstance(record, dict):
+            record = ImportFormatError('Cada línea debe ser un objeto JSON')
+        yield line_number, record
+
+
+def validate(entity: Entity, record: dict, defaults: Optional[dict] = None) -> dict:
+    """Convierte un registro en los valores de la fila; lanza ``ValueError`` si no es válido."""
+    values = {}
+    for spec in entity.fields:
+        raw = record.get(spec.name)
+        if isinstance(raw, str):
+            raw = raw.strip()
+        if raw in (None, ''):
+            raw = (defaults or {}).get(spec.name, spec.default)
+            if raw is None:
+                if spec.required:
+                    raise ValueError(f'Falta el campo obligatorio "{spec.name}"')
+                values[spec.name] = None
+                continue
+        try:
+            value = spec.parse(raw)
+        except (TypeError, ValueError):
+            raise ValueError(f'Valor inválido en "{spec.name}": {raw!r}')
+        if spec.choices and value not in spec.choices:
+            raise ValueError(f'"{spec.name}" debe ser uno de: {", ".join(spec.choices)}')
+        values[spec.name] = value
+    return values
+
+
+def set_status_dates(values: dict, now: datetime) -> None:
+    """Completa las fechas de las etapas que alcanzó el estado del servicio importado.
+
+    Una etapa alcanzada sin fecha toma la de la etapa siguiente o, si tampoco
+    la trae, ``now``, como un cambio de estado en la aplicación. Una fecha de
+    una etapa posterior al estado es un error.
+    """
+    rank = SERVICE_STATUSES.index(values['status'])
+    following = now
+    for stage, column in reversed(STATUS_DATES):
+        if rank < SERVICE_STATUSES.index(stage):
+            if values[column] is not None:
+                raise ValueError(f'"{column}" no corresponde al estado "{values["status"]}"')
+            continue
+        if values[column] is None:
+            values[column] = following
+        following = values[column]
+
+
+# ========== IMPORTACIÓN ==========
+
+def _batches(records: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _existing(connection, table: str, column: str, values: set) -> set:
+    """Valores de ``values`` que ya existen en ``table.column``."""
+    if not values:
+        return set()
+    params = {f'v{i}': value for i, value in enumerate(values)}
+    placeholders = ', '.join(f':{name}' for name in params)
+    return {row[0] for row in connection.execute(
+        text(f"SELECT {column} FROM {table} WHERE {column} IN ({placeholders})"), params)}
+
+
+def _check_batch(connection, entity: Entity, batch: list, result: ImportResult) -> list:
+    """Descarta del lote las filas con valores repetidos o referencias inexistentes."""
+    for column in entity.unique:
+        taken = _existing(connection, entity.table, column, {row[column] for _, row in batch if row[column]})
+        kept = []
+        for line, row in batch:
+            if row[column] and row[column] in taken:
+                result.add_error(line, f'"{column}" ya existe: {row[column]}')
+                continue
+            if row[column]:
+                taken.add(row[column])  # repetidos dentro del mismo archivo
+            kept.append((line, row))
+        batch = kept
+    for column, table in entity.references.items():
+        wanted = {row[column] for _, row in batch if row[column] is not None}
+        missing = wanted - _existing(connection, table, 'id', wanted)
+        if missing:
+            for line, row in batch:
+                if row[column] in missing:
+                    result.add_error(line, f'"{column}" no existe: {row[column]}')
+            batch = [(line, row) for line, row in batch if row[column] not in missing]
+    return batch
+
+
+def import_records(engine, metadata, entity_key: str, records: Iterable[Tuple[int, object]],
+                   defaults: Optional[dict] = None, now: Optional[datetime] = None,
+                   batch_size: int = BATCH_SIZE, dry_run: bool = False) -> ImportResult:
+    """Valida e inserta ``records`` (``(línea, registro)``) en lotes.
+
+    ``defaults`` completa los campos vacíos (p. ej. ``technician_id``) y
+    ``now`` es la fecha de creación de los registros que no traen una. Con
+    ``dry_run`` solo se valida: no se inserta nada.
+    """
+    entity = ENTITIES[entity_key]
+    table = metadata.tables[entity.table]
+    source = counters.SOURCES[entity.name]
+    result = ImportResult()
+
+    def parsed():
+        for line, record in records:
+            result.read += 1
+            if isinstance(record, Exception):
+                result.add_error(line, str(record))
+                continue
+            try:
+                values = validate(entity, record, defaults)
+                if entity.table == 'services':
+                    set_status_dates(values, now or datetime.now())
+            except ValueError as error:
+                result.add_error(line, str(error))
+                continue
+            values['created_at'] = values['created_at'] or now
+            if 'updated_at' in table.c:
+                values['updated_at'] = values['created_at']
+            yield line, values
+
+    for batch in _batches(parsed(), batch_size):
+        with engine.begin() as connection:
+            batch = _check_batch(connection, entity, batch, result)
+            if not batch or dry_run:
+                continue
+            last_id = connection.execute(text(f"SELECT coalesce(max(id), 0) FROM {entity.table}")).scalar()
+            rows = [row for _, row in batch]
+            connection.execute(table.insert(), rows)  # executemany
+            deltas = Counter()
+            for row in rows:
+                deltas.update(source.contribution(row))
+            counters.adjust(connection, deltas)
+            search.index_range(connection, entity.name, last_id)
+            fragments.bump(connection, [entity.table])
+            changes.publish(connection, entity.name, [{'action': 'bulk', 'count': len(rows)}])
+            if entity.table == 'services':
+                analytics.sync_after(connection, last_id)
+            if entity.table == 'inventory':
+                stock_deltas = valuation.new_deltas()
+                for row in rows:
+                    valuation.add(stock_deltas, row)
+                valuation.apply(connection, (now or datetime.now()).date(), stock_deltas)
+            result.inserted += len(rows)
+    return result
+
+
+# ========== EXPORTACIÓN ==========
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def export_chunks(engine, metadata, entity_key: str, fmt: str, chunk_rows: int = BATCH_SIZE) -> Iterator[str]:
+    """Genera el contenido del archivo exportado por bloques de ``chunk_rows`` filas."""
+    table = metadata.tables[ENTITIES[entity_key].table]
+    columns = [column.name for column in table.columns]
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=chunk_rows).execute(
+            select(table).order_by(table.c.id))
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+            yield buffer.getvalue()
+        for partition in result.partitions():
+            buffer = io.StringIO()
+            if fmt == 'csv':
+                writer = csv.writer(buffer)
+                writer.writerows([[_plain(value) for value in row] for row in partition])
+            else:
+                for row in partition:
+                    buffer.write(json.dumps({name: _plain(value) for name, value in zip(columns, row)},
+                                            ensure_ascii=False))
+                    buffer.write('\n')
+            yield buffer.getvalue()
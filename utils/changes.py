@@ -0,0 +1,257 @@
+"""
+Feed de cambios de servicios e inventario para las pantallas en vivo (SSE).
+
+Cada escritura publica un evento pequeño (``{"entity", "id", "action", ...}``)
+en la tabla ``change_events`` dentro de su propia transacción: solo se ve si la
+escritura se confirma. Los flush del ORM lo hacen solos (``register_hooks``);
+las escrituras directas (cambio de estado, movimientos de stock, importación
+masiva) llaman a ``publish``.
+
+La tabla hace de broker entre procesos: en cada worker web un hilo
+(``Broker``) consulta los eventos nuevos cada ``interval`` segundos mientras
+haya navegadores conectados y los reparte a sus colas. El id del evento es el
+``id:`` de Server-Sent Events, así un navegador que se reconecta con
+``Last-Event-ID`` recibe lo que se perdió (``since``). Los eventos de más de
+``retention`` segundos se borran.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import event, inspect, text
+
+logger = logging.getLogger(__name__)
+
+EVENTS_TABLE = 'change_events'
+REPLAY_LIMIT = 500  # eventos máximos al reconectar; si faltan más, el navegador recarga
+
+_ensured_engines = set()
+
+
+# ========== TABLA ==========
+
+def ensure_table(connection) -> None:
+    engine_key = id(connection.engine)
+    if engine_key in _ensured_engines:
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': EVENTS_TABLE}
+    ).first()
+    if exists:
+        # Solo se recuerda cuando ya existía (ver counters.ensure_table)
+        _ensured_engines.add(engine_key)
+        return
+    connection.execute(text(
+        f"CREATE TABLE {EVENTS_TABLE} ("
+        "id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, "
+        "topic VARCHAR(50) NOT NULL, "
+        "data TEXT NOT NULL, "
+        "created_at FLOAT NOT NULL)"
+    ))
+    connection.execute(text(f"CREATE INDEX ix_change_events_created_at ON {EVENTS_TABLE} (created_at)"))
+
+
+# ========== PUBLICAR Y LEER ==========
+
+def publish(connection, topic: str, events: Iterable[dict]) -> None:
+    """Publica ``events`` en la transacción de ``connection``."""
+    now = time.time()
+    rows = [{'topic': topic, 'data': json.dumps(data, default=str), 'now': now} for data in events]
+    if not rows:
+        return
+    ensure_table(connection)
+    connection.execute(
+        text(f"INSERT INTO {EVENTS_TABLE} (topic, data, created_at) VALUES (:topic, :data, :now)"),
+        rows
+    )
+
+
+def last_id(connection) -> int:
+    ensure_table(connection)
+    return connection.execute(text(f"SELECT coalesce(max(id), 0) FROM {EVENTS_TABLE}")).scalar()
+
+
+def since(connection, after_id: int, limit: int = REPLAY_LIMIT) -> List[dict]:
+    """Eventos posteriores a ``after_id`` en orden (``{"id", "topic", "data"}``)."""
+    ensure_table(connection)
+    return [{'id': row.id, 'topic': row.topic, 'data': json.loads(row.data)} for row in connection.execute(
+        text(f"SELECT id, topic, data FROM {EVENTS_TABLE} WHERE id > :after ORDER BY id LIMIT :limit"),
+        {'after': after_id, 'limit': limit}
+    )]
+
+
+def prune(connection, retention: float) -> int:
+    ensure_table(connection)
+    return connection.execute(
+        text(f"DELETE FROM {EVENTS_TABLE} WHERE created_at < :cutoff"),
+        {'cutoff': time.time() - retention}
+    ).rowcount
+
+
+def register_hooks(session, models: Dict[str, tuple]) -> None:
+    """Publica un evento por cada objeto creado, modificado o borrado en un flush.
+
+    ``models`` asocia el tópico con ``(modelo, serializador)``; el serializador
+    devuelve los campos pequeños que viajan en el evento (p. ej. el estado).
+    """
+    by_model = {model: (topic, serialize) for topic, (model, serialize) in models.items()}
+
+    @event.listens_for(session, 'after_flush')
+    def publish_changes(session, flush_context):
+        pending: Dict[str, List[dict]] = {}
+        for action, objects in (('created', session.new), ('updated', session.dirty), ('deleted', session.deleted)):
+            for obj in objects:
+                entry = by_model.get(type(obj))
+                if entry is None or (action == 'updated' and not session.is_modified(obj)):
+                    continue
+                topic, serialize = entry
+                data = {'id': obj.id, 'action': action}
+                data.update(serialize(obj))
+                pending.setdefault(topic, []).append(data)
+        for topic, events in pending.items():
+            publish(session.connection(), topic, events)
+
+
+def previous(obj, key: str):
+    """Valor de ``key`` antes del flush en curso (para los serializadores de ``register_hooks``)."""
+    history = inspect(obj).attrs[key].history
+    return history.deleted[0] if history.deleted else getattr(obj, key)
+
+
+# ========== BROKER POR PROCESO ==========
+
+class Subscription:
+    """Cola de eventos de un navegador conectado."""
+
+    def __init__(self, topics: Iterable[str], after_id: int = 0, max_pending: int = 1000):
+        self.topics = set(topics)
+        self.after_id = after_id  # el navegador ya tiene hasta aquí
+        self.queue: 'queue.Queue[dict]' = queue.Queue(max_pending)
+        self.overflowed = False
+
+    def put(self, item: dict) -> None:
+        if item['topic'] not in self.topics or item['id'] <= self.after_id:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.overflowed = True  # el navegador recarga en lugar de perder cambios
+
+    def get(self, timeout: float) -> Optional[dict]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broker:
+    """Hilo que consulta ``change_events`` y reparte los eventos a las suscripciones.
+
+    El hilo solo corre mientras hay suscripciones; se inicia con la primera
+    (ya dentro del worker, nunca en el maestro de gunicorn antes del fork).
+    """
+
+    def __init__(self, connect: Callable, interval: float = 1.0, retention: float = 24 * 3600,
+                 prune_every: float = 600):
+        self.connect = connect  # devuelve una conexión nueva (engine.connect)
+        self.interval = interval
+        self.retention = retention
+        self.prune_every = prune_every
+        self.subscriptions: List[Subscription] = []
+        self.last_id: Optional[int] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._last_prune = 0.0
+
+    def subscribe(self, topics: Iterable[str], after_id: int) -> Subscription:
+        """Nueva suscripción que recibe los eventos posteriores a ``after_id``."""
+        subscription = Subscription(topics, after_id)
+        with self._lock:
+            if self.last_id is None or after_id < self.last_id:
+                # Lo que el hilo ya repartió antes de esta suscripción lo lee ella misma
+                self._replay(subscription, after_id)
+            self.subscriptions.append(subscription)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='change-broker', daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+
+    def _replay(self, subscription, after_id):
+        with self.connect() as connection:
+            if self.last_id is None:
+                self.last_id = last_id(connection)
+            upto = self.last_id
+            while after_id < upto:
+                found = since(connection, after_id)
+                if len(found) == REPLAY_LIMIT and found[-1]['id'] < upto:
+                    subscription.overflowed = True
+                for item in found:
+                    if item['id'] > upto:
+                        break
+                    subscription.put(item)
+                    after_id = item['id']
+                if len(found) < REPLAY_LIMIT or subscription.overflowed:
+                    break
+
+    def poll(self) -> int:
+        """Una consulta de eventos nuevos; devuelve cuántos se repartieron."""
+        with self.connect() as connection:
+            if self.last_id is None:
+                self.last_id = last_id(connection)
+            found = since(connection, self.last_id)
+            if time.time() - self._last_prune > self.prune_every:
+                self._last_prune = time.time()
+                prune(connection, self.retention)
+                connection.commit()
+        with self._lock:
+            for item in found:
+                for subscription in self.subscriptions:
+                    subscription.put(item)
+                self.last_id = item['id']
+        return len(found)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self.subscriptions:
+                    self._thread = None
+                    return
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Error al consultar los eventos de cambios")
+            time.sleep(self.interval)
+
+
+def format_event(item: dict) -> str:
+    """Evento en el formato de texto de Server-Sent Events."""
+    return f"id: {item['id']}\nevent: {item['topic']}\ndata: {json.dumps(item['data'])}\n\n"
+
+
+def stream(broker: Broker, subscription: Subscription, keepalive: float = 15,
+           max_seconds: float = 300) -> Iterator[str]:
+    """Cuerpo de la respuesta SSE de una suscripción.
+
+    Cada ``max_seconds`` se cierra la conexión (el navegador se reconecta solo
+    con ``Last-Event-ID``) para no ocupar un hilo del servidor indefinidamente.
+    """
+    deadline = time.monotonic() + max_seconds
+    try:
+        yield 'retry: 3000\n\n'
+        while time.monotonic() < deadline:
+            if subscription.overflowed:
+                yield 'event: reload\ndata: {}\n\n'
+                return
+            item = subscription.get(timeout=min(keepalive, max(deadline - time.monotonic(), 0.1)))
+            yield format_event(item) if item is not None else ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,53 @@
+"""
+Compresión de las respuestas dinámicas (HTML y JSON).
+
+Las páginas como el formulario de servicios pesan decenas de KB y el Wi-Fi
+del taller es lento; comprimirlas cuesta menos de un milisegundo. Se usa
+Brotli si el cliente lo acepta y el paquete está instalado, si no gzip. Las
+respuestas pequeñas, en streaming (exportaciones) o ya codificadas se dejan
+tal cual.
+"""
+import gzip
+from typing import Iterable, Optional
+
+try:
+    import brotli
+except ImportError:  # Brotli es opcional: sin él se comprime con gzip
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # buen equilibrio para comprimir en cada petición
+
+
+def negotiate(accept_encodings) -> Optional[str]:
+    """``'br'``, ``'gzip'`` o ``None`` según ``Accept-Encoding``."""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def compress_response(response, accept_encodings, min_size: int, mimetypes: Iterable[str]):
+    """Comprime ``response`` en el lugar si corresponde y la devuelve."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype not in mimetypes or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    encoding = negotiate(accept_encodings)
+    if encoding is None or len(data) < min_size:
+        return response
+    response.set_data(compress(data, encoding))
+    response.content_encoding = encoding
+    # Otra representación de los mismos datos: un ETag fuerte ya no aplica
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
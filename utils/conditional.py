@@ -0,0 +1,56 @@
+"""
+Peticiones condicionales (``If-None-Match``/``If-Modified-Since``) para vistas HTML.
+
+Las vistas de detalle calculan primero, con una consulta pequeña, los
+``updated_at`` (y conteos) de todo lo que muestran; de ahí salen un ETag débil
+y un ``Last-Modified``. Si el navegador ya tiene esa versión se responde 304
+sin cargar los objetos ni renderizar la plantilla.
+
+Las respuestas llevan ``Cache-Control: private, no-cache``: el navegador puede
+guardarlas pero debe revalidar cada vez, así que nunca muestra una versión
+vieja.
+"""
+import hashlib
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+import pytz
+from flask import Response, make_response, request
+from werkzeug.http import is_resource_modified
+
+
+def make_etag(*parts) -> str:
+    """ETag de los validadores de una vista (cualquier valor con ``repr`` estable)."""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:32]
+
+
+def last_modified(stamps: Iterable[Optional[datetime]], tz) -> Optional[datetime]:
+    """El más reciente de ``stamps``; las fechas sin zona se interpretan en ``tz``."""
+    latest = None
+    for stamp in stamps:
+        if stamp is None:
+            continue
+        if stamp.tzinfo is None:
+            stamp = tz.localize(stamp) if hasattr(tz, 'localize') else stamp.replace(tzinfo=tz)
+        if latest is None or stamp > latest:
+            latest = stamp
+    return latest.astimezone(pytz.utc) if latest is not None else None
+
+
+def respond(etag: str, modified: Optional[datetime], render: Callable[[], object],
+            revalidate_only: bool = False) -> Response:
+    """304 si la petición ya tiene esta versión; si no, ``render()`` con los validadores.
+
+    Con ``revalidate_only`` siempre se renderiza (p. ej. hay mensajes flash
+    pendientes que deben mostrarse), pero igual se envían los validadores.
+    """
+    if not revalidate_only and not is_resource_modified(request.environ, etag=etag, last_modified=modified):
+        response = Response(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag, weak=True)
+    if modified is not None:
+        response.last_modified = modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,218 @@
+"""
+Contadores materializados para el dashboard.
+
+La tabla ``stat_counters`` guarda un valor por llave (``customers``,
+``equipment``, ``inventory.low_stock``, ``services.status.<estado>``...).
+Cada flush de la sesión calcula cuánto aporta cada objeto creado, modificado o
+eliminado y aplica solo la diferencia con un ``UPSERT`` en la misma
+transacción, así el dashboard lee todos los totales en una consulta en lugar
+de contar las tablas completas.
+
+``reconcile`` recalcula los valores desde las tablas reales para corregir
+cualquier desviación (por ejemplo, escrituras hechas fuera del ORM); se
+ejecuta periódicamente con ``reconcile_if_stale`` o con
+``flask counters-reconcile``.
+"""
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import event, inspect, text
+
+COUNTERS_TABLE = 'stat_counters'
+RECONCILED_AT = '_reconciled_at'
+
+
+def _low_stock(values):
+    stock, min_stock = values['stock'], values['min_stock']
+    low = stock is not None and min_stock is not None and stock <= min_stock
+    return {'inventory.low_stock': 1 if low else 0}
+
+
+def _service_status(values):
+    return {f"services.status.{values['status']}": 1} if values['status'] else {}
+
+
+@dataclass(frozen=True)
+class CounterSource:
+    """Cómo aporta una fila a los contadores y cómo recalcularlos con SQL.
+
+    ``contribution`` recibe los valores de ``fields`` y devuelve
+    ``{llave: aporte}``; ``reconcile_sql`` devuelve filas ``(llave, valor)``.
+    """
+    fields: tuple
+    contribution: Callable[[dict], Dict[str, int]]
+    reconcile_sql: str
+
+
+SOURCES: Dict[str, CounterSource] = {
+    'customer': CounterSource(
+        fields=(),
+        contribution=lambda values: {'customers': 1},
+        reconcile_sql="SELECT 'customers', count(*) FROM customers",
+    ),
+    'equipment': CounterSource(
+        fields=(),
+        contribution=lambda values: {'equipment': 1},
+        reconcile_sql="SELECT 'equipment', count(*) FROM equipment",
+    ),
+    'service': CounterSource(
+        fields=('status',),
+        contribution=_service_status,
+        reconcile_sql="SELECT 'services.status.' || status, count(*) FROM services "
+                      "WHERE status IS NOT NULL GROUP BY status",
+    ),
+    'inventory': CounterSource(
+        fields=('stock', 'min_stock'),
+        contribution=_low_stock,
+        reconcile_sql="SELECT 'inventory.low_stock', count(*) FROM inventory WHERE stock <= min_stock",
+    ),
+}
+
+_ensured_engines = set()
+
+
+# ========== TABLA ==========
+
+def ensure_table(connection) -> bool:
+    """Crea la tabla de contadores si no existe y la llena desde las tablas reales.
+
+    Devuelve ``True`` si la tabla se acaba de crear (y por lo tanto ya refleja
+    todo lo escrito en la transacción actual).
+    """
+    engine_key = id(connection.engine)
+    if engine_key in _ensured_engines:
+        return False
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': COUNTERS_TABLE}
+    ).first()
+    if not exists:
+        connection.execute(text(
+            f"CREATE TABLE {COUNTERS_TABLE} ("
+            "key VARCHAR(100) NOT NULL PRIMARY KEY, "
+            "value INTEGER NOT NULL DEFAULT 0)"
+        ))
+    if not exists:
+        reconcile(connection)
+    else:
+        # Solo se recuerda cuando ya existía: si la transacción que la creó
+        # se revierte, la siguiente llamada la vuelve a crear
+        _ensured_engines.add(engine_key)
+    return not exists
+
+
+def adjust(connection, deltas: Dict[str, int]) -> None:
+    """Suma ``deltas`` a los contadores en la transacción de ``connection``.
+
+    Las escrituras que no pasan por el ORM (UPDATE directos) deben llamar a
+    esta función para mantener los contadores exactos.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas or ensure_table(connection):
+        return
+    connection.execute(
+        text(f"INSERT INTO {COUNTERS_TABLE}(key, value) VALUES (:key, :delta) "
+             "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value"),
+        [{'key': key, 'delta': delta} for key, delta in deltas.items()]
+    )
+
+
+def read_all(connection) -> Dict[str, int]:
+    """Todos los contadores en una sola lectura."""
+    ensure_table(connection)
+    return dict(connection.execute(text(f"SELECT key, value FROM {COUNTERS_TABLE}")).all())
+
+
+def by_prefix(values: Dict[str, int], prefix: str) -> Dict[str, int]:
+    """Subconjunto de contadores cuya llave empieza por ``prefix``, sin el prefijo."""
+    return {key[len(prefix):]: value for key, value in values.items() if key.startswith(prefix)}
+
+
+def reconcile(connection) -> Dict[str, int]:
+    """Recalcula todos los contadores desde las tablas reales.
+
+    El borrado inicial toma el bloqueo de escritura de SQLite, así ningún
+    otro proceso puede aplicar deltas entre el conteo y la escritura.
+    """
+    ensure_table(connection)
+    connection.execute(text(f"DELETE FROM {COUNTERS_TABLE}"))
+    for source in SOURCES.values():
+        connection.execute(text(f"INSERT INTO {COUNTERS_TABLE}(key, value) {source.reconcile_sql}"))
+    connection.execute(
+        text(f"INSERT INTO {COUNTERS_TABLE}(key, value) VALUES (:key, :now)"),
+        {'key': RECONCILED_AT, 'now': int(time.time())}
+    )
+    return read_all(connection)
+
+
+def reconcile_if_stale(connection, values: Dict[str, int], max_age: int) -> Optional[Dict[str, int]]:
+    """Reconcilia si la última reconciliación tiene más de ``max_age`` segundos.
+
+    Devuelve los valores nuevos, o ``None`` si no fue necesario.
+    """
+    if time.time() - values.get(RECONCILED_AT, 0) < max_age:
+        return None
+    return reconcile(connection)
+
+
+# ========== SINCRONIZACIÓN CON SQLALCHEMY ==========
+
+def field_values(obj, fields, committed=False):
+    """Valores actuales (o los anteriores al flush) de ``fields``."""
+    state = inspect(obj)
+    values = {}
+    for field in fields:
+        history = state.attrs[field].history
+        if committed and history.deleted:
+            values[field] = history.deleted[0]
+        elif committed and history.unchanged:
+            values[field] = history.unchanged[0]
+        else:
+            values[field] = getattr(obj, field)
+    return values
+
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+def track_previous_values(model, fields) -> None:
+    """Carga el valor anterior de ``fields`` aunque el objeto esté expirado al asignarlo.
+
+    Así ``field_values(..., committed=True)`` puede restar su aporte en el flush.
+    """
+    for field in fields:
+        event.listen(getattr(model, field), 'set', _keep_previous_value, active_history=True)
+
+
+def register_hooks(session, models: Dict[str, type]) -> None:
+    """Aplica los deltas de cada flush de ``session`` a los contadores.
+
+    ``models`` asocia el nombre de la fuente (clave de ``SOURCES``) con su
+    clase de modelo.
+    """
+    sources = {model: SOURCES[name] for name, model in models.items()}
+
+    for model, source in sources.items():
+        track_previous_values(model, source.fields)
+
+    @event.listens_for(session, 'after_flush')
+    def apply_counter_deltas(session, flush_context):
+        deltas = Counter()
+        for obj in session.new:
+            source = sources.get(type(obj))
+            if source:
+                deltas.update(source.contribution(field_values(obj, source.fields)))
+        for obj in session.deleted:
+            source = sources.get(type(obj))
+            if source:
+                deltas.subtract(source.contribution(field_values(obj, source.fields, committed=True)))
+        for obj in session.dirty:
+            source = sources.get(type(obj))
+            if source and source.fields and session.is_modified(obj):
+                deltas.update(source.contribution(field_values(obj, source.fields)))
+                deltas.subtract(source.contribution(field_values(obj, source.fields, committed=True)))
+        if deltas:
+            adjust(session.connection(), dict(deltas))
@@ -0,0 +1,309 @@
+"""
+Procesamiento del lado del servidor para DataTables.
+
+Traduce los parámetros que envía DataTables (``draw``, ``start``, ``length``,
+``order``, ``search`` y ``columns``) a una consulta SQL filtrada, ordenada y
+paginada, para que las listas grandes no se descarguen completas al navegador.
+
+Además de la paginación por ``OFFSET`` que usa DataTables, se soporta
+paginación por llave (keyset) con el parámetro ``after``: cada respuesta
+incluye ``next_cursor`` con la última posición entregada, y al enviarlo de
+vuelta la consulta continúa desde ahí sin recorrer las filas anteriores.
+
+``prefix_page`` usa los mismos cursores para los selectores con búsqueda
+(typeahead): filtra por prefijo del nombre y pagina sobre un índice
+``COLLATE NOCASE``.
+"""
+import base64
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Callable, List, Optional
+
+from sqlalchemy import and_, or_, tuple_
+
+# Tipos de filtro por columna (columns[i][search][value])
+FILTER_EXACT = 'exact'
+FILTER_PREFIX = 'prefix'
+FILTER_CONTAINS = 'contains'
+FILTER_RANGE = 'range'  # "desde|hasta", cualquiera de los dos puede ir vacío
+
+# Mayor que cualquier carácter: "abc" + PREFIX_END es el límite superior de los textos que empiezan con "abc"
+PREFIX_END = '\U0010ffff'
+
+
+@dataclass
+class Column:
+    """Columna expuesta a DataTables.
+
+    ``name`` es el valor de ``columns[i][data]`` en la petición y ``expr`` la
+    expresión SQLAlchemy usada para ordenar y filtrar.
+    """
+    name: str
+    expr: Any = None
+    orderable: bool = True
+    searchable: bool = False
+    filter: Optional[str] = None
+
+
+class DataTable:
+    """Consulta paginada compatible con DataTables en modo ``serverSide``.
+
+    ``query`` es la consulta base (por ejemplo ``Service.query``), ``columns``
+    la lista de columnas en el mismo orden que la tabla HTML y ``serializer``
+    la función que convierte cada fila en el diccionario que recibe el cliente.
+    ``records_total`` devuelve el total sin filtros (por ejemplo desde los
+    contadores materializados); sin ella se cuenta la consulta base.
+    """
+
+    def __init__(self, query, columns: List[Column], serializer: Callable,
+                 id_column, default_order=None, max_length: int = 100,
+                 records_total: Optional[Callable[[], int]] = None):
+        self.query = query
+        self.columns = columns
+        self.serializer = serializer
+        self.id_column = id_column
+        self.default_order = default_order or (id_column, 'desc')
+        self.max_length = max_length
+        self.records_total = records_total
+
+    # ---------- Parámetros de la petición ----------
+
+    def _column_for(self, args, index):
+        """Resuelve la columna por nombre (columns[i][data]) o por posición."""
+        name = args.get(f'columns[{index}][data]')
+        for column in self.columns:
+            if name is not None and column.name == name:
+                return column
+        if 0 <= index < len(self.columns):
+            return self.columns[index]
+        return None
+
+    def _order(self, args):
+        """Devuelve (expresión, dirección) del primer criterio de orden."""
+        try:
+            index = int(args.get('order[0][column]', ''))
+        except ValueError:
+            return self.default_order
+        column = self._column_for(args, index)
+        if column is None or not column.orderable or column.expr is None:
+            return self.default_order
+        direction = 'asc' if args.get('order[0][dir]') == 'asc' else 'desc'
+        return column.expr, direction
+
+    def _length(self, args):
+        try:
+            length = int(args.get('length', 25))
+        except ValueError:
+            length = 25
+        if length <= 0 or length > self.max_length:
+            length = self.max_length
+        return length
+
+    # ---------- Filtros ----------
+
+    def _global_search(self, query, value):
+        value = value.strip()
+        if not value:
+            return query
+        pattern = f'%{escape_like(value)}%'
+        conditions = [column.expr.ilike(pattern, escape='\\')
+                      for column in self.columns
+                      if column.searchable and column.expr is not None]
+        if value.isdigit():
+            conditions.append(self.id_column == int(value))
+        if not conditions:
+            return query
+        return query.filter(or_(*conditions))
+
+    def _column_filters(self, query, args):
+        index = 0
+        while f'columns[{index}][data]' in args or index < len(self.columns):
+            value = (args.get(f'columns[{index}][search][value]') or '').strip()
+            column = self._column_for(args, index)
+            index += 1
+            if not value or column is None or column.expr is None or not column.filter:
+                continue
+            if column.filter == FILTER_EXACT:
+                query = query.filter(column.expr == value)
+            elif column.filter == FILTER_PREFIX:
+                query = query.filter(column.expr.ilike(f'{escape_like(value)}%', escape='\\'))
+            elif column.filter == FILTER_CONTAINS:
+                query = query.filter(column.expr.ilike(f'%{escape_like(value)}%', escape='\\'))
+            elif column.filter == FILTER_RANGE:
+                lower, _, upper = value.partition('|')
+                # Un extremo que no es fecha ni número se ignora
+                lower = _parse_bound(lower) if lower else None
+                upper = _parse_bound(upper, end=True) if upper else None
+                if lower is not None:
+                    query = query.filter(column.expr >= lower)
+                if upper is not None:
+                    query = query.filter(column.expr <= upper)
+        return query
+
+    # ---------- Paginación por llave ----------
+
+    def _seek(self, query, order_expr, direction, cursor):
+        """Continúa después de la posición codificada en ``cursor``.
+
+        Los NULL van primero en orden ascendente y al final en descendente
+        (ver ``_ordered``), así que un cursor en NULL solo avanza por el id
+        dentro de los NULL y, en orden ascendente, sigue con todos los valores.
+        """
+        value, last_id = decode_cursor(cursor)
+        value = _coerce(order_expr, value)
+        after_id = self.id_column > last_id if direction == 'asc' else self.id_column < last_id
+        if order_expr is self.id_column:
+            return query.filter(after_id)
+        if value is None:
+            among_nulls = and_(order_expr.is_(None), after_id)
+            if direction == 'asc':
+                return query.filter(or_(among_nulls, order_expr.isnot(None)))
+            return query.filter(among_nulls)
+        if direction == 'asc':
+            return query.filter(or_(order_expr > value, and_(order_expr == value, after_id)))
+        return query.filter(or_(order_expr < value, and_(order_expr == value, after_id), order_expr.is_(None)))
+
+    def _ordered(self, query, order_expr, direction):
+        """Orden explícito de los NULL (el mismo que SQLite usa por defecto), del que depende ``_seek``."""
+        if direction == 'asc':
+            return query.order_by(order_expr.asc().nulls_first(), self.id_column.asc())
+        return query.order_by(order_expr.desc().nulls_last(), self.id_column.desc())
+
+    # ---------- Respuesta ----------
+
+    def response(self, args) -> dict:
+        """Ejecuta la consulta según ``args`` (request.args) y arma la respuesta."""
+        try:
+            draw = int(args.get('draw', 0))
+        except ValueError:
+            draw = 0
+
+        if self.records_total is not None:
+            records_total = self.records_total()
+        else:
+            records_total = self.query.order_by(None).count()
+
+        query = self._global_search(self.query, args.get('search[value]', ''))
+        query = self._column_filters(query, args)
+        filtered = query is not self.query
+        records_filtered = query.order_by(None).count() if filtered else records_total
+
+        order_expr, direction = self._order(args)
+        length = self._length(args)
+        cursor = args.get('after')
+        if cursor:
+            try:
+                query = self._seek(query, order_expr, direction, cursor)
+            except (TypeError, ValueError):
+                cursor = None
+
+        query = self._ordered(query, order_expr, direction)
+
+        if not cursor:
+            try:
+                start = max(int(args.get('start', 0)), 0)
+            except ValueError:
+                start = 0
+            query = query.offset(start)
+
+        rows = query.limit(length).all()
+
+        next_cursor = None
+        if len(rows) == length and getattr(order_expr, 'key', None):
+            last = rows[-1]
+            next_cursor = encode_cursor(_row_value(last, order_expr), _row_value(last, self.id_column))
+
+        return {
+            'draw': draw,
+            'recordsTotal': records_total,
+            'recordsFiltered': records_filtered,
+            'data': [self.serializer(row) for row in rows],
+            'next_cursor': next_cursor,
+        }
+
+
+def prefix_page(query, name_expr, id_column, prefix: str, cursor: Optional[str], limit: int):
+    """Página de ``query`` ordenada por nombre sin distinguir mayúsculas.
+
+    El prefijo se busca como rango (``>= prefijo`` y ``< prefijo + PREFIX_END``)
+    y no con ``LIKE``, que SQLite solo resuelve con el índice si la columna se
+    declaró ``NOCASE``. Con ``cursor`` la página empieza después de la última
+    fila entregada, comparando ``(nombre, id)`` como tupla. Devuelve
+    ``(filas, next_cursor)``.
+    """
+    key = name_expr.collate('NOCASE')
+    prefix = (prefix or '').strip()
+    position = None
+    if cursor:
+        try:
+            position = decode_cursor(cursor)
+        except (TypeError, ValueError):
+            position = None
+    if position is not None:
+        # El ">=" sobre el nombre solo le da a SQLite el inicio del rango en el índice
+        query = query.filter(key >= position[0], tuple_(key, id_column) > tuple_(position[0], position[1]))
+    elif prefix:
+        query = query.filter(key >= prefix)
+    if prefix:
+        query = query.filter(key < prefix + PREFIX_END)
+    rows = query.order_by(key, id_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(_row_value(rows[-1], name_expr), _row_value(rows[-1], id_column))
+    return rows, next_cursor
+
+
+def escape_like(value: str) -> str:
+    """Escapa ``%``, ``_`` y ``\\`` para que ``LIKE`` los trate como texto (con ``escape='\\'``)."""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def encode_cursor(value, row_id) -> str:
+    """Codifica la última posición entregada como un token opaco."""
+    if isinstance(value, (datetime, date)):
+        value = value.isoformat()
+    raw = json.dumps([value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str):
+    raw = base64.urlsafe_b64decode(cursor.encode('ascii'))
+    value, row_id = json.loads(raw.decode('utf-8'))
+    return value, int(row_id)
+
+
+def _row_value(row, expr):
+    key = getattr(expr, 'key', None)
+    return getattr(row, key, None) if key else None
+
+
+def _coerce(expr, value):
+    """Convierte el valor del cursor al tipo Python de la columna."""
+    try:
+        python_type = expr.type.python_type
+    except (AttributeError, NotImplementedError):
+        return value
+    if value is None:
+        return None
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+
+def _parse_bound(value, end=False):
+    """Interpreta los extremos de un filtro de rango (fechas ISO o números); ``None`` si no es ninguno."""
+    try:
+        parsed = datetime.fromisoformat(value)
+        if end and len(value) == 10:
+            parsed = parsed.replace(hour=23, minute=59, second=59, microsecond=999999)
+        return parsed
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return None
@@ -0,0 +1,186 @@
+"""
+Documentos de impresión de las órdenes de servicio.
+
+Recepción imprime la misma orden varias veces (copia del cliente, del taller,
+etiqueta), así que el HTML de impresión y el PDF se guardan en disco con una
+llave ``<id>-<updated_at>`` (del servicio, su cliente, equipo y técnico):
+cualquier cambio de esas filas actualiza ``updated_at`` y con él la llave,
+de modo que una versión vieja nunca se vuelve a servir. Los cambios que no pasan por el servicio (p. ej. una foto
+que termina de procesarse) llaman a ``invalidate``.
+
+Los archivos se escriben en un temporal y se renombran, así que varios
+procesos (web y workers) pueden generar la misma orden sin leer documentos a
+medio escribir.
+"""
+import glob
+import io
+import os
+import uuid
+from typing import Callable, Optional
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from xml.sax.saxutils import escape
+
+PURPLE = colors.HexColor('#7c3aed')
+FUCHSIA = colors.HexColor('#ec4899')
+
+
+# ========== CACHÉ EN DISCO ==========
+
+def _stamp(row) -> str:
+    stamp = (row.updated_at or row.created_at) if row is not None else None
+    return stamp.strftime("%Y%m%d%H%M%S%f") if stamp else '0'
+
+
+def cache_key(service) -> str:
+    """Llave de la versión actual de un servicio y de lo que la orden muestra de otras tablas.
+
+    La orden incluye el nombre y teléfono del cliente, el equipo registrado y
+    el técnico: su ``updated_at`` también entra en la llave, así renombrar un
+    cliente no deja órdenes viejas en la caché.
+    """
+    stamps = [_stamp(row) for row in (service, service.customer, service.equipment, service.technician)]
+    return f'{service.id}-{"-".join(stamps)}'
+
+
+def _path(folder: str, key: str, extension: str) -> str:
+    return os.path.join(folder, f'service-{key}.{extension}')
+
+
+def load(folder: str, key: str, extension: str) -> Optional[bytes]:
+    try:
+        with open(_path(folder, key, extension), 'rb') as cached:
+            return cached.read()
+    except FileNotFoundError:
+        return None
+
+
+def store(folder: str, key: str, extension: str, data: bytes) -> None:
+    """Guarda el documento y borra las versiones anteriores del mismo servicio."""
+    os.makedirs(folder, exist_ok=True)
+    path = _path(folder, key, extension)
+    temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(temp_path, 'wb') as target:
+        target.write(data)
+    os.replace(temp_path, path)
+    service_id = key.split('-', 1)[0]
+    for old in glob.glob(os.path.join(folder, f'service-{service_id}-*.{extension}')):
+        if old != path:
+            _remove(old)
+
+
+def invalidate(folder: str, service_id: int) -> None:
+    """Descarta todos los documentos guardados de un servicio."""
+    for old in glob.glob(os.path.join(folder, f'service-{int(service_id)}-*')):
+        _remove(old)
+
+
+def get_or_render(folder: str, key: str, extension: str, render: Callable[[], bytes]) -> bytes:
+    data = load(folder, key, extension)
+    if data is None:
+        data = render()
+        store(folder, key, extension, data)
+    return data
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# ========== PDF ==========
+
+def service_pdf(service, image_path: Callable[[object], Optional[str]]) -> bytes:
+    """Orden de servicio en PDF con el mismo contenido que ``services/print.html``.
+
+    ``image_path(evidence)`` devuelve la ruta en disco de la variante de
+    impresión de una evidencia (o ``None`` si no existe).
+    """
+    styles = getSampleStyleSheet()
+    title = ParagraphStyle('Titulo', parent=styles['Title'], textColor=PURPLE, spaceAfter=2)
+    subtitle = ParagraphStyle('Subtitulo', parent=styles['Normal'], textColor=FUCHSIA, alignment=1)
+    section = ParagraphStyle('Seccion', parent=styles['Heading4'], textColor=colors.white,
+                             backColor=PURPLE, borderPadding=(4, 6, 4, 6), spaceBefore=12, spaceAfter=8)
+    body = styles['Normal']
+
+    def text_box(value):
+        return Paragraph(escape(value or '').replace('\n', '<br/>'), body)
+
+    def info_table(rows):
+        table = Table([[Paragraph(f'<b>{label}</b>', body), value] for label, value in rows],
+                      colWidths=[5 * cm, None])
+        table.setStyle(TableStyle([
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#dddddd')),
+            ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#f8f9fa')),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]))
+        return table
+
+    def money(value, missing):
+        return f'${value:,.2f}' if value else missing
+
+    story = [
+        Paragraph('SOUNDLAB', title),
+        Paragraph('La Casa del DJ', subtitle),
+        Spacer(1, 8),
+        Paragraph(f'<b>ORDEN DE SERVICIO #{service.id}</b>', styles['Heading2']),
+        Paragraph('INFORMACIÓN GENERAL', section),
+        info_table([
+            ('Fecha de Recepción:', service.created_at.strftime('%d/%m/%Y %H:%M') if service.created_at else ''),
+            ('Estado:', service.status or ''),
+            ('Tipo de Servicio:', (service.service_type or '').title()),
+            ('Cliente:', service.customer.name if service.customer else f'#{service.customer_id}'),
+            ('Equipo:', service.equipment_label or 'No especificado'),
+            ('Técnico Asignado:', service.technician.username if service.technician else 'No asignado'),
+        ]),
+        Paragraph('DESCRIPCIÓN DEL PROBLEMA', section),
+        text_box(service.description),
+    ]
+    if service.diagnosis:
+        story += [Paragraph('DIAGNÓSTICO TÉCNICO', section), text_box(service.diagnosis)]
+    if service.work_performed:
+        story += [Paragraph('TRABAJO REALIZADO', section), text_box(service.work_performed)]
+    story += [
+        Paragraph('COSTOS', section),
+        info_table([
+            ('Costo Estimado:', money(service.estimated_cost, 'Por definir')),
+            ('Costo Final:', money(service.final_cost, 'Pendiente')),
+        ]),
+    ]
+
+    photos = []
+    for evidence in service.evidences:
+        path = image_path(evidence)
+        if path and os.path.exists(path):
+            photo = Image(path)
+            scale = min(5.5 * cm / photo.imageWidth, 5.5 * cm / photo.imageHeight)
+            photo.drawWidth, photo.drawHeight = photo.imageWidth * scale, photo.imageHeight * scale
+            photos.append(photo)
+    if photos:
+        rows = [photos[i:i + 3] for i in range(0, len(photos), 3)]
+        rows[-1] += [''] * (3 - len(rows[-1]))
+        story += [Paragraph('EVIDENCIAS FOTOGRÁFICAS', section), Table(rows, colWidths=[6 * cm] * 3)]
+
+    signatures = Table([['Firma del Cliente', 'Firma del Técnico']], colWidths=[8 * cm, 8 * cm])
+    signatures.setStyle(TableStyle([
+        ('LINEABOVE', (0, 0), (0, 0), 0.8, colors.black),
+        ('LINEABOVE', (1, 0), (1, 0), 0.8, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 20),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 20),
+    ]))
+    story += [Spacer(1, 2 * cm), signatures, Spacer(1, 1 * cm),
+              Paragraph('<b>Soundlab - La Casa del DJ</b>', subtitle),
+              Paragraph('Servicio técnico especializado en equipos de DJ y espectáculos', subtitle)]
+
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=letter, title=f'Orden de Servicio #{service.id}',
+                      leftMargin=1.5 * cm, rightMargin=1.5 * cm,
+                      topMargin=1.5 * cm, bottomMargin=1.5 * cm).build(story)
+    return buffer.getvalue()
@@ -0,0 +1,80 @@
+"""
+Entrega de archivos subidos con caché del navegador y descarga por el proxy.
+
+Los objetos de ``objects/`` se nombran con el hash de su contenido y nunca se
+reescriben, así que se sirven con un ETag fuerte derivado del nombre y
+``Cache-Control: public, max-age=<1 año>, immutable``: el navegador no vuelve a
+pedirlos. Todas las respuestas admiten ``If-None-Match``/``If-Modified-Since``
+(304) y peticiones ``Range`` (206).
+
+Con un proxy al frente, el cuerpo lo puede enviar el propio proxy:
+
+* ``x-sendfile`` (Apache ``mod_xsendfile``, lighttpd): cabecera ``X-Sendfile``
+  con la ruta absoluta del archivo.
+* ``x-accel`` (nginx): cabecera ``X-Accel-Redirect`` con ``accel_prefix`` +
+  nombre, que debe apuntar a un ``location internal`` con ``alias`` a la
+  carpeta de subidas.
+"""
+import mimetypes
+import os
+
+from flask import Response, abort, request
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+SENDFILE_MODES = (None, 'x-sendfile', 'x-accel')
+
+
+def strong_etag(filename: str) -> str:
+    """ETag de un objeto direccionado por contenido: su nombre sin carpeta ni extensión.
+
+    El nombre ya contiene el SHA-256 (y la variante), por lo que identifica el
+    contenido sin tener que leer el archivo.
+    """
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def send_upload(directory: str, filename: str, immutable_prefix: str = 'objects/',
+                mutable_max_age: int = 3600, sendfile_mode: str = None,
+                accel_prefix: str = '/_uploads/') -> Response:
+    """Responde con ``directory/filename`` aplicando la política de caché."""
+    if sendfile_mode not in SENDFILE_MODES:
+        raise ValueError(f'Modo de envío desconocido: {sendfile_mode}')
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    immutable = filename.startswith(immutable_prefix)
+    etag = strong_etag(filename) if immutable else True
+    max_age = IMMUTABLE_MAX_AGE if immutable else mutable_max_age
+
+    if sendfile_mode == 'x-accel':
+        response = _accel_response(path, filename, accel_prefix, etag, max_age)
+    else:
+        response = send_file(
+            path, request.environ,
+            etag=etag, max_age=max_age, conditional=True,
+            use_x_sendfile=sendfile_mode == 'x-sendfile',
+        )
+        response.accept_ranges = 'bytes'
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
+
+def _accel_response(path, filename, accel_prefix, etag, max_age):
+    """Respuesta vacía con ``X-Accel-Redirect``; nginx envía el cuerpo y atiende ``Range``."""
+    stat = os.stat(path)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = Response(mimetype=mimetype)
+    response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + filename
+    response.last_modified = stat.st_mtime
+    response.set_etag(etag if isinstance(etag, str) else f'{stat.st_mtime}-{stat.st_size}')
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    # Resolver aquí los 304 para no ocupar al proxy; los rangos los atiende nginx
+    response = response.make_conditional(request.environ)
+    if response.status_code == 304:
+        response.headers.pop('X-Accel-Redirect', None)
+    return response
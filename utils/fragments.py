@@ -0,0 +1,312 @@
+"""
+Caché de fragmentos HTML de las listas grandes (clientes, inventario, servicios).
+
+Cada tabla tiene un número de versión en ``fragment_versions`` que sube en la
+misma transacción que cualquier escritura sobre ella: los flush del ORM lo
+hacen solos (``register_hooks``) y las escrituras directas (UPDATE de stock,
+importación masiva) llaman a ``bump``. Como la versión se lee en la misma
+transacción que los datos, un fragmento guardado bajo esa versión siempre
+corresponde a lo que había en la base.
+
+Hay dos niveles de llave:
+
+* el cuerpo completo de una tabla, ``<tabla>/rows:<versiones>``: si nada
+  cambió se sirve tal cual, con una sola consulta a la base;
+* cada fila, ``<tabla>/row:<id>:<updated_at>``: cuando la versión cambió solo
+  se cargan y renderizan las filas cuyo ``updated_at`` no está en caché.
+
+Los backends son intercambiables: ``MemoryBackend`` (LRU en el proceso) y
+``FileBackend`` (un directorio compartido entre los workers). Ambos tienen un
+tope en bytes y descartan primero lo menos usado.
+"""
+import hashlib
+import os
+import random
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, text
+
+VERSIONS_TABLE = 'fragment_versions'
+EPOCH = '_epoch'
+LOAD_CHUNK = 500  # filas cargadas por consulta (IN) al reconstruir
+
+_ensured_engines = set()
+
+
+# ========== BACKENDS ==========
+
+class MemoryBackend:
+    """LRU en memoria del proceso, acotado por el tamaño total de los fragmentos."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: 'OrderedDict[str, Tuple[str, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key: str, value: str) -> None:
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class FileBackend:
+    """Un archivo por fragmento en ``folder``; al pasar el tope se borran los de mtime más antiguo.
+
+    Leer un fragmento actualiza su mtime, así el recorte se comporta como un
+    LRU aproximado. Las escrituras usan un temporal y ``os.replace`` para que
+    ningún worker lea un fragmento a medio escribir.
+    """
+
+    def __init__(self, folder: str, max_bytes: int):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.size: Optional[int] = None  # se calcula en la primera escritura
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.folder, digest[:2], f'{digest}.html')
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as cached:
+                value = cached.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        data = value.encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(temp_path, 'wb') as target:
+            target.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            if self.size is None:
+                self.size = sum(size for _, _, size in self._files())
+            else:
+                self.size += len(data)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _files(self) -> List[Tuple[float, str, int]]:
+        files = []
+        for directory, _, names in os.walk(self.folder):
+            for name in names:
+                if not name.endswith('.html'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((info.st_mtime, path, info.st_size))
+        return files
+
+    def _evict(self) -> None:
+        # Recortar hasta el 90% para no recorrer el directorio en cada escritura
+        files = sorted(self._files())
+        self.size = sum(size for _, _, size in files)
+        target = self.max_bytes * 0.9
+        for _, path, size in files:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            for _, path, _ in self._files():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.size = 0
+
+
+def create_backend(kind: Optional[str], max_bytes: int, folder: str):
+    """Backend según la configuración: ``'memory'``, ``'file'`` o ``None`` (sin caché)."""
+    if not kind:
+        return None
+    if kind == 'memory':
+        return MemoryBackend(max_bytes)
+    if kind == 'file':
+        return FileBackend(folder, max_bytes)
+    raise ValueError(f'Backend de fragmentos desconocido: {kind}')
+
+
+# ========== VERSIONES POR TABLA ==========
+
+def ensure_table(connection) -> None:
+    """Crea la tabla de versiones si no existe."""
+    engine_key = id(connection.engine)
+    if engine_key in _ensured_engines:
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': VERSIONS_TABLE}
+    ).first()
+    if not exists:
+        connection.execute(text(
+            f"CREATE TABLE {VERSIONS_TABLE} ("
+            "name VARCHAR(100) NOT NULL PRIMARY KEY, "
+            "version INTEGER NOT NULL DEFAULT 0)"
+        ))
+        connection.execute(text(f"INSERT INTO {VERSIONS_TABLE}(name, version) VALUES (:name, :epoch)"),
+                           {'name': EPOCH, 'epoch': random.randrange(1, 2 ** 31)})
+    else:
+        # Solo se recuerda cuando ya existía: si la transacción que la creó
+        # se revierte, la siguiente llamada la vuelve a crear
+        _ensured_engines.add(engine_key)
+
+
+def bump(connection, tables: Iterable[str]) -> None:
+    """Sube la versión de ``tables`` en la transacción de ``connection``.
+
+    Las escrituras que no pasan por el ORM deben llamar a esta función para
+    que las listas en caché se reconstruyan.
+    """
+    # Una sola vez por tabla y transacción: basta con que la versión cambie
+    transaction = connection.get_transaction()
+    bumped = connection.info.get('fragments_bumped')
+    if bumped is None or bumped[0] is not transaction:
+        bumped = connection.info['fragments_bumped'] = (transaction, set())
+    tables = sorted(set(tables) - bumped[1])
+    if not tables:
+        return
+    bumped[1].update(tables)
+    ensure_table(connection)
+    connection.execute(
+        text(f"INSERT INTO {VERSIONS_TABLE}(name, version) VALUES (:name, 1) "
+             "ON CONFLICT(name) DO UPDATE SET version = version + 1"),
+        [{'name': name} for name in tables]
+    )
+
+
+def version_tag(connection, tables: Sequence[str] = ()) -> str:
+    """Parte de llave con la época de la base y la versión actual de ``tables``.
+
+    La época es un número al azar que se elige al crear la tabla de versiones:
+    si la base se reemplaza (restauración, datos de prueba) las versiones
+    vuelven a empezar, pero los fragmentos viejos en disco no coinciden.
+    """
+    ensure_table(connection)
+    names = [EPOCH] + list(tables)
+    params = {f'name{index}': name for index, name in enumerate(names)}
+    found = dict(connection.execute(
+        text(f"SELECT name, version FROM {VERSIONS_TABLE} "
+             f"WHERE name IN ({', '.join(':' + key for key in params)})"),
+        params
+    ).all())
+    return '.'.join(str(found.get(name, 0)) for name in names)
+
+
+def register_hooks(session, models: Iterable[type]) -> None:
+    """Sube la versión de la tabla de cada modelo escrito en un flush de ``session``."""
+    tables = {model: model.__tablename__ for model in models}
+
+    @event.listens_for(session, 'after_flush')
+    def bump_fragment_versions(session, flush_context):
+        touched = set()
+        for obj in session.new:
+            if type(obj) in tables:
+                touched.add(tables[type(obj)])
+        for obj in session.deleted:
+            if type(obj) in tables:
+                touched.add(tables[type(obj)])
+        for obj in session.dirty:
+            if type(obj) in tables and session.is_modified(obj):
+                touched.add(tables[type(obj)])
+        if touched:
+            bump(session.connection(), touched)
+
+
+# ========== RENDER ==========
+
+def row_stamp(value) -> str:
+    """Parte de la llave de una fila que cambia con cada escritura (su ``updated_at``)."""
+    return value.strftime('%Y%m%d%H%M%S%f') if value is not None else '0'
+
+
+class FragmentCache:
+    """Fragmentos HTML sobre un backend; sin backend todo se renderiza siempre."""
+
+    def __init__(self, backend=None):
+        self.backend = backend
+
+    def get(self, key: str) -> Optional[str]:
+        return self.backend.get(key) if self.backend is not None else None
+
+    def set(self, key: str, value: str) -> None:
+        if self.backend is not None:
+            self.backend.set(key, value)
+
+    def get_or_render(self, key: str, render: Callable[[], str]) -> str:
+        value = self.get(key)
+        if value is None:
+            value = render()
+            self.set(key, value)
+        return value
+
+    def render_rows(self, table: str, stamps: Sequence[Tuple[int, object]],
+                    load: Callable[[List[int]], Dict[int, object]],
+                    render: Callable[[object], str], suffix: str = '') -> str:
+        """Concatena las filas ``stamps`` (``(id, updated_at)`` en orden de la lista).
+
+        Solo las filas sin fragmento en caché se cargan con ``load`` (en grupos
+        de ``LOAD_CHUNK`` ids) y se renderizan con ``render``. ``suffix`` se
+        agrega a la llave de cada fila cuando su HTML depende de otras tablas.
+        """
+        keys = [f'{table}/row:{row_id}:{row_stamp(stamp)}{suffix}' for row_id, stamp in stamps]
+        parts = [self.get(key) for key in keys]
+        missing = [index for index, part in enumerate(parts) if part is None]
+        for start in range(0, len(missing), LOAD_CHUNK):
+            chunk = missing[start:start + LOAD_CHUNK]
+            objects = load([stamps[index][0] for index in chunk])
+            for index in chunk:
+                obj = objects.get(stamps[index][0])
+                if obj is None:
+                    parts[index] = ''
+                    continue
+                parts[index] = render(obj)
+                self.set(keys[index], parts[index])
+        return ''.join(parts)
+
+    def clear(self) -> None:
+        if self.backend is not None:
+            self.backend.clear()
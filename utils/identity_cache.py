@@ -0,0 +1,141 @@
+"""
+Caché por proceso de objetos que casi no cambian (p. ej. el usuario de la sesión).
+
+``IdentityCache`` es un LRU con vencimiento: cada entrada vive ``ttl``
+segundos y, si se llena, sale la usada hace más tiempo. Las llaves son
+``(espacio, id)``; con ``(espacio, None)`` se vacía un espacio completo.
+
+Los objetos del ORM no se guardan tal cual (están atados a la sesión de
+una petición): ``snapshot`` guarda los valores de sus columnas y ``restore``
+arma con ellos una instancia nueva en la sesión actual, sin consultar la
+base. Así la petición puede modificarla y confirmarla como siempre.
+
+``register_hooks`` invalida las entradas de los objetos que cambian en un
+flush, cuando la transacción se confirma. Otros procesos no se enteran: para
+ellos el límite es el ``ttl``.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from utils import metrics
+
+MISSING = object()
+
+Key = Tuple[str, Hashable]
+
+
+class IdentityCache:
+    """LRU con vencimiento, seguro entre hilos; cuenta aciertos y fallos en ``metrics``."""
+
+    def __init__(self, max_entries: int = 2000, ttl: float = 60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Key, Tuple[float, object]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Key):
+        """El valor guardado o ``MISSING``."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+                metrics.record_cache(key[0], 'expired')
+            if entry is None:
+                metrics.record_cache(key[0], 'miss')
+                return MISSING
+            self._entries.move_to_end(key)
+        metrics.record_cache(key[0], 'hit')
+        return entry[1]
+
+    def set(self, key: Key, value) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                metrics.record_cache(evicted[0], 'evicted')
+
+    def get_or_load(self, key: Key, load: Callable[[], object]):
+        """``load()`` solo si no hay entrada vigente; ``None`` no se guarda."""
+        value = self.get(key)
+        if value is MISSING:
+            value = load()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, keys: Iterable[Key]) -> None:
+        """Borra ``keys``; una llave ``(espacio, None)`` borra todo el espacio."""
+        with self._lock:
+            for key in keys:
+                if key[1] is None:
+                    doomed = [existing for existing in self._entries if existing[0] == key[0]]
+                else:
+                    doomed = [key] if key in self._entries else []
+                for existing in doomed:
+                    del self._entries[existing]
+                    metrics.record_cache(existing[0], 'invalidated')
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# ========== OBJETOS DEL ORM ==========
+
+def snapshot(obj) -> Dict[str, object]:
+    """Valores de las columnas de ``obj`` (inmutables para guardar en la caché)."""
+    return {attribute.key: getattr(obj, attribute.key) for attribute in inspect(obj).mapper.column_attrs}
+
+
+def restore(session, model, values: Dict[str, object]):
+    """Instancia persistente de ``model`` en ``session`` con ``values``, sin consultar la base."""
+    identity_key = inspect(model).identity_key_from_primary_key(
+        [values[column.key] for column in inspect(model).primary_key])
+    existing = session.identity_map.get(identity_key)
+    if existing is not None:
+        return existing
+    obj = inspect(model).class_manager.new_instance()  # sin pasar por __init__
+    for key, value in values.items():
+        setattr(obj, key, value)
+    make_transient_to_detached(obj)
+    session.add(obj)
+    return obj
+
+
+def register_hooks(session, cache_getter: Callable[[], Optional[IdentityCache]],
+                   keys_for: Dict[type, Callable[[object], Iterable[Key]]]) -> None:
+    """Invalida, al confirmar, las llaves de los objetos creados, modificados o borrados.
+
+    ``cache_getter()`` devuelve la caché de la aplicación actual (o ``None``)
+    y ``keys_for`` asocia cada modelo con una función que devuelve las llaves
+    que dependen de un objeto (su propia entrada, las listas donde aparece...).
+    """
+
+    @event.listens_for(session, 'after_flush')
+    def collect_cache_keys(session, flush_context):
+        pending = session.info.setdefault('identity_cache_keys', set())
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            keys = keys_for.get(type(obj))
+            if keys is not None and (obj not in session.dirty or session.is_modified(obj)):
+                pending.update(keys(obj))
+
+    @event.listens_for(session, 'after_commit')
+    def invalidate_cache_keys(session):
+        keys = session.info.pop('identity_cache_keys', None)
+        cache = cache_getter() if keys else None
+        if cache is not None:
+            cache.invalidate(keys)
+
+    @event.listens_for(session, 'after_soft_rollback')
+    def discard_cache_keys(session, previous_transaction):
+        session.info.pop('identity_cache_keys', None)
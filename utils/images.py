@@ -0,0 +1,122 @@
+"""
+Procesamiento de fotos de evidencia con Pillow.
+
+Al subir una foto se decodifica una sola vez, se corrige su orientación según
+EXIF y se generan versiones reducidas (miniatura, mediana y de impresión).
+Ninguna versión conserva metadatos EXIF (ubicación GPS, modelo de cámara...),
+y el archivo original se reescribe sin ellos.
+
+Las páginas cargan la variante adecuada a su tamaño de presentación, de modo
+que una galería descarga kilobytes en lugar de la foto completa de la cámara.
+"""
+import os
+from dataclasses import dataclass
+from typing import Dict
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Fotos de más de ~50 megapíxeles se rechazan (protección contra "bombas" de descompresión)
+Image.MAX_IMAGE_PIXELS = 50_000_000
+
+
+@dataclass(frozen=True)
+class Variant:
+    """Versión reducida de una foto: lado mayor máximo, formato y calidad."""
+    name: str
+    max_size: int
+    format: str
+    quality: int
+
+    @property
+    def extension(self):
+        return 'jpg' if self.format == 'JPEG' else self.format.lower()
+
+
+VARIANTS = (
+    Variant('print', 1600, 'JPEG', 85),
+    Variant('medium', 1024, 'WEBP', 80),
+    Variant('thumb', 320, 'WEBP', 72),
+)
+
+_SAVE_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP', 'gif': 'GIF'}
+
+
+class InvalidImage(ValueError):
+    """El archivo subido no es una imagen que Pillow pueda procesar."""
+
+
+def _prepare(image: Image.Image, target_format: str) -> Image.Image:
+    """Convierte el modo de color a uno que admita ``target_format``."""
+    if target_format == 'JPEG':
+        if image.mode in ('RGBA', 'LA', 'P'):
+            rgba = image.convert('RGBA')
+            background = Image.new('RGB', rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            return background
+        return image.convert('RGB') if image.mode != 'RGB' else image
+    if image.mode not in ('RGB', 'RGBA'):
+        return image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+    return image
+
+
+def verify(path: str) -> None:
+    """Comprueba, sin decodificar los píxeles, que ``path`` es una imagen válida."""
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as error:
+        raise InvalidImage(str(error)) from error
+
+
+def process_upload(path: str, name_prefix: str = '') -> Dict[str, dict]:
+    """Limpia la foto en ``path`` y genera sus variantes en la misma carpeta.
+
+    Devuelve ``{variante: {'filename', 'width', 'height', 'bytes'}}``, con
+    ``filename`` precedido de ``name_prefix`` (la carpeta relativa a la raíz de
+    subidas). Lanza ``InvalidImage`` si el archivo no es una imagen válida.
+    """
+    folder, filename = os.path.split(path)
+    stem, extension = os.path.splitext(filename)
+    try:
+        with Image.open(path) as source:
+            source.seek(0)  # primer cuadro de los GIF animados
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as error:
+        raise InvalidImage(str(error)) from error
+
+    # Reescribir el original sin metadatos y con la orientación ya aplicada
+    original_format = _SAVE_FORMATS.get(extension.lstrip('.').lower(), 'JPEG')
+    _prepare(image, original_format).save(path, original_format, **_save_options(original_format, 92))
+
+    variants = {}
+    current = image
+    for variant in VARIANTS:  # de mayor a menor: cada una se reduce desde la anterior
+        current = current.copy()
+        current.thumbnail((variant.max_size, variant.max_size), Image.LANCZOS, reducing_gap=3.0)
+        variant_filename = f'{stem}_{variant.name}.{variant.extension}'
+        variant_path = os.path.join(folder, variant_filename)
+        _prepare(current, variant.format).save(variant_path, variant.format,
+                                               **_save_options(variant.format, variant.quality))
+        variants[variant.name] = {
+            'filename': name_prefix + variant_filename,
+            'width': current.width,
+            'height': current.height,
+            'bytes': os.path.getsize(variant_path),
+        }
+    return variants
+
+
+def _save_options(image_format: str, quality: int) -> dict:
+    if image_format == 'JPEG':
+        return {'quality': quality, 'optimize': True, 'progressive': True}
+    if image_format == 'WEBP':
+        return {'quality': quality, 'method': 4}
+    if image_format == 'PNG':
+        return {'optimize': True}
+    return {}
+
+
+def variant_filenames(variants: Dict[str, dict]):
+    """Nombres de archivo de todas las variantes registradas."""
+    return [info['filename'] for info in (variants or {}).values()]
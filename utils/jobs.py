@@ -0,0 +1,288 @@
+"""
+Cola de trabajos en segundo plano respaldada por SQLite.
+
+Las rutas encolan trabajo lento (procesar fotos, generar PDFs...) con
+``enqueue`` dentro de su propia transacción: el trabajo solo se vuelve visible
+para los workers cuando la petición confirma sus cambios, y desaparece si la
+petición se revierte.
+
+Los workers (``flask jobs-worker``, en un proceso aparte) reclaman trabajos con
+un único ``UPDATE ... RETURNING``, que SQLite ejecuta de forma atómica aunque
+haya varios procesos compitiendo. Un trabajo que falla se reintenta con espera
+exponencial hasta ``max_attempts``; uno que quedó en ``running`` más de
+``visibility_timeout`` segundos (worker caído) vuelve a la cola.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+JOBS_TABLE = 'jobs'
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+STATUSES = (QUEUED, RUNNING, DONE, FAILED)
+
+
+@dataclass(frozen=True)
+class Task:
+    name: str
+    fn: Callable
+    max_attempts: int = 3
+    backoff: float = 10.0  # segundos antes del primer reintento; se duplica en cada intento
+
+
+TASKS: Dict[str, Task] = {}
+
+
+class PermanentFailure(Exception):
+    """Error que no se resuelve reintentando (p. ej. el archivo no es una imagen)."""
+
+
+def task(name: str, max_attempts: int = 3, backoff: float = 10.0):
+    """Registra una función como trabajo con nombre ``name``.
+
+    La función recibe el contenido del trabajo como argumentos con nombre.
+    """
+    def decorator(fn):
+        TASKS[name] = Task(name, fn, max_attempts, backoff)
+        return fn
+    return decorator
+
+
+_ensured_engines = set()
+
+
+# ========== TABLA ==========
+
+def ensure_table(connection) -> None:
+    engine_key = id(connection.engine)
+    if engine_key in _ensured_engines:
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': JOBS_TABLE}
+    ).first()
+    if exists:
+        # Solo se recuerda cuando ya existía (ver counters.ensure_table)
+        _ensured_engines.add(engine_key)
+        return
+    connection.execute(text(
+        f"CREATE TABLE {JOBS_TABLE} ("
+        "id INTEGER NOT NULL PRIMARY KEY, "
+        "name VARCHAR(100) NOT NULL, "
+        "payload TEXT NOT NULL, "
+        f"status VARCHAR(20) NOT NULL DEFAULT '{QUEUED}', "
+        "attempts INTEGER NOT NULL DEFAULT 0, "
+        "max_attempts INTEGER NOT NULL DEFAULT 3, "
+        "run_at FLOAT NOT NULL, "
+        "locked_by VARCHAR(100), "
+        "locked_at FLOAT, "
+        "last_error TEXT, "
+        "created_at FLOAT NOT NULL, "
+        "finished_at FLOAT)"
+    ))
+    connection.execute(text(
+        f"CREATE INDEX ix_jobs_status_run_at ON {JOBS_TABLE} (status, run_at)"
+    ))
+
+
+# ========== ENCOLAR Y CONSULTAR ==========
+
+def enqueue(connection, name: str, payload: Optional[dict] = None, delay: float = 0) -> int:
+    """Encola ``name`` en la transacción de ``connection`` y devuelve el id del trabajo."""
+    if name not in TASKS:
+        raise KeyError(f'Trabajo no registrado: {name}')
+    ensure_table(connection)
+    now = time.time()
+    return connection.execute(
+        text(f"INSERT INTO {JOBS_TABLE} (name, payload, status, max_attempts, run_at, created_at) "
+             "VALUES (:name, :payload, :status, :max_attempts, :run_at, :now) RETURNING id"),
+        {'name': name, 'payload': json.dumps(payload or {}), 'status': QUEUED,
+         'max_attempts': TASKS[name].max_attempts, 'run_at': now + delay, 'now': now}
+    ).scalar()
+
+
+def get(connection, job_id: int) -> Optional[dict]:
+    ensure_table(connection)
+    row = connection.execute(text(f"SELECT * FROM {JOBS_TABLE} WHERE id = :id"), {'id': job_id}).mappings().first()
+    return dict(row) if row else None
+
+
+def status_counts(connection) -> Dict[str, int]:
+    ensure_table(connection)
+    counts = dict.fromkeys(STATUSES, 0)
+    counts.update(connection.execute(text(f"SELECT status, count(*) FROM {JOBS_TABLE} GROUP BY status")).all())
+    return counts
+
+
+def recent(connection, status: Optional[str] = None, limit: int = 50) -> list:
+    ensure_table(connection)
+    where = "WHERE status = :status" if status else ""
+    return [dict(row) for row in connection.execute(
+        text(f"SELECT * FROM {JOBS_TABLE} {where} ORDER BY id DESC LIMIT :limit"),
+        {'status': status, 'limit': limit}
+    ).mappings()]
+
+
+def retry(connection, job_id: int) -> bool:
+    """Vuelve a encolar un trabajo fallido con sus intentos en cero."""
+    ensure_table(connection)
+    return connection.execute(
+        text(f"UPDATE {JOBS_TABLE} SET status = :queued, attempts = 0, run_at = :now, last_error = NULL "
+             "WHERE id = :id AND status = :failed"),
+        {'queued': QUEUED, 'failed': FAILED, 'now': time.time(), 'id': job_id}
+    ).rowcount > 0
+
+
+def purge(connection, older_than: float) -> int:
+    """Borra los trabajos terminados hace más de ``older_than`` segundos."""
+    ensure_table(connection)
+    return connection.execute(
+        text(f"DELETE FROM {JOBS_TABLE} WHERE status = :done AND finished_at < :limit"),
+        {'done': DONE, 'limit': time.time() - older_than}
+    ).rowcount
+
+
+# ========== EJECUCIÓN ==========
+
+def claim(engine, worker_id: str, visibility_timeout: float = 300,
+          job_ids: Optional[Iterable[int]] = None) -> Optional[dict]:
+    """Toma el siguiente trabajo disponible (solo entre ``job_ids`` si se indican) y lo marca ``running``."""
+    now = time.time()
+    params = {'running': RUNNING, 'queued': QUEUED, 'worker': worker_id, 'now': now}
+    only = ''
+    if job_ids is not None:
+        job_ids = [int(job_id) for job_id in job_ids]
+        if not job_ids:
+            return None
+        params.update({f'job{index}': job_id for index, job_id in enumerate(job_ids)})
+        only = 'AND id IN (' + ', '.join(f':job{index}' for index in range(len(job_ids))) + ') '
+
+    with engine.begin() as connection:
+        ensure_table(connection)
+        # Recuperar trabajos de workers que murieron sin terminarlos
+        connection.execute(
+            text(f"UPDATE {JOBS_TABLE} SET status = :queued, locked_by = NULL "
+                 "WHERE status = :running AND locked_at < :expired"),
+            {'queued': QUEUED, 'running': RUNNING, 'expired': now - visibility_timeout}
+        )
+        row = connection.execute(
+            text(f"UPDATE {JOBS_TABLE} SET status = :running, locked_by = :worker, locked_at = :now, "
+                 "attempts = attempts + 1 "
+                 f"WHERE id = (SELECT id FROM {JOBS_TABLE} WHERE status = :queued AND run_at <= :now {only}"
+                 "ORDER BY run_at, id LIMIT 1) "
+                 "RETURNING id, name, payload, attempts, max_attempts"),
+            params
+        ).mappings().first()
+    return dict(row) if row else None
+
+
+def finish(engine, job: dict, error: Optional[BaseException] = None) -> str:
+    """Registra el resultado de un trabajo y devuelve su nuevo estado."""
+    now = time.time()
+    if error is None:
+        status, run_at, message = DONE, None, None
+    else:
+        message = ''.join(traceback.format_exception(type(error), error, error.__traceback__))[-4000:]
+        permanent = isinstance(error, PermanentFailure) or job['name'] not in TASKS
+        if permanent or job['attempts'] >= job['max_attempts']:
+            status, run_at = FAILED, None
+        else:
+            status = QUEUED
+            run_at = now + TASKS[job['name']].backoff * 2 ** (job['attempts'] - 1)
+    with engine.begin() as connection:
+        connection.execute(
+            text(f"UPDATE {JOBS_TABLE} SET status = :status, locked_by = NULL, last_error = :error, "
+                 "run_at = coalesce(:run_at, run_at), finished_at = :finished_at WHERE id = :id"),
+            {'status': status, 'error': message, 'run_at': run_at,
+             'finished_at': now if status in (DONE, FAILED) else None, 'id': job['id']}
+        )
+    return status
+
+
+def run_one(engine, runner: Callable[[str, dict], None], worker_id: str,
+            visibility_timeout: float = 300, job_ids: Optional[Iterable[int]] = None) -> bool:
+    """Ejecuta un trabajo si hay alguno disponible. Devuelve ``False`` si la cola está vacía.
+
+    ``runner(nombre, payload)`` ejecuta la tarea con el contexto que necesite
+    la aplicación (contexto de Flask, sesión de base de datos...). Con
+    ``job_ids`` solo se consideran esos trabajos.
+    """
+    job = claim(engine, worker_id, visibility_timeout, job_ids)
+    if job is None:
+        return False
+    try:
+        runner(job['name'], json.loads(job['payload']))
+    except Exception as error:
+        status = finish(engine, job, error)
+        logger.warning('Trabajo %s (%s) falló, intento %s/%s: %s -> %s', job['id'], job['name'],
+                       job['attempts'], job['max_attempts'], error, status)
+    else:
+        finish(engine, job)
+    return True
+
+
+def run_task(name: str, payload: dict) -> None:
+    """Llama a la función registrada (sin contexto adicional)."""
+    if name not in TASKS:
+        raise PermanentFailure(f'Trabajo no registrado: {name}')
+    TASKS[name].fn(**payload)
+
+
+class WorkerPool:
+    """Hilos que consumen la cola hasta que se llama ``stop()``."""
+
+    def __init__(self, engine, runner: Callable[[str, dict], None], threads: int = 2,
+                 poll_interval: float = 1.0, visibility_timeout: float = 300):
+        self.engine = engine
+        self.runner = runner
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self._stop = threading.Event()
+        self._threads = []
+        self.worker_prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+    def _loop(self, index):
+        worker_id = f'{self.worker_prefix}:{index}'
+        while not self._stop.is_set():
+            try:
+                worked = run_one(self.engine, self.runner, worker_id, self.visibility_timeout)
+            except Exception:
+                logger.exception('Error del worker %s', worker_id)
+                worked = False
+            if not worked:
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        for index in range(self.threads):
+            thread = threading.Thread(target=self._loop, args=(index,), name=f'jobs-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def wait(self):
+        """Bloquea hasta ``stop()`` (o Ctrl+C)."""
+        try:
+            while not self._stop.is_set():
+                self._stop.wait(1.0)
+        except KeyboardInterrupt:
+            pass
+        self.stop()
@@ -0,0 +1,242 @@
+"""
+Métricas de rendimiento por petición en formato de texto de Prometheus.
+
+Por cada petición se mide la latencia, cuántas sentencias SQL ejecutó y cuánto
+tiempo pasó en la base (eventos ``before/after_cursor_execute`` del motor), el
+tiempo de render de las plantillas y los bytes de fotos subidas. Todo queda en
+un registro en memoria del proceso que ``render`` expone como texto para
+Prometheus; con varios workers cada proceso publica sus propias series.
+
+``sql_count`` permite además fallar en pruebas las peticiones que superen un
+presupuesto de consultas (``QueryBudgetExceeded``), para detectar N+1.
+
+El registro de peticiones lentas es opcional: con ``slow_ms`` definido, las
+peticiones que lo superan se escriben en el logger ``soundlab.slow`` junto con
+las sentencias SQL que ejecutaron.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from flask import before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_logger = logging.getLogger('soundlab.slow')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+MAX_LOGGED_STATEMENTS = 50
+
+_current = ContextVar('soundlab_request_stats', default=None)
+
+
+# ========== REGISTRO ==========
+
+class Histogram:
+    """Histograma acumulado por combinación de etiquetas."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.series: Dict[tuple, list] = {}  # etiquetas -> [conteos por bucket..., +Inf, suma]
+
+    def observe(self, label_values: tuple, value: float) -> None:
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def lines(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label_values, series in sorted(self.series.items()):
+            labels = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.labels + ("le",), label_values + (bound,))} '
+                             f'{cumulative}')
+            lines.append(f'{self.name}_sum{labels} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Counter:
+    """Contador acumulado por combinación de etiquetas."""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.series: Dict[tuple, float] = {}
+
+    def inc(self, label_values: tuple = (), amount: float = 1) -> None:
+        self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def lines(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for label_values, value in sorted(self.series.items()):
+            lines.append(f'{self.name}{_labels(self.labels, label_values)} {value:g}')
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+_lock = threading.Lock()
+
+REQUESTS = Counter('soundlab_requests_total', 'Peticiones atendidas', ('endpoint', 'method', 'status'))
+REQUEST_SECONDS = Histogram('soundlab_request_duration_seconds', 'Latencia de las peticiones',
+                            ('endpoint', 'method'), LATENCY_BUCKETS)
+SQL_STATEMENTS = Histogram('soundlab_request_sql_statements', 'Sentencias SQL por petición',
+                           ('endpoint',), STATEMENT_BUCKETS)
+SQL_SECONDS = Histogram('soundlab_request_sql_seconds', 'Tiempo en SQL por petición',
+                        ('endpoint',), LATENCY_BUCKETS)
+TEMPLATE_SECONDS = Histogram('soundlab_template_render_seconds', 'Tiempo de render de plantillas',
+                             ('template',), LATENCY_BUCKETS)
+UPLOADS = Counter('soundlab_uploads_total', 'Fotos de evidencia recibidas')
+UPLOAD_BYTES = Counter('soundlab_upload_bytes_total', 'Bytes de fotos de evidencia recibidos')
+SLOW_REQUESTS = Counter('soundlab_slow_requests_total', 'Peticiones sobre el umbral del registro lento',
+                        ('endpoint',))
+CACHE_LOOKUPS = Counter('soundlab_identity_cache_total', 'Búsquedas en la caché de identidad por resultado',
+                        ('namespace', 'result'))
+
+METRICS = (REQUESTS, REQUEST_SECONDS, SQL_STATEMENTS, SQL_SECONDS, TEMPLATE_SECONDS,
+           UPLOADS, UPLOAD_BYTES, SLOW_REQUESTS, CACHE_LOOKUPS)
+
+
+def render() -> str:
+    """Todas las métricas en el formato de texto de Prometheus."""
+    with _lock:
+        lines = [line for metric in METRICS for line in metric.lines()]
+    return '\n'.join(lines) + '\n'
+
+
+def record_upload(size: int) -> None:
+    with _lock:
+        UPLOADS.inc()
+        UPLOAD_BYTES.inc(amount=size)
+
+
+def record_cache(namespace: str, result: str) -> None:
+    """``result``: ``hit``, ``miss``, ``expired``, ``evicted`` o ``invalidated``."""
+    with _lock:
+        CACHE_LOOKUPS.inc((namespace, result))
+
+
+# ========== PETICIONES ==========
+
+class RequestStats:
+    """Lo medido durante una petición; ``statements`` solo si hay registro lento."""
+
+    def __init__(self, capture_sql: bool):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.statements: Optional[List[Tuple[float, str]]] = [] if capture_sql else None
+        self.templates: List[float] = []
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """Una petición ejecutó más sentencias SQL que el presupuesto configurado."""
+
+
+def sql_count() -> int:
+    """Sentencias SQL ejecutadas hasta ahora en la petición en curso."""
+    stats = _current.get()
+    return stats.sql_count if stats is not None else 0
+
+
+def start_request(capture_sql: bool = False) -> None:
+    _current.set(RequestStats(capture_sql))
+
+
+def finish_request(endpoint: Optional[str], method: str, status: int, path: str = '',
+                   slow_ms: Optional[float] = None) -> Optional[float]:
+    """Registra la petición en curso y devuelve su duración en segundos."""
+    stats = _current.get()
+    if stats is None:
+        return None
+    _current.set(None)
+    elapsed = time.perf_counter() - stats.started
+    endpoint = endpoint or 'none'  # 404 y similares: una sola serie
+    with _lock:
+        REQUESTS.inc((endpoint, method, str(status)))
+        REQUEST_SECONDS.observe((endpoint, method), elapsed)
+        SQL_STATEMENTS.observe((endpoint,), stats.sql_count)
+        SQL_SECONDS.observe((endpoint,), stats.sql_seconds)
+        slow = slow_ms is not None and elapsed * 1000 >= slow_ms
+        if slow:
+            SLOW_REQUESTS.inc((endpoint,))
+    if slow:
+        _log_slow(stats, endpoint, method, path, status, elapsed)
+    return elapsed
+
+
+def _log_slow(stats, endpoint, method, path, status, elapsed):
+    lines = [f'{method} {path} ({endpoint}) -> {status} en {elapsed * 1000:.1f} ms, '
+             f'{stats.sql_count} sentencias SQL en {stats.sql_seconds * 1000:.1f} ms']
+    for seconds, statement in (stats.statements or [])[:MAX_LOGGED_STATEMENTS]:
+        lines.append(f'  [{seconds * 1000:.1f} ms] {" ".join(statement.split())}')
+    if stats.sql_count > MAX_LOGGED_STATEMENTS:
+        lines.append(f'  ... {stats.sql_count - MAX_LOGGED_STATEMENTS} sentencias más')
+    slow_logger.warning('\n'.join(lines))
+
+
+# ========== EVENTOS ==========
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # El inicio se guarda en el contexto de la ejecución: si la sentencia
+    # falla no queda nada pendiente en la conexión
+    if context is not None:
+        context.metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'metrics_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = _current.get()
+    if stats is None:
+        return
+    stats.sql_count += 1
+    stats.sql_seconds += elapsed
+    if stats.statements is not None:
+        stats.statements.append((elapsed, statement))
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _current.get()
+    if stats is not None:
+        stats.templates.append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    stats = _current.get()
+    if stats is None or not stats.templates:
+        return
+    elapsed = time.perf_counter() - stats.templates.pop()
+    with _lock:
+        TEMPLATE_SECONDS.observe((template.name or 'string',), elapsed)
+
+
+def register_hooks() -> None:
+    """Escucha las sentencias de todos los motores y el render de plantillas."""
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render)
+    template_rendered.connect(_rendered)
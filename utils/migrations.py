@@ -0,0 +1,211 @@
+"""
+Migraciones versionadas del esquema SQLite.
+
+Cada migración tiene un número de versión y se aplica una sola vez; las
+aplicadas quedan registradas en ``schema_migrations``. Antes de migrar una base
+existente se guarda una copia en ``instance/backups`` con la API de respaldo
+en línea de SQLite, y cada migración corre en su propia transacción, así un
+fallo deja la base como estaba.
+
+Las migraciones son idempotentes: comparan el esquema real con los modelos y
+solo crean lo que falta, por lo que sirven igual para una base nueva que para
+un ``instance/soundlab.db`` creado con versiones anteriores.
+"""
+import os
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List
+
+from sqlalchemy import MetaData, Table, inspect, text
+from sqlalchemy.schema import CreateTable
+
+from utils import analytics, changes, counters, fragments, jobs, search, valuation
+
+MIGRATIONS_TABLE = 'schema_migrations'
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    apply: Callable  # apply(connection, metadata)
+
+
+# ========== OPERACIONES DE ESQUEMA ==========
+
+def create_missing_tables(connection, metadata: MetaData) -> None:
+    """Crea las tablas (con sus índices) que aún no existen."""
+    metadata.create_all(connection, checkfirst=True)
+
+
+def create_missing_indexes(connection, metadata: MetaData) -> None:
+    """Crea los índices declarados en los modelos que no existan en la base."""
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def sync_table_columns(connection, table: Table) -> None:
+    """Alinea las columnas de una tabla existente con su modelo.
+
+    Las columnas nuevas se agregan con ``ALTER TABLE ADD COLUMN``. Si cambió la
+    nulabilidad de alguna columna (SQLite no permite alterarla) la tabla se
+    reconstruye copiando todas sus filas.
+    """
+    existing = {column['name']: column for column in inspect(connection).get_columns(table.name)}
+    if not existing:
+        return
+    nullability_changed = any(
+        column.name in existing
+        and not column.primary_key
+        and bool(existing[column.name]['nullable']) != bool(column.nullable)
+        for column in table.columns
+    )
+    if nullability_changed:
+        rebuild_table(connection, table, set(existing))
+        return
+    for column in table.columns:
+        if column.name not in existing:
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+
+def rebuild_table(connection, table: Table, existing_columns: set) -> None:
+    """Reconstruye ``table`` según el modelo conservando sus datos.
+
+    Sigue el procedimiento recomendado por SQLite: crear la tabla nueva, copiar
+    las filas, borrar la anterior y renombrar, todo en la misma transacción.
+    """
+    temp_name = f'_{table.name}_new'
+    create_sql = str(CreateTable(table).compile(dialect=connection.dialect))
+    connection.execute(text(create_sql.replace(f'CREATE TABLE {table.name} ', f'CREATE TABLE {temp_name} ', 1)))
+    columns = ', '.join(column.name for column in table.columns if column.name in existing_columns)
+    connection.execute(text(f'INSERT INTO {temp_name} ({columns}) SELECT {columns} FROM {table.name}'))
+    connection.execute(text(f'DROP TABLE {table.name}'))
+    connection.execute(text(f'ALTER TABLE {temp_name} RENAME TO {table.name}'))
+    for index in table.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def _sync_all_columns(connection, metadata):
+    for table in metadata.sorted_tables:
+        sync_table_columns(connection, table)
+
+
+def sync_schema(connection, metadata: MetaData) -> None:
+    """Tablas, columnas e índices nuevos de los modelos, en ese orden."""
+    create_missing_tables(connection, metadata)
+    _sync_all_columns(connection, metadata)
+    create_missing_indexes(connection, metadata)
+
+
+def _create_derived_tables(connection, metadata):
+    search.ensure_index(connection)
+    counters.ensure_table(connection)
+
+
+def _create_jobs_table(connection, metadata):
+    jobs.ensure_table(connection)
+
+
+def _create_valuation_table(connection, metadata):
+    valuation.ensure_table(connection)
+
+
+def _create_fragment_versions_table(connection, metadata):
+    fragments.ensure_table(connection)
+
+
+def _create_change_events_table(connection, metadata):
+    changes.ensure_table(connection)
+
+
+def _create_service_facts_table(connection, metadata):
+    analytics.ensure_table(connection)
+
+
+# ========== MIGRACIONES ==========
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'Esquema base', create_missing_tables),
+    Migration(2, 'Columnas de equipo manual en servicios y equipo opcional', _sync_all_columns),
+    Migration(3, 'Índices de búsquedas por cliente, técnico, estado y fecha', create_missing_indexes),
+    Migration(4, 'Índice de búsqueda FTS5 y contadores del dashboard', _create_derived_tables),
+    Migration(5, 'Variantes de imagen en evidencias', _sync_all_columns),
+    Migration(6, 'Almacenamiento de evidencias por contenido (stored_files)', sync_schema),
+    Migration(7, 'Cola de trabajos en segundo plano', _create_jobs_table),
+    Migration(8, 'Historial de movimientos de inventario', sync_schema),
+    Migration(9, 'Valoración diaria del inventario (inventory_daily)', _create_valuation_table),
+    Migration(10, 'Versiones por tabla de la caché de fragmentos', _create_fragment_versions_table),
+    Migration(11, 'Feed de cambios para pantallas en vivo (change_events)', _create_change_events_table),
+    Migration(12, 'Hechos de servicios cerrados para la analítica (service_facts)', _create_service_facts_table),
+    Migration(13, 'Índices por prefijo de nombre para los selectores de clientes y equipos', create_missing_indexes),
+]
+
+
+# ========== EJECUCIÓN ==========
+
+def _ensure_migrations_table(connection):
+    connection.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ('
+        'version INTEGER NOT NULL PRIMARY KEY, '
+        'description VARCHAR(200) NOT NULL, '
+        'applied_at DATETIME NOT NULL)'
+    ))
+
+
+def applied_versions(engine) -> set:
+    with engine.begin() as connection:
+        _ensure_migrations_table(connection)
+        return {row[0] for row in connection.execute(text(f'SELECT version FROM {MIGRATIONS_TABLE}'))}
+
+
+def pending(engine) -> List[Migration]:
+    done = applied_versions(engine)
+    return [migration for migration in MIGRATIONS if migration.version not in done]
+
+
+def backup_database(engine, backup_dir: str) -> str:
+    """Copia la base de datos con la API de respaldo en línea de SQLite."""
+    source_path = engine.url.database
+    os.makedirs(backup_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    target_path = os.path.join(backup_dir, f'{os.path.splitext(os.path.basename(source_path))[0]}_{stamp}.db')
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return target_path
+
+
+def upgrade(engine, metadata: MetaData, backup_dir: str = None) -> List[Migration]:
+    """Aplica las migraciones pendientes en orden y devuelve las aplicadas.
+
+    Si ``backup_dir`` está definido y la base ya tenía tablas, se respalda
+    antes de aplicar la primera migración pendiente.
+    """
+    to_apply = pending(engine)
+    if not to_apply:
+        return []
+    database = engine.url.database
+    has_tables = bool(set(inspect(engine).get_table_names()) - {MIGRATIONS_TABLE})
+    if backup_dir and database and database != ':memory:' and has_tables:
+        backup_database(engine, backup_dir)
+    if database and database != ':memory:' and engine.dialect.name == 'sqlite':
+        # WAL: los workers escriben en la cola sin bloquear las lecturas de la web
+        with engine.connect() as connection:
+            connection.exec_driver_sql('PRAGMA journal_mode=WAL')
+    for migration in to_apply:
+        with engine.begin() as connection:
+            migration.apply(connection, metadata)
+            connection.execute(
+                text(f'INSERT INTO {MIGRATIONS_TABLE} (version, description, applied_at) '
+                     'VALUES (:version, :description, :applied_at)'),
+                {'version': migration.version, 'description': migration.description,
+                 'applied_at': datetime.now()}
+            )
+    return to_apply
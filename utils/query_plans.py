@@ -0,0 +1,138 @@
+"""
+Verificación de planes de consulta con ``EXPLAIN QUERY PLAN``.
+
+Recorre las rutas GET de la aplicación con el cliente de pruebas de Flask,
+captura cada SELECT que emiten y pide a SQLite su plan. Un ``SCAN <tabla>``
+sin índice (o recorriendo un índice que solo sirve para ordenar) en una
+consulta filtrada (con ``WHERE``) es un recorrido completo de la tabla y se
+reporta como regresión. Los listados sin filtro (por ejemplo
+``Customer.query.all()``) recorren la tabla por naturaleza y no se reportan.
+Tampoco las búsquedas por clave primaria (``WHERE tabla.id IN (...)``, como
+las cargas ``selectin`` o por lotes de ids) en tablas pequeñas: ahí SQLite
+prefiere recorrer unas pocas páginas a buscar cada id, y el plan cambia
+solo cuando la tabla crece más allá de ``SMALL_TABLE_ROWS``.
+
+Se ejecuta con ``flask db-check-plans``, que termina con código 1 si algún
+plan no usa índice, de modo que puede correr en integración continua.
+"""
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional
+
+from sqlalchemy import event, inspect
+
+# Recorrido completo: sin índice o recorriendo un índice que no filtra (solo ordena)
+SCAN_PATTERN = re.compile(r'^SCAN (\w+)(?: USING INDEX \w+)?$')
+WHERE_PATTERN = re.compile(r'\bWHERE\b', re.IGNORECASE)
+# Búsqueda por clave primaria como único filtro: WHERE tabla.id IN (?, ?, ...)
+PK_IN_PATTERN = re.compile(r'\bWHERE\s+(\w+)\.id\s+IN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)\s*(?:ORDER BY\b.*)?$',
+                           re.IGNORECASE | re.DOTALL)
+# Tablas con hasta estas filas pueden recorrerse en búsquedas por clave primaria
+SMALL_TABLE_ROWS = 5000
+
+
+@dataclass(frozen=True)
+class PlanFinding:
+    """Consulta cuyo plan recorre una tabla completa."""
+    url: str
+    table: str
+    statement: str
+    plan: List[str]
+
+
+@contextmanager
+def capture_selects(engine):
+    """Acumula ``(sql, parámetros)`` de los SELECT ejecutados en ``engine``."""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def explain(connection, statement: str, parameters) -> List[str]:
+    """Líneas de detalle de ``EXPLAIN QUERY PLAN`` para una sentencia."""
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters or ())
+    return [row[3] for row in rows]
+
+
+def table_scans(plan: Iterable[str], tables: set) -> List[str]:
+    """Tablas reales que el plan recorre completas (sin índice)."""
+    scans = []
+    for detail in plan:
+        match = SCAN_PATTERN.match(detail.strip())
+        if match and match.group(1) in tables:
+            scans.append(match.group(1))
+    return scans
+
+
+def primary_key_lookup(statement: str) -> Optional[str]:
+    """Tabla de una consulta filtrada solo por ``tabla.id IN (...)``, o ``None``."""
+    match = PK_IN_PATTERN.search(statement)
+    return match.group(1) if match else None
+
+
+def route_urls(app, resolve_argument: Callable[[str, str], Optional[object]],
+               skip: Iterable[str] = ()) -> List[str]:
+    """URLs de todas las rutas GET, con los argumentos resueltos por ``resolve_argument``.
+
+    ``resolve_argument(endpoint, argumento)`` devuelve el valor a usar o
+    ``None`` para omitir la ruta (por ejemplo si la tabla está vacía).
+    """
+    skip = set(skip) | {'static'}
+    urls = []
+    with app.test_request_context():
+        from flask import url_for
+        for rule in app.url_map.iter_rules():
+            if rule.endpoint in skip or 'GET' not in rule.methods:
+                continue
+            values = {argument: resolve_argument(rule.endpoint, argument) for argument in rule.arguments}
+            if any(value is None for value in values.values()):
+                continue
+            urls.append(url_for(rule.endpoint, **values))
+    return urls
+
+
+def check_urls(app, engine, urls: Iterable[str], user_id: Optional[int] = None,
+               small_table_rows: int = SMALL_TABLE_ROWS):
+    """Visita ``urls`` (con sesión de ``user_id``) y revisa los planes de sus consultas.
+
+    Devuelve ``(hallazgos, errores)``: las consultas sin índice y las URLs que
+    respondieron con error 5xx (cuyas consultas pueden haber quedado sin revisar).
+    Los recorridos de búsquedas por clave primaria en tablas de hasta
+    ``small_table_rows`` filas se aceptan.
+    """
+    findings, errors = [], []
+    client = app.test_client()
+    tables = set(inspect(engine).get_table_names())
+    row_counts = {}
+    for url in urls:
+        if user_id is not None:
+            with client.session_transaction() as session:
+                session['_user_id'] = str(user_id)
+                session['_fresh'] = True
+        with capture_selects(engine) as captured:
+            response = client.get(url)
+        if response.status_code >= 500:
+            errors.append(url)
+        with engine.connect() as connection:
+            for statement, parameters in captured:
+                if not WHERE_PATTERN.search(statement):
+                    continue
+                plan = explain(connection, statement, parameters)
+                lookup_table = primary_key_lookup(statement)
+                for table in table_scans(plan, tables):
+                    if table == lookup_table:
+                        if table not in row_counts:
+                            row_counts[table] = connection.exec_driver_sql(f'SELECT COUNT(*) FROM "{table}"').scalar()
+                        if row_counts[table] <= small_table_rows:
+                            continue
+                    findings.append(PlanFinding(url, table, ' '.join(statement.split()), plan))
+    return findings, errors
@@ -0,0 +1,67 @@
+"""
+Copia de solo lectura de la base para los reportes pesados.
+
+``snapshot`` copia la base principal con la API de respaldo en línea de
+SQLite a un archivo temporal y lo pone en su lugar con ``os.replace``: las
+conexiones que ya estaban leyendo terminan sobre la copia anterior y las
+nuevas abren la nueva. La base principal está en WAL, así que la copia no
+bloquea a quien escribe; lo que se evita es que un reporte de minutos lea
+sobre la base de la web (y frene los checkpoints del WAL).
+
+La copia guarda en ``replica_info`` el momento en que se tomó, para que cada
+reporte muestre qué tan viejos son sus datos.
+"""
+import os
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import text
+
+INFO_TABLE = 'replica_info'
+
+
+def url(path: str) -> str:
+    """URL de SQLAlchemy que abre ``path`` en modo solo lectura."""
+    return f'sqlite:///file:{path}?mode=ro&uri=true'
+
+
+def snapshot(source_path: str, target_path: str) -> float:
+    """Copia ``source_path`` sobre ``target_path`` de forma atómica; devuelve la hora de la copia."""
+    os.makedirs(os.path.dirname(target_path) or '.', exist_ok=True)
+    temp_path = f'{target_path}.{uuid.uuid4().hex}.tmp'
+    source = sqlite3.connect(source_path, timeout=30)
+    target = sqlite3.connect(temp_path)
+    try:
+        started = time.time()
+        source.backup(target)  # todas las páginas en un paso: una sola instantánea consistente
+        # Sin WAL la copia se puede abrir en solo lectura sin crear archivos -wal/-shm
+        target.execute('PRAGMA journal_mode=DELETE')
+        target.execute(f'CREATE TABLE {INFO_TABLE} (taken_at FLOAT NOT NULL)')
+        target.execute(f'INSERT INTO {INFO_TABLE} (taken_at) VALUES (?)', (started,))
+        target.commit()
+    except BaseException:
+        target.close()
+        os.remove(temp_path)
+        raise
+    finally:
+        source.close()
+    target.close()
+    os.replace(temp_path, target_path)
+    return started
+
+
+def taken_at(connection) -> Optional[datetime]:
+    """Hora (UTC) de la copia que lee ``connection``."""
+    value = connection.execute(text(f'SELECT taken_at FROM {INFO_TABLE}')).scalar()
+    return datetime.fromtimestamp(value, timezone.utc) if value is not None else None
+
+
+def age(path: str) -> Optional[float]:
+    """Segundos desde la última copia en ``path``; ``None`` si aún no existe."""
+    try:
+        return time.time() - os.path.getmtime(path)
+    except FileNotFoundError:
+        return None
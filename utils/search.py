@@ -0,0 +1,234 @@
+"""
+Índice de búsqueda de texto completo sobre SQLite FTS5.
+
+Un único índice ``search_index`` contiene clientes, equipos, servicios e
+inventario. Cada documento se arma con SQL a partir de su fila (ver
+``ENTITIES``), de modo que la sincronización fila a fila desde los eventos de
+SQLAlchemy y la reconstrucción completa usan exactamente la misma definición.
+
+El ``rowid`` de cada documento codifica la entidad y el id de la fila
+(``id * 8 + código``), así que actualizar o borrar un documento es una
+búsqueda por llave primaria y no un recorrido del índice.
+"""
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import event, inspect, text
+
+INDEX_TABLE = 'search_index'
+ROWID_FACTOR = 8
+
+
+@dataclass(frozen=True)
+class SearchEntity:
+    """Definición SQL del documento indexado para una tabla."""
+    name: str
+    code: int
+    table: str
+    title: str
+    subtitle: str
+    body: str
+    fields: tuple  # atributos del modelo que, al cambiar, obligan a reindexar
+    scope: str = 'NULL'  # valor por el que se puede acotar (p. ej. customer_id)
+
+
+ENTITIES: Dict[str, SearchEntity] = {
+    'customer': SearchEntity(
+        name='customer', code=1, table='customers',
+        title="name",
+        subtitle="coalesce(phone, '') || ' ' || coalesce(email, '')",
+        body="''",
+        fields=('name', 'phone', 'email'),
+    ),
+    'equipment': SearchEntity(
+        name='equipment', code=2, table='equipment',
+        title="name",
+        subtitle="coalesce(brand, '') || ' ' || coalesce(model, '')",
+        body="coalesce(serial_number, '') || ' ' || coalesce(category, '')",
+        fields=('name', 'brand', 'model', 'serial_number', 'category', 'customer_id'),
+        scope="customer_id",
+    ),
+    'service': SearchEntity(
+        name='service', code=3, table='services',
+        title="'Orden #' || id || ' ' || coalesce(equipment_name, '')",
+        subtitle="coalesce(equipment_type, '') || ' ' || coalesce(equipment_brand, '') || ' ' || "
+                 "coalesce(equipment_model, '') || ' ' || coalesce(equipment_serial, '') || ' ' || "
+                 "coalesce(equipment_color, '')",
+        body="description || ' ' || coalesce(diagnosis, '') || ' ' || "
+             "coalesce(equipment_accessories, '') || ' ' || coalesce(equipment_condition, '')",
+        fields=('description', 'diagnosis', 'customer_id', 'equipment_type', 'equipment_name',
+                'equipment_brand', 'equipment_model', 'equipment_serial', 'equipment_color',
+                'equipment_accessories', 'equipment_condition'),
+        scope="customer_id",
+    ),
+    'inventory': SearchEntity(
+        name='inventory', code=4, table='inventory',
+        title="name",
+        subtitle="coalesce(brand, '') || ' ' || coalesce(model, '')",
+        body="category",
+        fields=('name', 'brand', 'model', 'category'),
+    ),
+}
+ENTITIES_BY_CODE = {entity.code: entity for entity in ENTITIES.values()}
+
+_ensured_engines = set()
+
+
+# ========== ESTRUCTURA DEL ÍNDICE ==========
+
+def ensure_index(connection) -> None:
+    """Crea el índice FTS5 si no existe y lo llena con los datos actuales.
+
+    Se ejecuta una sola vez por proceso y motor de base de datos.
+    """
+    engine_key = id(connection.engine)
+    if engine_key in _ensured_engines:
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': INDEX_TABLE}
+    ).first()
+    if not exists:
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE {INDEX_TABLE} USING fts5("
+            "scope UNINDEXED, title, subtitle, body, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        ))
+        # Coincidencias en el título pesan más que en el resto del documento
+        connection.execute(text(
+            f"INSERT INTO {INDEX_TABLE}({INDEX_TABLE}, rank) VALUES ('rank', 'bm25(0, 10.0, 4.0, 1.0)')"
+        ))
+        for entity in ENTITIES.values():
+            _index_rows(connection, entity)
+    else:
+        # Solo se recuerda cuando ya existía: si la transacción que lo creó
+        # se revierte, la siguiente llamada lo vuelve a crear
+        _ensured_engines.add(engine_key)
+
+
+def rebuild(connection) -> int:
+    """Reconstruye el índice completo. Devuelve el número de documentos."""
+    ensure_index(connection)
+    connection.execute(text(f"DELETE FROM {INDEX_TABLE}"))
+    for entity in ENTITIES.values():
+        _index_rows(connection, entity)
+    connection.execute(text(f"INSERT INTO {INDEX_TABLE}({INDEX_TABLE}) VALUES ('optimize')"))
+    return connection.execute(text(f"SELECT count(*) FROM {INDEX_TABLE}")).scalar()
+
+
+def _index_rows(connection, entity: SearchEntity, where: str = '1 = 1', params: Optional[dict] = None):
+    """Inserta en el índice los documentos de las filas que cumplen ``where``."""
+    connection.execute(text(
+        f"INSERT INTO {INDEX_TABLE}(rowid, scope, title, subtitle, body) "
+        f"SELECT id * {ROWID_FACTOR} + {entity.code}, {entity.scope}, "
+        f"{entity.title}, {entity.subtitle}, {entity.body} "
+        f"FROM {entity.table} WHERE {where}"
+    ), params or {})
+
+
+def index_row(connection, entity_name: str, row_id: int) -> None:
+    """(Re)indexa una fila."""
+    entity = ENTITIES[entity_name]
+    ensure_index(connection)
+    remove_row(connection, entity_name, row_id)
+    _index_rows(connection, entity, 'id = :id', {'id': row_id})
+
+
+def index_range(connection, entity_name: str, min_id: int) -> None:
+    """Indexa las filas con id mayor a ``min_id`` (cargas masivas)."""
+    entity = ENTITIES[entity_name]
+    ensure_index(connection)
+    connection.execute(
+        text(f"DELETE FROM {INDEX_TABLE} WHERE rowid > :min_rowid AND rowid % {ROWID_FACTOR} = {entity.code}"),
+        {'min_rowid': min_id * ROWID_FACTOR + entity.code}
+    )
+    _index_rows(connection, entity, 'id > :min_id', {'min_id': min_id})
+
+
+def remove_row(connection, entity_name: str, row_id: int) -> None:
+    """Elimina el documento de una fila."""
+    ensure_index(connection)
+    connection.execute(
+        text(f"DELETE FROM {INDEX_TABLE} WHERE rowid = :rowid"),
+        {'rowid': row_id * ROWID_FACTOR + ENTITIES[entity_name].code}
+    )
+
+
+# ========== SINCRONIZACIÓN CON SQLALCHEMY ==========
+
+def register_hooks(models: Dict[str, type]) -> None:
+    """Mantiene el índice al día con los eventos insert/update/delete de cada modelo.
+
+    ``models`` asocia el nombre de la entidad (clave de ``ENTITIES``) con su
+    clase de modelo.
+    """
+    for entity_name, model in models.items():
+        entity = ENTITIES[entity_name]
+
+        def after_insert(mapper, connection, target, entity_name=entity_name):
+            index_row(connection, entity_name, target.id)
+
+        def after_update(mapper, connection, target, entity=entity):
+            state = inspect(target)
+            if any(state.attrs[field].history.has_changes() for field in entity.fields):
+                index_row(connection, entity.name, target.id)
+
+        def after_delete(mapper, connection, target, entity_name=entity_name):
+            remove_row(connection, entity_name, target.id)
+
+        event.listen(model, 'after_insert', after_insert)
+        event.listen(model, 'after_update', after_update)
+        event.listen(model, 'after_delete', after_delete)
+
+
+# ========== CONSULTAS ==========
+
+def build_match(query: str) -> Optional[str]:
+    """Convierte el texto del usuario en una expresión MATCH de prefijos.
+
+    Cada palabra se busca como prefijo y todas deben aparecer:
+    ``pioneer ddj`` -> ``"pioneer"* "ddj"*``.
+    """
+    tokens = re.findall(r'\w+', query or '', flags=re.UNICODE)
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens[:8])
+
+
+def search(connection, query: str, entities: Optional[Iterable[str]] = None,
+           scope: Optional[int] = None, limit: int = 20) -> dict:
+    """Busca en el índice y devuelve los resultados ordenados por relevancia (bm25)."""
+    started = time.perf_counter()
+    match = build_match(query)
+    results: List[dict] = []
+    if match:
+        ensure_index(connection)
+        conditions = [f"{INDEX_TABLE} MATCH :match"]
+        params = {'match': match, 'limit': limit}
+        if entities:
+            codes = ', '.join(str(ENTITIES[name].code) for name in entities)
+            conditions.append(f"rowid % {ROWID_FACTOR} IN ({codes})")
+        if scope is not None:
+            conditions.append("scope = :scope")
+            params['scope'] = scope
+        rows = connection.execute(text(
+            f"SELECT rowid, scope, title, subtitle, rank FROM {INDEX_TABLE} "
+            f"WHERE {' AND '.join(conditions)} ORDER BY rank LIMIT :limit"
+        ), params)
+        for rowid, row_scope, title, subtitle, rank in rows:
+            entity = ENTITIES_BY_CODE[rowid % ROWID_FACTOR]
+            results.append({
+                'entity': entity.name,
+                'id': rowid // ROWID_FACTOR,
+                'scope': row_scope,
+                'title': title,
+                'subtitle': ' '.join(subtitle.split()),
+                'rank': rank,
+            })
+    return {
+        'query': query,
+        'results': results,
+        'took_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
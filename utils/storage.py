@@ -0,0 +1,167 @@
+"""
+Almacenamiento de evidencias direccionado por contenido.
+
+Las fotos se copian al disco en bloques mientras se calcula su SHA-256, sin
+cargar el archivo completo en memoria. El archivo definitivo se nombra con ese
+hash (``objects/ab/abcdef....jpg``), de modo que subir dos veces la misma foto
+guarda los bytes (y sus variantes) una sola vez. Mientras la foto espera su
+procesamiento en segundo plano vive en ``pending/<sha256>.<ext>``; los archivos
+de ``objects/`` nunca cambian una vez publicados.
+
+Cada objeto tiene una fila en ``stored_files`` con un contador de referencias
+que mantienen los eventos de ``ServiceEvidence``. Cuando una transacción que
+borró evidencias se confirma, los objetos que quedaron sin referencias se
+eliminan de la base y del disco.
+"""
+import hashlib
+import os
+import time
+import uuid
+from typing import Iterable, List, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import object_session
+
+CHUNK_SIZE = 64 * 1024
+OBJECTS_DIR = 'objects'
+PENDING_DIR = 'pending'
+
+_PENDING_GC = 'storage_gc'
+
+
+# ========== ARCHIVOS ==========
+
+def stream_to_temp(stream, folder: str) -> Tuple[str, str, int]:
+    """Copia ``stream`` a un archivo temporal de ``folder`` calculando su hash.
+
+    Devuelve ``(ruta temporal, sha256 hexadecimal, tamaño en bytes)``.
+    """
+    os.makedirs(folder, exist_ok=True)
+    temp_path = os.path.join(folder, f'.upload-{uuid.uuid4().hex}')
+    digest = hashlib.sha256()
+    size = 0
+    with open(temp_path, 'wb') as target:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            target.write(chunk)
+            size += len(chunk)
+    return temp_path, digest.hexdigest(), size
+
+
+def object_name(digest: str, extension: str) -> str:
+    """Ruta relativa (con ``/``) del objeto para un hash y una extensión."""
+    return f'{OBJECTS_DIR}/{digest[:2]}/{digest}.{extension}'
+
+
+def pending_name(digest: str, extension: str) -> str:
+    """Ruta relativa de una subida que aún no se ha procesado."""
+    return f'{PENDING_DIR}/{digest}.{extension}'
+
+
+def place_object(temp_path: str, root: str, name: str) -> str:
+    """Mueve el temporal a su ubicación definitiva y devuelve la ruta absoluta."""
+    path = os.path.join(root, *name.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(temp_path, path)
+    return path
+
+
+def delete_files(root: str, names: Iterable[str]) -> None:
+    """Borra archivos relativos a ``root`` ignorando los que ya no existen."""
+    for name in names:
+        try:
+            os.remove(os.path.join(root, *name.split('/')))
+        except FileNotFoundError:
+            pass
+
+
+def stray_files(root: str, known_digests: set, min_age: int = 3600) -> List[str]:
+    """Archivos de ``objects/`` y ``pending/`` cuyo hash no está registrado en la base.
+
+    Solo se consideran los modificados hace más de ``min_age`` segundos, para
+    no tocar subidas en curso (o temporales de subidas interrumpidas).
+    """
+    limit = time.time() - min_age
+    stray = []
+    for base in (OBJECTS_DIR, PENDING_DIR):
+        for folder, _, filenames in os.walk(os.path.join(root, base)):
+            for filename in filenames:
+                path = os.path.join(folder, filename)
+                digest = filename.split('.', 1)[0].split('_', 1)[0]
+                if digest not in known_digests and os.path.getmtime(path) < limit:
+                    stray.append(os.path.relpath(path, root).replace(os.sep, '/'))
+    for filename in os.listdir(root) if os.path.isdir(root) else ():
+        path = os.path.join(root, filename)
+        if filename.startswith('.upload-') and os.path.getmtime(path) < limit:
+            stray.append(filename)
+    return stray
+
+
+# ========== CONTADOR DE REFERENCIAS ==========
+
+def collect_orphans(connection, ids: Iterable[int] = None) -> List[tuple]:
+    """Elimina las filas de ``stored_files`` sin referencias.
+
+    Devuelve ``(filename, variants)`` de cada fila eliminada para borrar sus
+    archivos una vez confirmada la transacción.
+    """
+    sql = "DELETE FROM stored_files WHERE ref_count <= 0"
+    if ids is not None:
+        ids = sorted(set(ids))
+        if not ids:
+            return []
+        sql += f" AND id IN ({', '.join(str(int(i)) for i in ids)})"
+    return connection.execute(text(sql + " RETURNING filename, variants")).all()
+
+
+def recount(connection) -> None:
+    """Recalcula ``ref_count`` desde las evidencias (corrige desviaciones)."""
+    connection.execute(text(
+        "UPDATE stored_files SET ref_count = ("
+        "SELECT count(*) FROM service_evidences WHERE stored_file_id = stored_files.id)"
+    ))
+
+
+def register_hooks(session, evidence_model, root_getter, variant_names) -> None:
+    """Mantiene el contador de referencias y recoge los objetos huérfanos.
+
+    ``root_getter()`` devuelve la carpeta base de los objetos y
+    ``variant_names(variants_json)`` los archivos de variantes de un objeto.
+    """
+    def adjust(connection, stored_file_id, delta):
+        connection.execute(
+            text("UPDATE stored_files SET ref_count = ref_count + :delta WHERE id = :id"),
+            {'delta': delta, 'id': stored_file_id}
+        )
+
+    @event.listens_for(evidence_model, 'after_insert')
+    def evidence_inserted(mapper, connection, target):
+        if target.stored_file_id:
+            adjust(connection, target.stored_file_id, 1)
+
+    @event.listens_for(evidence_model, 'after_delete')
+    def evidence_deleted(mapper, connection, target):
+        if target.stored_file_id:
+            adjust(connection, target.stored_file_id, -1)
+            owner = object_session(target)
+            if owner is not None:
+                owner.info.setdefault(_PENDING_GC, set()).add(target.stored_file_id)
+
+    @event.listens_for(session, 'after_commit')
+    def collect_after_commit(session):
+        pending = session.info.pop(_PENDING_GC, None)
+        if not pending:
+            return
+        engine = session.get_bind()
+        with engine.begin() as connection:
+            orphans = collect_orphans(connection, pending)
+        root = root_getter()
+        for filename, variants in orphans:
+            delete_files(root, [filename, *variant_names(variants)])
+
+    @event.listens_for(session, 'after_rollback')
+    def forget_pending(session):
+        session.info.pop(_PENDING_GC, None)
@@ -0,0 +1,221 @@
+"""
+Valoración del inventario e historial de stock por día.
+
+La tabla ``inventory_daily`` guarda, para cada día en que hubo cambios, el
+stock y el valor (stock × precio) acumulados por dimensión: total, categoría,
+proveedor y ubicación. Cada fila es una foto del total a ese día, así que el
+valor a cualquier fecha es la última fila de cada llave con ``day <= fecha``:
+unas pocas lecturas por índice, sin recorrer el historial de movimientos.
+
+Las filas se actualizan con deltas en la misma transacción que el cambio:
+los flush del ORM (altas, bajas, cambios de stock, precio, categoría...) por
+``register_hooks``, y las escrituras directas (movimientos de stock,
+importaciones) llamando a ``apply``.
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, text
+
+from utils.counters import field_values, track_previous_values
+
+ROLLUP_TABLE = 'inventory_daily'
+DIMENSIONS = ('total', 'category', 'supplier', 'location')
+FIELDS = ('stock', 'price', 'category', 'supplier', 'location')
+
+Deltas = Dict[Tuple[str, str], List[float]]  # (dimensión, llave) -> [stock, valor]
+
+_ensured_engines = set()
+
+
+# ========== TABLA ==========
+
+def ensure_table(connection, day: Optional[date] = None) -> bool:
+    """Crea la tabla si no existe y la inicia con el inventario actual en ``day``.
+
+    Devuelve ``True`` si la tabla se acaba de crear (y por lo tanto ya refleja
+    todo lo escrito en la transacción actual).
+    """
+    engine_key = id(connection.engine)
+    if engine_key in _ensured_engines:
+        return False
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': ROLLUP_TABLE}
+    ).first()
+    if exists:
+        # Solo se recuerda cuando ya existía (ver counters.ensure_table)
+        _ensured_engines.add(engine_key)
+        return False
+    connection.execute(text(
+        f"CREATE TABLE {ROLLUP_TABLE} ("
+        "dimension VARCHAR(20) NOT NULL, "
+        "key VARCHAR(200) NOT NULL, "
+        "day DATE NOT NULL, "
+        "stock INTEGER NOT NULL DEFAULT 0, "
+        "value FLOAT NOT NULL DEFAULT 0, "
+        "PRIMARY KEY (dimension, key, day))"
+    ))
+    _write_snapshot(connection, day or date.today())
+    return True
+
+
+def _current_totals(connection) -> Deltas:
+    totals = defaultdict(lambda: [0, 0.0])
+    rows = connection.execute(text(
+        "SELECT coalesce(stock, 0), coalesce(price, 0), category, supplier, location FROM inventory"
+    ))
+    for stock, price, category, supplier, location in rows:
+        values = {'stock': stock, 'price': price, 'category': category,
+                  'supplier': supplier, 'location': location}
+        for key, (quantity, value) in contribution(values).items():
+            totals[key][0] += quantity
+            totals[key][1] += value
+    return totals
+
+
+def _write_snapshot(connection, day: date) -> None:
+    """Escribe en ``day`` los totales reales de cada llave (0 para las que ya no existen)."""
+    totals = _current_totals(connection)
+    for dimension in DIMENSIONS:
+        for key, _, _ in _as_of(connection, dimension, day):
+            totals.setdefault((dimension, key), [0, 0.0])
+    if totals:
+        connection.execute(
+            text(f"INSERT INTO {ROLLUP_TABLE}(dimension, key, day, stock, value) "
+                 "VALUES (:dimension, :key, :day, :stock, :value) "
+                 "ON CONFLICT(dimension, key, day) DO UPDATE SET "
+                 "stock = excluded.stock, value = excluded.value"),
+            [{'dimension': dimension, 'key': key, 'day': day.isoformat(), 'stock': stock, 'value': value}
+             for (dimension, key), (stock, value) in totals.items()]
+        )
+
+
+def reconcile(connection, day: date) -> None:
+    """Corrige la foto de ``day`` con los valores reales del inventario.
+
+    Los días anteriores no se tocan: el historial no se puede reconstruir.
+    """
+    ensure_table(connection, day)
+    _write_snapshot(connection, day)
+
+
+# ========== DELTAS ==========
+
+def contribution(values: dict) -> Dict[Tuple[str, str], Tuple[int, float]]:
+    """Aporte de un item a cada ``(dimensión, llave)``."""
+    stock = values['stock'] or 0
+    value = stock * (values['price'] or 0)
+    return {(dimension, '' if dimension == 'total' else (values[dimension] or '')): (stock, value)
+            for dimension in DIMENSIONS}
+
+
+def add(deltas: Deltas, values: dict, sign: int = 1) -> None:
+    for key, (stock, value) in contribution(values).items():
+        deltas[key][0] += sign * stock
+        deltas[key][1] += sign * value
+
+
+def new_deltas() -> Deltas:
+    return defaultdict(lambda: [0, 0.0])
+
+
+def apply(connection, day: date, deltas: Deltas) -> None:
+    """Suma ``deltas`` a la foto de ``day`` (creándola desde el día anterior si no existe)."""
+    changes = [
+        {'dimension': dimension, 'key': key, 'day': day.isoformat(), 'stock': stock, 'value': value}
+        for (dimension, key), (stock, value) in deltas.items()
+        if stock or abs(value) > 1e-9
+    ]
+    if not changes or ensure_table(connection, day):
+        return
+    connection.execute(text(
+        f"INSERT INTO {ROLLUP_TABLE}(dimension, key, day, stock, value) "
+        "SELECT :dimension, :key, :day, coalesce(previous.stock, 0) + :stock, coalesce(previous.value, 0) + :value "
+        "FROM (SELECT 1) LEFT JOIN ("
+        f"  SELECT stock, value FROM {ROLLUP_TABLE} "
+        "  WHERE dimension = :dimension AND key = :key AND day < :day ORDER BY day DESC LIMIT 1"
+        ") AS previous WHERE true "
+        "ON CONFLICT(dimension, key, day) DO UPDATE SET "
+        f"stock = {ROLLUP_TABLE}.stock + :stock, value = {ROLLUP_TABLE}.value + :value"
+    ), changes)
+
+
+# ========== CONSULTAS ==========
+
+def as_of(connection, dimension: str, day: date) -> List[Tuple[str, int, float]]:
+    """``(llave, stock, valor)`` de cada llave de ``dimension`` al cierre de ``day``.
+
+    Las llaves se recorren saltando por el índice (una búsqueda por llave) y
+    de cada una se lee solo su última foto anterior o igual a ``day``.
+    """
+    ensure_table(connection)
+    return _as_of(connection, dimension, day)
+
+
+def _as_of(connection, dimension, day):
+    return [tuple(row) for row in connection.execute(text(
+        "WITH RECURSIVE keys(key) AS ("
+        f"  SELECT min(key) FROM {ROLLUP_TABLE} WHERE dimension = :dimension "
+        "  UNION ALL "
+        f"  SELECT (SELECT min(key) FROM {ROLLUP_TABLE} WHERE dimension = :dimension AND key > keys.key) "
+        "  FROM keys WHERE keys.key IS NOT NULL"
+        "), latest(key, day) AS ("
+        f"  SELECT key, (SELECT max(day) FROM {ROLLUP_TABLE} "
+        "               WHERE dimension = :dimension AND key = keys.key AND day <= :day) "
+        "  FROM keys WHERE key IS NOT NULL"
+        ") "
+        f"SELECT r.key, r.stock, r.value FROM latest JOIN {ROLLUP_TABLE} r "
+        "ON r.dimension = :dimension AND r.key = latest.key AND r.day = latest.day "
+        "ORDER BY r.value DESC, r.key"
+    ), {'dimension': dimension, 'day': day.isoformat()})]
+
+
+def history(connection, start: date, end: date, dimension: str = 'total',
+            key: str = '') -> List[Tuple[date, int, float]]:
+    """``(día, stock, valor)`` de una llave para cada día entre ``start`` y ``end``.
+
+    Los días sin cambios repiten el valor del día anterior.
+    """
+    ensure_table(connection)
+    params = {'dimension': dimension, 'key': key, 'start': start.isoformat(), 'end': end.isoformat()}
+    opening = connection.execute(text(
+        f"SELECT stock, value FROM {ROLLUP_TABLE} WHERE dimension = :dimension AND key = :key "
+        "AND day < :start ORDER BY day DESC LIMIT 1"
+    ), params).first()
+    changes = {
+        row[0]: (row[1], row[2]) for row in connection.execute(text(
+            f"SELECT day, stock, value FROM {ROLLUP_TABLE} WHERE dimension = :dimension AND key = :key "
+            "AND day BETWEEN :start AND :end"
+        ), params)
+    }
+    current = tuple(opening) if opening else (0, 0.0)
+    series = []
+    for offset in range((end - start).days + 1):
+        day = date.fromordinal(start.toordinal() + offset)
+        current = changes.get(day.isoformat(), current)
+        series.append((day, current[0], current[1]))
+    return series
+
+
+# ========== SINCRONIZACIÓN CON SQLALCHEMY ==========
+
+def register_hooks(session, inventory_model, today) -> None:
+    """Aplica a la foto de ``today()`` los cambios de inventario de cada flush."""
+    track_previous_values(inventory_model, FIELDS)
+
+    @event.listens_for(session, 'after_flush')
+    def apply_valuation_deltas(session, flush_context):
+        deltas = new_deltas()
+        for obj in session.new:
+            if isinstance(obj, inventory_model):
+                add(deltas, field_values(obj, FIELDS))
+        for obj in session.deleted:
+            if isinstance(obj, inventory_model):
+                add(deltas, field_values(obj, FIELDS, committed=True), -1)
+        for obj in session.dirty:
+            if isinstance(obj, inventory_model) and session.is_modified(obj):
+                add(deltas, field_values(obj, FIELDS))
+                add(deltas, field_values(obj, FIELDS, committed=True), -1)
+        apply(session.connection(), today(), deltas)
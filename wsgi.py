@@ -0,0 +1,11 @@
+"""
+Punto de entrada WSGI para servidores de producción.
+
+    gunicorn -c gunicorn.conf.py          (Linux, con preload y workers pre-fork)
+    waitress-serve --port=5000 wsgi:app   (Windows)
+
+La base de datos se inicializa aparte con ``flask --app app init-db``.
+"""
+from app import create_app
+
+app = create_app()